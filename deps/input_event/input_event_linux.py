@@ -1,3 +1,4 @@
+import base64
 import json
 import os
 import select
@@ -10,8 +11,15 @@ TYPE_INFO = "INFO"
 TYPE_READY = "READY"
 TYPE_EVENT = "EVENT"
 TYPE_ERROR = "ERROR"
+TYPE_TABLES = "TABLES"
 EMPTY_CONTENT = {}
 
+# batched events are sent as plain lines "@B <device> <base64 raw events>"
+# to spare the json encoding/decoding of each event
+BATCH_PREFIX = "@B"
+# max number of events read by one syscall
+BATCH_EVENTS = 256
+
 
 def send_message(mtype, content):
     message = {"type": mtype, "content": content}
@@ -32,14 +40,29 @@ def ready_notify():
     send_message(TYPE_READY, EMPTY_CONTENT)
 
 
-def event_notify(dev, event):
-    send_message(TYPE_EVENT, {"device": dev, "event": event})
-
-
 def error_notify(error, dev=None):
     send_message(TYPE_ERROR, {"device": dev, "message": error})
 
 
+def tables_notify():
+    """Send the event layout and the name lookup tables once up front"""
+    byteorder = "<" if sys.byteorder == "little" else ">"
+    sec_fmt = "q" if struct.calcsize("l") == 8 else "i"
+    content = {
+        "format": byteorder + sec_fmt * 2 + "HHI",
+        "types": EV_TYPES,
+        "codes": EV_CODE_MAP,
+    }
+    send_message(TYPE_TABLES, content)
+
+
+def batch_notify(dev, data):
+    line = " ".join((BATCH_PREFIX, dev, base64.b64encode(data).decode("ascii")))
+    sys.stdout.write(line)
+    sys.stdout.write(os.linesep)
+    sys.stdout.flush()
+
+
 EV_PACK_FMT = "llHHI"
 EV_PACK_SIZE = struct.calcsize(EV_PACK_FMT)
 
@@ -805,19 +828,6 @@ if GRAPHICAL:
         Gtk.main()
 
 
-def format_event(raw_event):
-    tv_sec, tv_usec, ev_type, ev_code, ev_value = raw_event
-    event = {
-        "typeNum": ev_type,
-        "typeName": EV_TYPES.get(ev_type, "UNKNOWN"),
-        "codeNum": ev_code,
-        "codeName": EV_CODE_MAP.get(ev_type, {}).get(ev_code, "UNKNOWN"),
-        "value": ev_value,
-        "timestamp": (tv_sec * (10**6) + tv_usec),
-    }
-    return event
-
-
 def listen(devs):
     watch = list(devs.keys())
     while True:
@@ -825,14 +835,16 @@ def listen(devs):
         for fd in fds:
             dev = devs[fd][0]
             try:
-                data = os.read(fd, EV_PACK_SIZE)
-                raw_event = struct.unpack(EV_PACK_FMT, data)
+                # evdev returns as many whole events as fit in the buffer
+                data = os.read(fd, EV_PACK_SIZE * BATCH_EVENTS)
+                if not data or len(data) % EV_PACK_SIZE:
+                    raise IOError("unexpected read size %d" % len(data))
             except Exception as details:
                 msg = "failed to get event: %s" % str(details)
                 error_notify(msg, dev)
                 watch.remove(fd)
-            event = format_event(raw_event)
-            event_notify(dev, event)
+                continue
+            batch_notify(dev, data)
         if not watch:
             break
 
@@ -859,6 +871,7 @@ def main_loop():
     global READY
 
     sync_notify()
+    tables_notify()
     devs = setup()
     try:
         listen(devs)
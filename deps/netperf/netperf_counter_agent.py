@@ -0,0 +1,161 @@
+"""
+Guest agent to sample the network counters for netperf tests.
+
+All the counters are read in one pass every interval and printed as one
+json line, the first line carries the counter names and the base values,
+the following lines carry the deltas since the previous sample:
+
+    {"type": "BASE", "content": {"t": 1.0, "keys": [...], "values": [...]}}
+    {"type": "DELTA", "content": {"t": 2.0, "d": [...]}}
+
+A last sample is printed when the agent is terminated, so the sum of the
+deltas covers the whole sampling time.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import re
+import signal
+import socket
+import struct
+import sys
+import time
+
+TYPE_BASE = "BASE"
+TYPE_DELTA = "DELTA"
+TYPE_ERROR = "ERROR"
+
+SIOCGIFADDR = 0x8915
+STAT_KEYS = (
+    ("rx_pkts", "rx_packets"),
+    ("tx_pkts", "tx_packets"),
+    ("rx_byts", "rx_bytes"),
+    ("tx_byts", "tx_bytes"),
+)
+QUEUE_INTR_RE = re.compile(r"virtio\d+-(input|output)\.(\d+)$")
+VIRTIO_INTR_RE = re.compile(r"virtio\d+")
+
+
+def send_message(mtype, content):
+    message = {"type": mtype, "content": content}
+    sys.stdout.write(json.dumps(message, separators=(",", ":")))
+    sys.stdout.write(os.linesep)
+    sys.stdout.flush()
+
+
+def get_ifname(address):
+    """Get the name of the interface having the IPv4 address"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for ifname in sorted(os.listdir("/sys/class/net")):
+            try:
+                req = struct.pack("256s", ifname[:15].encode())
+                addr = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, req)[20:24]
+            except IOError:
+                continue
+            if socket.inet_ntoa(addr) == address:
+                return ifname
+    finally:
+        sock.close()
+    return None
+
+
+def read_file(path):
+    with open(path) as f:
+        return f.read()
+
+
+def read_retrans():
+    """Get RetransSegs of Tcp in /proc/net/snmp"""
+    lines = [x.split() for x in read_file("/proc/net/snmp").splitlines()]
+    tcp = [x for x in lines if x and x[0] == "Tcp:"]
+    return int(tcp[1][tcp[0].index("RetransSegs")])
+
+
+def read_interrupts():
+    """
+    Get the interrupt counts of virtio queues summed over all CPUs
+
+    :return: list of (name, count), rx_intr_N/tx_intr_N for the queues,
+             or intr for all the virtio interrupts without queue names
+    """
+    lines = read_file("/proc/interrupts").splitlines()
+    ncpu = len(lines[0].split())
+    queues = []
+    total = 0
+    for line in lines[1:]:
+        fields = line.split()
+        if not fields or not VIRTIO_INTR_RE.search(line):
+            continue
+        count = sum(int(x) for x in fields[1 : ncpu + 1] if x.isdigit())
+        match = QUEUE_INTR_RE.search(fields[-1])
+        if match:
+            prefix = "rx" if match.group(1) == "input" else "tx"
+            queues.append(("%s_intr_%s" % (prefix, match.group(2)), count))
+        total += count
+    if queues:
+        return sorted(queues, key=lambda x: (x[0][:2], int(x[0].split("_")[-1])))
+    return [("intr", total)]
+
+
+def read_counters(ifname):
+    """Read all the counters in one pass"""
+    stat_dir = "/sys/class/net/%s/statistics" % ifname
+    counters = [
+        (key, int(read_file(os.path.join(stat_dir, name)))) for key, name in STAT_KEYS
+    ]
+    counters.append(("re_pkts", read_retrans()))
+    counters.extend(read_interrupts())
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-a", "--address", help="IPv4 address of the interface")
+    parser.add_argument("-n", "--ifname", help="name of the interface")
+    parser.add_argument(
+        "-i", "--interval", type=float, default=1.0, help="sampling interval"
+    )
+    parser.add_argument(
+        "-c", "--count", type=int, default=0, help="number of samples, 0 for ever"
+    )
+    args = parser.parse_args()
+
+    ifname = args.ifname or get_ifname(args.address)
+    if not ifname:
+        send_message(TYPE_ERROR, "No interface with address %s" % args.address)
+        return 1
+
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.append(signum))
+
+    counters = read_counters(ifname)
+    keys = [key for key, _ in counters]
+    prev = [value for _, value in counters]
+    send_message(TYPE_BASE, {"t": time.time(), "keys": keys, "values": prev})
+
+    samples = 0
+    next_time = time.time() + args.interval
+    while not stopped and not (args.count and samples >= args.count):
+        delay = next_time - time.time()
+        if delay > 0:
+            try:
+                time.sleep(delay)
+            except (IOError, OSError):
+                # interrupted by signal on python 2
+                pass
+        next_time += args.interval
+        values = dict(read_counters(ifname))
+        current = [values.get(key, 0) for key in keys]
+        deltas = [c - p for c, p in zip(current, prev)]
+        send_message(TYPE_DELTA, {"t": time.time(), "d": deltas})
+        prev = current
+        samples += 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Launch netperf instances behind a start barrier and stream their results.
+
+Usage: netperf_launcher.py N NETPERF_PATH [NETPERF_ARGS...]
+
+The N instances are forked first and blocked on a pipe, they exec netperf
+at the same time once all of them are forked. The outputs of instances are
+multiplexed into json lines on stdout:
+
+    {"type": "READY", "content": {"n": N, "t": ...}}       barrier released
+    {"type": "UP", "content": {"t": ...}}                  all instances run
+    {"type": "INTERIM", "content": {"i": 0, "t": ..., "v": 9410.8}}
+    {"type": "LINE", "content": {"i": 0, "l": "..."}}      other output
+    {"type": "EXIT", "content": {"i": 0, "status": 0}}
+    {"type": "DONE", "content": {"t": ...}}
+
+Interim results need netperf built with --enable-demo and run with -D.
+"""
+
+import json
+import os
+import re
+import select
+import signal
+import sys
+import time
+
+INTERIM_RE = re.compile(r"Interim result:\s*(\S+)")
+
+
+def send_message(mtype, content):
+    message = {"type": mtype, "content": content}
+    sys.stdout.write(json.dumps(message, separators=(",", ":")))
+    sys.stdout.write(os.linesep)
+    sys.stdout.flush()
+
+
+def spawn(argv, barrier_r, barrier_w):
+    """Fork an instance blocked on the barrier pipe, return (pid, stdout)"""
+    out_r, out_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(barrier_w)
+        os.dup2(out_w, 1)
+        os.dup2(out_w, 2)
+        # block until the write end of barrier is closed by parent
+        os.read(barrier_r, 1)
+        try:
+            os.execv(argv[0], argv)
+        finally:
+            os._exit(127)
+    os.close(out_w)
+    return pid, out_r
+
+
+def main():
+    if len(sys.argv) < 3:
+        sys.stderr.write(__doc__)
+        return 2
+    num = int(sys.argv[1])
+    argv = sys.argv[2:]
+
+    barrier_r, barrier_w = os.pipe()
+    children = dict()
+    for i in range(num):
+        pid, out = spawn(argv, barrier_r, barrier_w)
+        children[out] = (i, pid, b"")
+    os.close(barrier_r)
+
+    def stop(signum, frame):
+        for _, pid, _ in children.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    os.close(barrier_w)
+    send_message("READY", {"n": num, "t": time.time()})
+
+    migrated = set()
+    while children:
+        try:
+            readable, _, _ = select.select(list(children), [], [])
+        except (IOError, OSError, select.error):
+            # interrupted by signal
+            continue
+        for fd in readable:
+            i, pid, buf = children[fd]
+            data = os.read(fd, 65536)
+            if not data:
+                os.close(fd)
+                del children[fd]
+                _, status = os.waitpid(pid, 0)
+                send_message("EXIT", {"i": i, "status": status})
+                continue
+            lines = (buf + data).split(b"\n")
+            children[fd] = (i, pid, lines.pop())
+            now = time.time()
+            for line in lines:
+                line = line.decode(errors="replace").rstrip()
+                match = INTERIM_RE.search(line)
+                if match:
+                    send_message(
+                        "INTERIM", {"i": i, "t": now, "v": float(match.group(1))}
+                    )
+                    continue
+                if "MIGRATE" in line and i not in migrated:
+                    migrated.add(i)
+                    if len(migrated) == num:
+                        send_message("UP", {"t": now})
+                if line:
+                    send_message("LINE", {"i": i, "l": line})
+    send_message("DONE", {"t": time.time()})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import collections
 import logging
 import os
 import re
@@ -15,7 +16,15 @@ from virttest import (
     virt_vm,
 )
 
-from provider import netperf_base, vdpa_utils, win_driver_utils
+from provider import (
+    cpu_placement,
+    netperf_base,
+    netperf_counter,
+    netperf_stream,
+    result_store,
+    vdpa_utils,
+    win_driver_utils,
+)
 
 LOG_JOB = logging.getLogger("avocado.test")
 
@@ -280,7 +289,7 @@ def run(test, params, env):
         ).decode()
     )
     # pin guest vcpus/memory/vhost threads to last numa node of host by default
-    numa_node = netperf_base.pin_vm_threads(vm, params.get("numa_node"))
+    placement = cpu_placement.place_vm_threads(test, params, vm)
 
     host = params.get("host", "localhost")
     host_ip = host
@@ -332,7 +341,10 @@ def run(test, params, env):
         client = vm2.wait_for_login(timeout=login_timeout)
         client_ip = vm2.get_address()
         session2.close()
-        netperf_base.pin_vm_threads(vm2, numa_node)
+        if placement:
+            cpu_placement.place_vm_threads(
+                test, params, vm2, placement.numa_node, placement.used_cpus
+            )
 
     error_context.context("Prepare env of server/client/host", test.log.info)
     prepare_list = set([server_ctl, client, host])
@@ -354,6 +366,12 @@ def run(test, params, env):
             windows_disable_firewall = params.get("windows_disable_firewall")
             netperf_base.ssh_cmd(i, windows_disable_firewall)
     netperf_base.tweak_tuned_profile(params, server_ctl, client, host)
+    if params.get("guest_counter_agent") == "yes":
+        vm.copy_files_to(
+            netperf_counter.AGENT_SOURCE,
+            netperf_counter.AGENT_TARGET,
+            nic_index=1 if len(params.get("nics", "").split()) > 1 else 0,
+        )
     mtu = int(params.get("mtu", "1500"))
     mtu_set(mtu)
 
@@ -451,8 +469,11 @@ def start_test(
     if params is None:
         params = {}
 
-    fd = open("%s/netperf-result.%s.RHS" % (resultsdir, time.time()), "w")
-    netperf_base.record_env_version(test, params, host, server_ctl, fd, test_duration)
+    rhs_path = "%s/netperf-result.%s.RHS" % (resultsdir, time.time())
+    store = result_store.open_store(test, params, "netperf")
+    netperf_base.record_env_version(
+        test, params, host, server_ctl, store, test_duration
+    )
 
     record_list = [
         "size",
@@ -478,6 +499,7 @@ def start_test(
     record_list.append("tx_intr_sum")
     base = params.get("format_base", "12")
     fbase = params.get("format_fbase", "2")
+    store.open_rhs(rhs_path, keys=record_list, base=base, fbase=fbase)
 
     output = netperf_base.ssh_cmd(host, "mpstat 1 1 |grep CPU")
     mpstat_head = re.findall(r"CPU\s+.*", output)[0].split()
@@ -501,7 +523,6 @@ def start_test(
                 protocol_log = protocol + " (RX)"
             elif protocol == "TCP_MAERTS":
                 protocol_log = protocol + " (TX)"
-        fd.write("Category:" + protocol_log + "\n")
 
         record_header = True
         for i in sizes_test:
@@ -557,9 +578,11 @@ def start_test(
                         test.write_test_keyval({"%s--%s" % (prefix, key): ret[key]})
 
                     test.log.info(row)
-                    fd.write(row + "\n")
-
-                    fd.flush()
+                    store.add(
+                        protocol_log,
+                        collections.OrderedDict((k, ret[k]) for k in key_list),
+                        tags={"protocol": protocol},
+                    )
 
                     test.log.debug("Remove temporary files")
                     process.system_output(
@@ -576,7 +599,6 @@ def start_test(
                         int(j),
                     )
                     continue
-    fd.close()
 
 
 @error_context.context_aware
@@ -599,6 +621,7 @@ def launch_client(
     client_path = "/tmp/netperf-%s/src/netperf" % netperf_version
     server_path = "/tmp/netperf-%s/src/netserver" % netperf_version
     get_status_flag = params.get("get_status_in_guest", "no") == "yes"
+    counter_agent = params.get("guest_counter_agent", "no") == "yes"
     global _netserver_started
     # Start netserver
     if _netserver_started:
@@ -733,12 +756,14 @@ def launch_client(
             state_list.append("intr")
             state_list.append(ninit)
 
-        exits = int(netperf_base.ssh_cmd(host, "cat /sys/kernel/debug/kvm/exits"))
         state_list.append("exits")
-        state_list.append(exits)
+        state_list.append(get_host_exits())
 
         return state_list
 
+    def get_host_exits():
+        return int(netperf_base.ssh_cmd(host, "cat /sys/kernel/debug/kvm/exits"))
+
     def thread_cmd(params, i, numa_enable, client_s, timeout):
         fname = "/tmp/netperf.%s.nf" % pid
         option = "`command -v python python3 | head -1 ` "
@@ -752,6 +777,27 @@ def launch_client(
         option += " >> %s" % fname
         netperf_base.netperf_thread(params, numa_enable, client_s, option, fname)
 
+    def start_launcher(numa_enable):
+        """Start netperf clients behind a barrier, stream the results"""
+        cmd = ""
+        if numa_enable:
+            cmd += cpu_placement.numactl_prefix(params.get("numa_node"))
+        cmd += "`command -v python3 python | head -1` "
+        cmd += "%s %d %s -D 1 -H %s -l %s %s" % (
+            netperf_stream.LAUNCHER_TARGET,
+            int(sessions),
+            client_path,
+            server,
+            int(l) * 1.5,
+            nf_args,
+        )
+        aggregator = netperf_stream.ThroughputAggregator(
+            int(sessions), params.get_numeric("netperf_warmup", 0, float)
+        )
+        launcher = netperf_stream.NetperfLauncher(clients[0], cmd, aggregator)
+        launcher.start()
+        return launcher
+
     def all_clients_up():
         try:
             content = netperf_base.ssh_cmd(clients[-1], "cat %s" % fname)
@@ -804,50 +850,70 @@ def launch_client(
         return result
 
     tries = int(params.get("tries", 1))
+    use_launcher = params.get("netperf_launcher", "no") == "yes"
     while tries > 0:
         error_context.context("Start netperf client threads", test.log.info)
         pid = str(os.getpid())
         fname = "/tmp/netperf.%s.nf" % pid
-        netperf_base.ssh_cmd(clients[-1], "rm -f %s" % fname)
         numa_enable = params.get("netperf_with_numa", "yes") == "yes"
         timeout_netperf_start = int(l) * 0.5
-        client_thread = threading.Thread(
-            target=thread_cmd,
-            kwargs={
-                "params": params,
-                "i": int(sessions),
-                "numa_enable": numa_enable,
-                "client_s": clients[0],
-                "timeout": timeout_netperf_start,
-            },
-        )
-        client_thread.start()
+        if use_launcher:
+            launcher = start_launcher(numa_enable)
+            clients_up = launcher.wait_up(timeout_netperf_start)
+        else:
+            netperf_base.ssh_cmd(clients[-1], "rm -f %s" % fname)
+            client_thread = threading.Thread(
+                target=thread_cmd,
+                kwargs={
+                    "params": params,
+                    "i": int(sessions),
+                    "numa_enable": numa_enable,
+                    "client_s": clients[0],
+                    "timeout": timeout_netperf_start,
+                },
+            )
+            client_thread.start()
+            clients_up = utils_misc.wait_for(
+                all_clients_up,
+                timeout_netperf_start,
+                0.0,
+                0.2,
+                "Wait until all netperf clients start to work",
+            )
 
         ret = {}
         ret["pid"] = pid
 
-        if utils_misc.wait_for(
-            all_clients_up,
-            timeout_netperf_start,
-            0.0,
-            0.2,
-            "Wait until all netperf clients start to work",
-        ):
+        if clients_up:
             test.log.debug("All netperf clients start to work.")
 
             # real & effective test starts
-            if get_status_flag:
+            if get_status_flag and counter_agent:
+                sampler = netperf_counter.GuestCounterSampler(
+                    server_ctl,
+                    server,
+                    params.get_numeric("guest_counter_interval", 1, float),
+                )
+                sampler.start()
+                start_exits = get_host_exits()
+            elif get_status_flag:
                 start_state = get_state()
             ret["mpstat"] = netperf_base.ssh_cmd(
                 host, "mpstat 1 %d |tail -n 1" % (l - 1)
             )
-            finished_result = netperf_base.ssh_cmd(clients[-1], "cat %s" % fname)
+            if not use_launcher:
+                finished_result = netperf_base.ssh_cmd(clients[-1], "cat %s" % fname)
 
             # stop netperf clients
             stop_netperf_clients()
 
             # real & effective test ends
-            if get_status_flag:
+            if get_status_flag and counter_agent:
+                counters = sampler.stop()
+                counters.report()
+                ret.update(counters.totals())
+                ret["exits"] = get_host_exits() - start_exits
+            elif get_status_flag:
                 end_state = get_state()
                 if len(start_state) != len(end_state):
                     msg = "Initial state not match end state:\n"
@@ -860,9 +926,17 @@ def launch_client(
                             end_state[i * 2 + 1] - start_state[i * 2 + 1]
                         )
 
-            client_thread.join()
-
             error_context.context("Testing Results Treatment and Report", test.log.info)
+            if use_launcher:
+                launcher.wait_done(timeout_netperf_start)
+                aggregator = launcher.aggregator
+                if not aggregator.count:
+                    test.error("No netperf interim result after warm-up")
+                test.log.debug("steady samples: %s", aggregator.count)
+                ret["thu"] = aggregator.throughput
+                return ret
+
+            client_thread.join()
             f = open(fname, "w")
             f.write(finished_result)
             f.close()
@@ -871,5 +945,7 @@ def launch_client(
             break
         else:
             stop_netperf_clients()
+            if use_launcher:
+                launcher.wait_done(timeout_netperf_start)
             tries = tries - 1
             test.log.debug("left %s times", tries)
@@ -3,6 +3,8 @@ import math
 from avocado.utils import process
 from virttest import env_process, error_context
 
+from provider.boot_waves import WaveBooter
+
 
 @error_context.context_aware
 def run(test, params, env):
@@ -14,6 +16,9 @@ def run(test, params, env):
        and all booted vms respond to shell commands
     3) go on until cannot create VM anymore or cannot allocate memory for VM
 
+    With boot_wave_size set, the VMs are booted in concurrent waves of the
+    size, and all the guests are checked concurrently after each wave.
+
     :param test:   kvm test object
     :param params: Dictionary with the test parameters
     :param env:    Dictionary with test environment.
@@ -48,13 +53,39 @@ def run(test, params, env):
     login_timeout = float(params.get("login_timeout", 420))
     session = vm.wait_for_login(timeout=login_timeout)
 
+    max_vms = int(params.get("max_vms"))
+    wave_size = int(params.get("boot_wave_size", 0))
+    if wave_size:
+        booter = WaveBooter(
+            test,
+            params,
+            env,
+            vm,
+            wave_size,
+            int(params.get("boot_login_workers", 0)),
+            login_timeout,
+        )
+        booter.add_session(vm, session)
+        try:
+            running = booter.boot(max_vms, params.get("alive_test_cmd"))
+            booter.report()
+            if running < max_vms:
+                test.fail(
+                    "Expect to boot up %s guests. Only %d guests booted up, "
+                    "see the errors above." % (max_vms, running)
+                )
+        finally:
+            booter.close()
+            test.log.info("Total number booted: %d", booter.running)
+        return
+
     num = 2
     sessions = [session]
 
     # Boot the VMs
     try:
         try:
-            while num <= int(params.get("max_vms")):
+            while num <= max_vms:
                 # Clone vm according to the first one
                 error_context.base_context("booting guest #%d" % num, test.log.info)
                 vm_name = "vm%d" % num
@@ -1,10 +1,8 @@
 import logging
 import os
-import re
 import socket
 import time
 
-import six
 from autotest.client.shared import error, utils
 from autotest.client.shared.barrier import listen_server
 from autotest.client.shared.syncdata import SyncData
@@ -12,6 +10,7 @@ from virttest import utils_misc
 from virttest.utils_test.qemu import migration
 
 from provider import cpuflags
+from provider.migration_telemetry import MigrationSampler
 
 
 def run(test, params, env):
@@ -47,48 +46,40 @@ def run(test, params, env):
 
     vm_mem = int(params.get("mem", "512"))
 
-    get_mig_speed = re.compile(r"^transferred ram: (\d+) kbytes$", re.MULTILINE)
-
     mig_speed = params.get("mig_speed", "1G")
     mig_speed_accuracy = float(params.get("mig_speed_accuracy", "0.2"))
 
+    mig_timeout = float(params.get("mig_timeout", "10"))
+    mig_sample_interval = float(params.get("mig_sample_interval", "1"))
+    mig_sample_duration = float(params.get("mig_sample_duration", "30"))
+    mig_sample_events = params.get("mig_sample_events", "no") == "yes"
+
     def get_migration_statistic(vm):
-        last_transfer_mem = 0
-        transfered_mem = 0
-        mig_stat = utils.Statistic()
-        for _ in range(30):
-            o = vm.monitor.info("migrate")
-            warning_msg = (
-                "Migration already ended. Migration speed is"
-                " probably too high and will block vm while"
-                " filling its memory."
-            )
-            fail_msg = (
-                "Could not determine the transferred memory from monitor data: %s" % o
+        sampler = MigrationSampler(vm, mig_sample_interval, mig_sample_events)
+        warning_msg = (
+            "Migration already ended. Migration speed is"
+            " probably too high and will block vm while"
+            " filling its memory."
+        )
+        sampler.wait_active(mig_timeout)
+        status = sampler.run(mig_sample_duration)
+        sampler.report(test)
+        if status != "active":
+            raise error.TestWarn(warning_msg)
+        speeds = sampler.speed()
+        for speed in speeds:
+            logging.debug("Migration speed: %s MB/s", speed)
+        mig_stat = speeds.summary()
+        if not mig_stat["count"]:
+            raise error.TestFail(
+                "Could not determine the transferred memory from monitor data"
             )
-            if isinstance(o, six.string_types):
-                if "status: active" not in o:
-                    raise error.TestWarn(warning_msg)
-                try:
-                    transfered_mem = int(get_mig_speed.search(o).groups()[0])
-                except (IndexError, ValueError):
-                    raise error.TestFail(fail_msg)
-            else:
-                if o.get("status") != "active":
-                    raise error.TestWarn(warning_msg)
-                try:
-                    transfered_mem = o.get("ram").get("transferred") / (1024)
-                except (IndexError, ValueError):
-                    raise error.TestFail(fail_msg)
-
-            real_mig_speed = (transfered_mem - last_transfer_mem) / 1024
-
-            last_transfer_mem = transfered_mem
-
-            logging.debug("Migration speed: %s MB/s", real_mig_speed)
-            mig_stat.record(real_mig_speed)
-            time.sleep(1)
-
+        analysis = sampler.analyze()
+        logging.info(
+            "Dirty page rate: %.2f MB/s, %.1f%% of migration speed",
+            analysis.get("dirty_bandwidth", 0.0) / 1048576,
+            analysis.get("dirty_ratio", 0.0) * 100,
+        )
         return mig_stat
 
     class TestMultihostMigration(base_class):
@@ -200,14 +191,14 @@ def run(test, params, env):
         mig_stat = mig.mig_stat
 
         mig_speed = mig_speed / (1024 * 1024)
-        real_speed = mig_stat.get_average()
+        real_speed = mig_stat["mean"]
         ack_speed = mig.link_speed * mig_speed_accuracy
 
         logging.info("Target migration speed: %d MB/s", mig_speed)
         logging.info("Real Link speed: %d MB/s", mig.link_speed)
-        logging.info("Average migration speed: %d MB/s", mig_stat.get_average())
-        logging.info("Minimum migration speed: %d MB/s", mig_stat.get_min())
-        logging.info("Maximum migration speed: %d MB/s", mig_stat.get_max())
+        logging.info("Average migration speed: %d MB/s", mig_stat["mean"])
+        logging.info("Minimum migration speed: %d MB/s", mig_stat["min"])
+        logging.info("Maximum migration speed: %d MB/s", mig_stat["max"])
 
         logging.info("Maximum tolerable divergence: %3.1f%%", mig_speed_accuracy * 100)
 
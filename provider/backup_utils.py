@@ -1,9 +1,13 @@
 import json
+import logging
 import math
 import random
 import re
+import tempfile
+import time
 
 from avocado import fail_on
+from avocado.core import exceptions
 from avocado.utils import process
 from virttest import (
     data_dir,
@@ -17,8 +21,11 @@ from virttest import (
 
 from provider import block_dirty_bitmap as block_bitmap
 from provider import job_utils
+from provider.block_job_orchestrator import BlockJobOrchestrator
 from provider.virt_storage.storage_admin import sp_admin
 
+LOG_JOB = logging.getLogger("avocado.test")
+
 BACKING_MASK_PROTOCOL_VERSION_SCOPE = "[9.0.0, )"
 
 
@@ -354,8 +361,6 @@ def blockdev_batch_snapshot(vm, source_lst, target_lst, **extra_options):
 
 @fail_on
 def blockdev_batch_backup(vm, source_lst, target_lst, bitmap_lst, **extra_options):
-    actions = []
-    jobs_id = []
     bitmap_add_cmd = "block-dirty-bitmap-add"
     timeout = int(extra_options.pop("timeout", 600))
     completion_mode = extra_options.pop("completion_mode", None)
@@ -368,6 +373,7 @@ def blockdev_batch_backup(vm, source_lst, target_lst, bitmap_lst, **extra_option
     # sometimes the job will never complete, e.g. backup in pull mode,
     # export fleecing image by internal nbd server
     wait_job_complete = extra_options.pop("wait_job_complete", True)
+    orchestrator = BlockJobOrchestrator(vm, completion_mode=completion_mode)
 
     for idx, src in enumerate(source_lst):
         if sync_mode in ["incremental", "bitmap"]:
@@ -378,9 +384,7 @@ def blockdev_batch_backup(vm, source_lst, target_lst, bitmap_lst, **extra_option
         backup_cmd, arguments = blockdev_backup_qmp_cmd(
             src, target_lst[idx], **extra_options
         )
-        job_id = arguments.get("job-id", src)
-        jobs_id.append(job_id)
-        actions.append({"type": backup_cmd, "data": arguments})
+        orchestrator.add_job(backup_cmd, arguments)
 
         if bitmap_lst and (sync_mode == "full" or sync_mode == "none"):
             bitmap_data = {"node": source_lst[idx], "name": bitmap_lst[idx]}
@@ -393,24 +397,15 @@ def blockdev_batch_backup(vm, source_lst, target_lst, bitmap_lst, **extra_option
                 bitmap_data["persistent"] = persistent
             if disabled is not None:
                 bitmap_data["disabled"] = disabled
-            actions.append({"type": bitmap_add_cmd, "data": bitmap_data})
+            orchestrator.add_action(bitmap_add_cmd, bitmap_data)
 
         if disabled_bitmap_lst:
             bitmap_data = {"node": source_lst[idx], "name": disabled_bitmap_lst[idx]}
-            actions.append({"type": bitmap_disable_cmd, "data": bitmap_data})
-
-    arguments = {"actions": actions}
-    if completion_mode == "grouped":
-        arguments["properties"] = {"completion-mode": "grouped"}
-    vm.monitor.cmd("transaction", arguments)
+            orchestrator.add_action(bitmap_disable_cmd, bitmap_data)
 
+    orchestrator.submit()
     if wait_job_complete:
-        list(
-            map(
-                lambda x: job_utils.wait_until_block_job_completed(vm, x, timeout),
-                jobs_id,
-            )
-        )
+        orchestrator.wait(timeout)
 
 
 @fail_on
@@ -489,6 +484,32 @@ def format_storage_volume(img, filesystem, partition="mbr"):
         process.system("setenforce %s" % selinux_mode, shell=True)
 
 
+def _merge_extents(extents, max_len):
+    """
+    Merge the adjacent extents, then split them into parts no longer
+    than max_len
+
+    :param extents: list of (start, length) in ascending order
+    :param max_len: maximum length of one part
+    :return: list of (start, length)
+    """
+    merged = []
+    for start, length in extents:
+        if merged and merged[-1][0] + merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], merged[-1][1] + length)
+        else:
+            merged.append((start, length))
+
+    parts = []
+    for start, length in merged:
+        while length > max_len:
+            parts.append((start, max_len))
+            start, length = start + max_len, length - max_len
+        if length > 0:
+            parts.append((start, length))
+    return parts
+
+
 def copyif(params, nbd_image, target_image, bitmap=None):
     """
     Python implementation of copyif3.sh
@@ -496,6 +517,7 @@ def copyif(params, nbd_image, target_image, bitmap=None):
     :params nbd_image: nbd image tag
     :params target_image: target image tag
     :params bitmap: bitmap name
+    :return: dict of copy statistics: extents, bytes, time, extents/s, bytes/s
     """
 
     def _qemu_io_read(qemu_io, s, l, img):
@@ -504,6 +526,25 @@ def copyif(params, nbd_image, target_image, bitmap=None):
         )
         process.system(cmd, ignore_status=False, shell=True)
 
+    def _qemu_io_batch_read(qemu_io, extents, img):
+        # feed all reads to one qemu-io session as a command stream
+        with tempfile.NamedTemporaryFile(mode="w", dir=data_dir.get_tmp_dir()) as f:
+            for s, l in extents:
+                f.write("read -q %d %d\n" % (s, l))
+            f.write("quit\n")
+            f.flush()
+            cmd = "{io} -C -f {fmt} {f} < {cmds}".format(
+                io=qemu_io, fmt=img.image_format, f=img.image_filename, cmds=f.name
+            )
+            result = process.run(cmd, ignore_status=False, shell=True)
+        # a failed command of the stream doesn't set the exit status unless
+        # it's the last one, qemu-io reports each by a "read failed:" error,
+        # which may follow the "qemu-io> " prompts on the same line
+        output = result.stdout_text + result.stderr_text
+        errors = re.findall(r"read failed: .*", output)
+        if errors:
+            raise exceptions.TestError("qemu-io read failed: %s" % "\n".join(errors))
+
     qemu_io = utils_misc.get_qemu_io_binary(params)
     qemu_img = utils_misc.get_qemu_img_binary(params)
     img_obj = qemu_storage.QemuImg(
@@ -511,6 +552,7 @@ def copyif(params, nbd_image, target_image, bitmap=None):
     )
     nbd_img_obj = qemu_storage.QemuImg(params.object_params(nbd_image), None, nbd_image)
     max_len = int(params.get("qemu_io_max_len", 2147483136))
+    batch_mode = params.get("copyif_batch_mode", "yes") == "yes"
 
     if bitmap is None:
         args = "-f %s %s" % (nbd_img_obj.image_format, nbd_img_obj.image_filename)
@@ -530,23 +572,50 @@ def copyif(params, nbd_image, target_image, bitmap=None):
     map_cmd = "{qemu_img} map --output=json {args}".format(qemu_img=qemu_img, args=args)
     result = process.run(map_cmd, ignore_status=False, shell=True)
 
-    for item in json.loads(result.stdout.decode().strip()):
-        if item["data"] is not state:
-            continue
-
+    extents = [
+        (item["start"], item["length"])
+        for item in json.loads(result.stdout.decode().strip())
+        if item["data"] is state
+    ]
+    start_time = time.time()
+    if batch_mode:
         # qemu-io can only handle length less than 2147483136,
         # so here we need to split 'large length' into several parts
-        start, length = item["start"], item["length"]
-        while length > max_len:
-            _qemu_io_read(qemu_io, start, max_len, img_obj)
-            start, length = start + max_len, length - max_len
-        else:
-            if length > 0:
-                _qemu_io_read(qemu_io, start, length, img_obj)
+        extents = _merge_extents(extents, max_len)
+        if extents:
+            _qemu_io_batch_read(qemu_io, extents, img_obj)
+    else:
+        for start, length in extents:
+            while length > max_len:
+                _qemu_io_read(qemu_io, start, max_len, img_obj)
+                start, length = start + max_len, length - max_len
+            else:
+                if length > 0:
+                    _qemu_io_read(qemu_io, start, length, img_obj)
+    elapsed = time.time() - start_time
 
     img_obj.base_tag = "null"
     img_obj.rebase(img_obj.params)
 
+    total = sum(length for start, length in extents)
+    stat = {
+        "extents": len(extents),
+        "bytes": total,
+        "time": elapsed,
+        "extents/s": len(extents) / elapsed if elapsed else 0,
+        "bytes/s": total / elapsed if elapsed else 0,
+    }
+    LOG_JOB.info(
+        "copyif %s: %d extents, %d bytes in %.3fs, %.1f extents/s, %.2f MB/s",
+        target_image,
+        stat["extents"],
+        stat["bytes"],
+        stat["time"],
+        stat["extents/s"],
+        stat["bytes/s"] / 1024 / 1024,
+    )
+    return stat
+
 
 def get_disk_info_by_param(tag, params, session):
     """
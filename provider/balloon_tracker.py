@@ -0,0 +1,286 @@
+"""
+Module to track the balloon of a VM from the host side.
+
+The balloon size acknowledged by the guest driver is polled by query-balloon
+and received by the BALLOON_CHANGE events, the guest memory statistics are
+polled by qom-get guest-stats, both at a sub-second interval into time
+series. The guest updates its statistics every guest-stats-polling-interval,
+so the statistics are recorded only when their last-update changes.
+
+The balloon settles when the balloon size and the tracked guest statistic
+change slower than a rate over a time window, so a balloon test waits only
+as long as the balloon is moving. The time from the balloon command until
+the balloon reaches its final size gives the inflate and deflate speeds of
+the balloon driver.
+
+Available classes:
+- BalloonOp: one balloon operation
+- BalloonTracker: track the balloon of a VM
+"""
+
+import collections
+import logging
+import re
+import time
+
+from provider.perf_stats import Series, summarize
+from provider.qmp_event_store import get_event_store
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+MB = 1024**2
+# value of a guest statistic not reported by the guest
+STAT_DISABLED = 0xFFFFFFFFFFFFFFFF
+
+
+class BalloonOp(
+    collections.namedtuple("BalloonOp", ["direction", "start", "end", "seconds"])
+):
+    """
+    One balloon operation, the balloon sizes in MB, seconds until the
+    balloon reached its end size, None if it didn't
+    """
+
+    __slots__ = ()
+
+    @property
+    def speed(self):
+        """MB per second of the operation"""
+        if not self.seconds:
+            return None
+        return abs(self.end - self.start) / self.seconds
+
+
+class BalloonTracker(object):
+    """
+    Track the balloon of a VM
+    Example of usage:
+        tracker = BalloonTracker(vm, "/machine/peripheral/balloon0")
+        tracker.enable_polling(1)
+        tracker.begin()
+        vm.balloon(new_mem)
+        tracker.wait(timeout=480, target=new_mem)
+        tracker.report(test)
+    """
+
+    def __init__(
+        self,
+        vm,
+        device_path,
+        interval=0.25,
+        metric="stat-total-memory",
+        window=3.0,
+        max_rate=5.0,
+    ):
+        """
+        :param vm: VM object
+        :param device_path: QOM path of the balloon device
+        :param interval: seconds between two polls
+        :param metric: guest statistic checked for the settling, e.g.
+                       stat-total-memory, or stat-used-memory which is
+                       computed from the total and free memory
+        :param window: seconds the balloon must be settled for
+        :param max_rate: MB per second below which the balloon is settled
+        """
+        self.vm = vm
+        self.device_path = device_path
+        self.interval = interval
+        self.metric = metric
+        self.window = window
+        self.max_rate = max_rate
+        self.actual = Series("actual")
+        self.changes = Series("balloon_change")
+        self.stats = dict()
+        self.operations = []
+        self._last_update = None
+        self._begin = None
+        self._begin_wall = None
+        self._start_mem = None
+        self._cursor = 0
+
+    def enable_polling(self, polling_interval=1):
+        """
+        Let the guest update its statistics every polling_interval seconds
+
+        :param polling_interval: seconds, the guest accepts integers only
+        """
+        self.vm.monitor.qom_set(
+            self.device_path, "guest-stats-polling-interval", int(polling_interval)
+        )
+
+    @property
+    def tracking(self):
+        """Whether an operation is begun and not waited for"""
+        return self._begin is not None
+
+    def _get_actual(self):
+        """Get the balloon size in MB"""
+        output = self.vm.monitor.info("balloon", debug=False)
+        if isinstance(output, dict):
+            return output["actual"] / float(MB)
+        return float(re.findall(r"\d+", str(output))[0])
+
+    def _poll_stats(self, now):
+        try:
+            output = self.vm.monitor.qom_get(self.device_path, "guest-stats")
+        except Exception as err:
+            LOG_JOB.debug("Failed to get balloon guest-stats: %s", err)
+            return
+        last_update = output.get("last-update")
+        if not last_update or last_update == self._last_update:
+            return
+        self._last_update = last_update
+        stats = dict(
+            (k, v) for k, v in output.get("stats", {}).items() if v != STAT_DISABLED
+        )
+        if "stat-total-memory" in stats and "stat-free-memory" in stats:
+            stats["stat-used-memory"] = (
+                stats["stat-total-memory"] - stats["stat-free-memory"]
+            )
+        for name, value in stats.items():
+            series = self.stats.setdefault(name, Series(name))
+            series.append(value / float(MB), now)
+
+    def _poll_events(self):
+        """Add the balloon sizes of the new BALLOON_CHANGE events"""
+        store = get_event_store(self.vm)
+        try:
+            store.read_events()
+        except Exception as err:
+            LOG_JOB.debug("Failed to get QMP events: %s", err)
+            return
+        events, self._cursor = store.get_new_events(self._cursor, "BALLOON_CHANGE")
+        # the QMP timestamps are wall clock time
+        offset = time.time() - time.monotonic()
+        for event in events:
+            stamp = event.get("timestamp", {})
+            wall = stamp.get("seconds", 0) + stamp.get("microseconds", 0) / 1e6
+            if self._begin_wall is not None and wall < self._begin_wall:
+                continue
+            self.changes.append(event["data"]["actual"] / float(MB), wall - offset)
+
+    def sample(self):
+        """
+        Poll the balloon size and the guest statistics once
+
+        :return: balloon size in MB
+        """
+        self._poll_events()
+        now = time.monotonic()
+        actual = self._get_actual()
+        self.actual.append(actual, now)
+        self._poll_stats(now)
+        return actual
+
+    def begin(self):
+        """Start to track a balloon operation, call it before the command"""
+        self._begin = time.monotonic()
+        self._begin_wall = time.time()
+        store = get_event_store(self.vm)
+        try:
+            store.read_events()
+        except Exception as err:
+            LOG_JOB.debug("Failed to get QMP events: %s", err)
+        self._cursor = store.cursor
+        self._start_mem = self.sample()
+
+    def _settled_rate(self, series, now):
+        """
+        Get the rate of change of a series in MB/s over the last window, or
+        None if the window isn't covered by the samples
+        """
+        recent = series.window(now - self.window)
+        if len(recent) < 2 or len(series) == len(recent):
+            return None
+        return abs(recent.slope())
+
+    def settled(self, now=None):
+        """
+        Check whether the balloon size and the guest statistic changed
+        slower than max_rate over the last window
+        """
+        now = time.monotonic() if now is None else now
+        if self._begin is not None and now - self._begin < self.window:
+            return False
+        rate = self._settled_rate(self.actual, now)
+        if rate is None or rate >= self.max_rate:
+            return False
+        if self.metric in self.stats:
+            stat_rate = self._settled_rate(self.stats[self.metric], now)
+            if stat_rate is not None and stat_rate >= self.max_rate:
+                return False
+        return True
+
+    def wait(self, timeout, target=None):
+        """
+        Wait until the balloon settles, and record the operation since
+        begin
+
+        :param timeout: seconds to wait
+        :param target: balloon size in MB to reach before settling
+        :return: True if the balloon settled
+        """
+        if self._begin is None:
+            self.begin()
+        end_time = time.monotonic() + timeout
+        settled = False
+        while time.monotonic() < end_time:
+            actual = self.sample()
+            if target is None or abs(actual - target) < 1:
+                if self.settled():
+                    settled = True
+                    break
+            time.sleep(self.interval)
+        self._record()
+        if not settled:
+            LOG_JOB.warning("Balloon is not settled after %ss", timeout)
+        return settled
+
+    def _record(self):
+        """Record the operation since begin"""
+        begin, self._begin = self._begin, None
+        series = self.actual.window(begin)
+        if not len(series):
+            return
+        start, end = self._start_mem, series.values[-1]
+        if abs(end - start) < 1:
+            return
+        # the end is reached at the first poll or event of the end size
+        reached = [
+            t
+            for s in (series, self.changes.window(begin))
+            for v, t in zip(s.values, s.times)
+            if abs(v - end) < 1
+        ]
+        seconds = min(reached) - begin if reached else None
+        direction = "inflate" if end < start else "deflate"
+        operation = BalloonOp(direction, start, end, seconds)
+        self.operations.append(operation)
+        if operation.speed:
+            LOG_JOB.info(
+                "Balloon %s from %dM to %dM in %.2fs: %.1f MB/s",
+                direction,
+                start,
+                end,
+                seconds,
+                operation.speed,
+            )
+
+    def speeds(self, direction):
+        """Get the speeds in MB/s of the operations of a direction"""
+        return [
+            op.speed for op in self.operations if op.direction == direction and op.speed
+        ]
+
+    def report(self, test, prefix="balloon"):
+        """Write the inflate and deflate speeds in test keyvals"""
+        keyvals = dict()
+        for direction in ("inflate", "deflate"):
+            stat = summarize(self.speeds(direction))
+            keyvals["%s--%s_count" % (prefix, direction)] = stat["count"]
+            if stat["count"]:
+                for key in ("mean", "min", "max"):
+                    keyvals["%s--%s_speed_%s" % (prefix, direction, key)] = (
+                        "%.1f" % stat[key]
+                    )
+        test.write_test_keyval(keyvals)
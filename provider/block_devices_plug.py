@@ -32,6 +32,8 @@ from virttest.qemu_devices.utils import (
 )
 from virttest.qemu_monitor import MonitorLockError
 
+from provider.qmp_event_store import get_event_store
+
 LOG_JOB = logging.getLogger("avocado.test")
 
 HOTPLUG, UNPLUG = ("hotplug", "unplug")
@@ -240,13 +242,15 @@ class BlockDevicesPlug(object):
 
     def _get_events_deleted(self):
         """Get the device deleted events."""
-        self.event_devs = [img for img in self._unplugged_devs.keys()]
-        for event in self.vm.monitor.get_events():
-            if DELETED_EVENT in event.get("event") and "device" in event.get("data"):
-                name = event.get("data")["device"]
-                if name in self.event_devs:
-                    self.event_devs.remove(name)
-        self.vm.monitor.clear_event(DELETED_EVENT)
+        event_store = get_event_store(self.vm)
+        event_store.read_events()
+        self.event_devs = [
+            img
+            for img in self._unplugged_devs.keys()
+            if event_store.get_event(DELETED_EVENT, device=img) is None
+        ]
+        if not self.event_devs:
+            self.vm.monitor.clear_event(DELETED_EVENT)
         return not self.event_devs
 
     def _wait_events_deleted(self, timeout=300):
@@ -0,0 +1,193 @@
+"""
+Module to run several block jobs of a VM concurrently.
+
+The jobs which can be grouped in a QMP 'transaction' are started by one
+transaction, the others are started one after another without waiting
+for the previous jobs. All the jobs are then tracked concurrently through
+the QMP job events, and the latency and throughput of each job is computed
+from the event timestamps.
+
+Available classes:
+- BlockJobOrchestrator: start and wait block jobs, report their statistics
+
+Typical usage:
+
+    orchestrator = BlockJobOrchestrator(vm)
+    for src, dst in zip(source_nodes, target_nodes):
+        orchestrator.add_job(*backup_utils.blockdev_mirror_qmp_cmd(src, dst))
+    orchestrator.run(timeout=600)
+"""
+
+import logging
+import time
+
+from avocado import fail_on
+
+from provider import job_utils
+from provider.qmp_event_store import get_event_store
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+# block job commands accepted as 'transaction' actions by QEMU
+TRANSACTION_JOB_CMDS = ("blockdev-backup", "drive-backup")
+
+
+def _event_time(event):
+    """Get the time an event was emitted, in seconds since epoch"""
+    timestamp = event.get("timestamp")
+    if not timestamp:
+        return None
+    return timestamp["seconds"] + timestamp["microseconds"] / 1000000.0
+
+
+class BlockJobOrchestrator(object):
+    """
+    Start block jobs concurrently and track them through the job events
+    """
+
+    def __init__(self, vm, use_transaction=True, completion_mode=None):
+        """
+        :param vm: VM object
+        :param use_transaction: start the transaction capable jobs by
+                                one 'transaction'
+        :param completion_mode: transaction completion-mode, e.g. 'grouped'
+        """
+        self.vm = vm
+        self.use_transaction = use_transaction
+        self.completion_mode = completion_mode
+        self._actions = []
+        self._jobs = []
+        self._submitted = dict()
+        self._statistics = dict()
+
+    @property
+    def job_ids(self):
+        return [job_id for job_id, cmd, arguments in self._jobs]
+
+    def add_job(self, cmd, arguments):
+        """
+        Add a block job to be started
+
+        :param cmd: block job command, e.g. blockdev-mirror
+        :param arguments: command arguments, generated by the *_qmp_cmd
+                          functions in backup_utils
+        :return: job ID
+        """
+        job_id = arguments.get("job-id", arguments.get("device"))
+        self._jobs.append((job_id, cmd, arguments))
+        if self.use_transaction and cmd in TRANSACTION_JOB_CMDS:
+            self._actions.append({"type": cmd, "data": arguments})
+        return job_id
+
+    def add_action(self, cmd, data):
+        """
+        Add a transaction action which is not a block job, e.g.
+        block-dirty-bitmap-add, it's applied in the same transaction
+        """
+        self._actions.append({"type": cmd, "data": data})
+
+    def submit(self):
+        """Start all the jobs, do not wait for them"""
+        if self._actions:
+            arguments = {"actions": self._actions}
+            if self.completion_mode:
+                arguments["properties"] = {"completion-mode": self.completion_mode}
+            submitted = time.time()
+            self.vm.monitor.cmd("transaction", arguments)
+            for job_id, cmd, _ in self._jobs:
+                if self.use_transaction and cmd in TRANSACTION_JOB_CMDS:
+                    self._submitted[job_id] = submitted
+        for job_id, cmd, arguments in self._jobs:
+            if job_id in self._submitted:
+                continue
+            self._submitted[job_id] = time.time()
+            self.vm.monitor.cmd(cmd, arguments)
+
+    @fail_on
+    def wait(self, timeout=600):
+        """
+        Block until all the jobs completed
+
+        :param timeout: timeout for all the jobs, in seconds
+        :return: dict of job ID and its statistics
+        """
+        completed = job_utils.wait_until_block_jobs_completed(
+            self.vm, self.job_ids, timeout
+        )
+        finished = time.time()
+        for job_id in self.job_ids:
+            self._statistics[job_id] = self._get_job_statistics(
+                job_id, completed[job_id], finished
+            )
+        self.report()
+        return self.get_statistics()
+
+    def run(self, timeout=600):
+        """Start all the jobs and wait for them, return the statistics"""
+        self.submit()
+        return self.wait(timeout)
+
+    def _get_job_statistics(self, job_id, data, finished):
+        """
+        Compute statistics of a completed job from its events:
+        - latency: seconds from submitting to job running
+        - duration: seconds from job running to job completed
+        - throughput: bytes copied per second while running
+        """
+        store = get_event_store(self.vm)
+        submitted = self._submitted[job_id]
+        started = completed = None
+        for event in store.get_events(job_utils.JOB_STATUS_CHANGE_EVENT, id=job_id):
+            if event["data"]["status"] == "running":
+                started = _event_time(event)
+                break
+        event = job_utils.get_job_event(
+            self.vm, job_id, job_utils.BLOCK_JOB_COMPLETED_EVENT
+        )
+        if event is not None:
+            completed = _event_time(event)
+        started = started or submitted
+        completed = completed or finished
+        duration = max(completed - started, 0)
+        length = data.get("len", 0)
+        return {
+            "type": data.get("type"),
+            "len": length,
+            "latency": max(started - submitted, 0),
+            "duration": duration,
+            "throughput": length / duration if duration else 0,
+        }
+
+    def get_statistics(self):
+        """Get the statistics of the completed jobs"""
+        return dict(self._statistics)
+
+    def get_wall_time(self):
+        """Seconds from the first job submitted to the last job completed"""
+        if not self._statistics:
+            return 0
+        first = min(self._submitted.values())
+        return (
+            max(
+                self._submitted[job_id] + stat["latency"] + stat["duration"]
+                for job_id, stat in self._statistics.items()
+            )
+            - first
+        )
+
+    def report(self):
+        """Log the statistics of the completed jobs"""
+        for job_id, stat in self._statistics.items():
+            LOG_JOB.info(
+                "Block job %s(%s): %d bytes, latency %.3fs, duration %.3fs, "
+                "throughput %.2f MB/s",
+                job_id,
+                stat["type"],
+                stat["len"],
+                stat["latency"],
+                stat["duration"],
+                stat["throughput"] / 1024 / 1024,
+            )
+        LOG_JOB.info(
+            "%d block jobs done in %.3fs", len(self._statistics), self.get_wall_time()
+        )
@@ -5,12 +5,11 @@ till all mirror jobs done.
 Please refer to blockdev_mirror_base for detailed test strategy.
 """
 
-from functools import partial
-
 from avocado.utils import memory
 from virttest import utils_misc
 
 from provider import backup_utils, blockdev_mirror_base
+from provider.block_job_orchestrator import BlockJobOrchestrator
 
 
 class BlockdevMirrorParallelTest(blockdev_mirror_base.BlockdevMirrorBaseTest):
@@ -18,6 +17,20 @@ class BlockdevMirrorParallelTest(blockdev_mirror_base.BlockdevMirrorBaseTest):
     block-mirror parallel test module
     """
 
+    def _run_mirror_jobs(self):
+        """Run block-mirror on all source nodes and wait till all done"""
+        orchestrator = BlockJobOrchestrator(self.main_vm)
+        timeout = 0
+        for idx, source_node in enumerate(self._source_nodes):
+            options = dict(self._backup_options[idx])
+            timeout = max(timeout, int(options.pop("timeout", 600)))
+            orchestrator.add_job(
+                *backup_utils.blockdev_mirror_qmp_cmd(
+                    source_node, self._target_nodes[idx], **options
+                )
+            )
+        orchestrator.run(timeout)
+
     def blockdev_mirror(self):
         """Run block-mirror and other operations in parallel"""
         # parallel_tests includes function names separated by space
@@ -26,17 +39,9 @@ class BlockdevMirrorParallelTest(blockdev_mirror_base.BlockdevMirrorBaseTest):
         parallel_tests = self.params.objects("parallel_tests")
         targets = list([getattr(self, t) for t in parallel_tests if hasattr(self, t)])
 
-        # block-mirror on all source nodes is in parallel too
-        for idx, source_node in enumerate(self._source_nodes):
-            targets.append(
-                partial(
-                    backup_utils.blockdev_mirror,
-                    vm=self.main_vm,
-                    source=source_node,
-                    target=self._target_nodes[idx],
-                    **self._backup_options[idx],
-                )
-            )
+        # block-mirror on all source nodes is in parallel too, all mirror
+        # jobs are started at once and waited concurrently
+        targets.append(self._run_mirror_jobs)
 
         try:
             utils_misc.parallel(targets)
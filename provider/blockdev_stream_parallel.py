@@ -4,12 +4,11 @@ running block-stream and some other tests in paralell, and wait
 till all block jobs done.
 """
 
-from functools import partial
-
 from avocado.utils import memory
 from virttest import utils_misc
 
 from provider import backup_utils, blockdev_stream_base
+from provider.block_job_orchestrator import BlockJobOrchestrator
 
 
 class BlockdevStreamParallelTest(blockdev_stream_base.BlockDevStreamTest):
@@ -17,6 +16,18 @@ class BlockdevStreamParallelTest(blockdev_stream_base.BlockDevStreamTest):
     block-stream parallel test module
     """
 
+    def _run_stream_job(self):
+        """Run block-stream on the top device and wait till it's done"""
+        options = dict(self._stream_options)
+        timeout = int(options.pop("timeout", 600))
+        cmd, arguments = backup_utils.blockdev_stream_qmp_cmd(
+            self._top_device, **options
+        )
+        backup_utils.set_default_block_job_options(self.main_vm, arguments)
+        orchestrator = BlockJobOrchestrator(self.main_vm)
+        orchestrator.add_job(cmd, arguments)
+        orchestrator.run(timeout)
+
     def blockdev_stream(self):
         """
         Run block-stream and other operations in parallel
@@ -27,14 +38,7 @@ class BlockdevStreamParallelTest(blockdev_stream_base.BlockDevStreamTest):
         """
         parallel_tests = self.params.objects("parallel_tests")
         targets = list([getattr(self, t) for t in parallel_tests if hasattr(self, t)])
-        targets.append(
-            partial(
-                backup_utils.blockdev_stream,
-                vm=self.main_vm,
-                device=self._top_device,
-                **self._stream_options,
-            )
-        )
+        targets.append(self._run_stream_job)
 
         try:
             utils_misc.parallel(targets)
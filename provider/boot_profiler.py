@@ -0,0 +1,292 @@
+"""
+Module to profile the phases of a guest boot from the host side.
+
+The serial console log of the VM is tailed in background while the guest
+boots, each line is timestamped on the monotonic clock when it's read, and
+the first line matching each marker pattern marks a phase, e.g. the
+firmware, bootloader, kernel and init output. The host side marks, e.g.
+the start of the qemu process or the login, and the QMP events with their
+timestamps are added into the same timeline, so a boot is split into the
+time spent in qemu, the firmware and the guest.
+
+The serial lines before the RESET event of a reboot are the output of the
+shutdown, so the markers are matched only after the RESET event if it's
+received, or after the origin of the timeline.
+
+The kernel and init markers need the guest console on the serial port,
+e.g. console=ttyS0 in the kernel command line.
+
+Available classes:
+- BootTimeline: timestamps of the marks of one boot
+- BootProfiler: profile repeated boots of a VM
+
+Available functions:
+- parse_markers: parse the markers from a param string
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+from provider.perf_stats import summarize
+from provider.qmp_event_store import get_event_store
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+# marker name and pattern of the serial console lines, in boot order
+DEFAULT_MARKERS = (
+    ("firmware", r"\S"),
+    ("bootloader", r"GRUB|grub|Booting `|Loading Linux"),
+    ("kernel", r"Linux version \d"),
+    ("init", r"Run /\S+ as init process|systemd\[1\]|Welcome to "),
+    ("login_prompt", r"login:"),
+)
+
+
+def parse_markers(text):
+    """
+    Parse the markers from a param string, e.g.
+    "firmware:SeaBIOS|EDK II;kernel:Linux version"
+
+    :return: tuple of (name, pattern), DEFAULT_MARKERS if text is empty
+    """
+    if not text:
+        return DEFAULT_MARKERS
+    markers = []
+    for item in text.split(";"):
+        name, pattern = item.split(":", 1)
+        markers.append((name.strip(), pattern))
+    return tuple(markers)
+
+
+class BootTimeline(object):
+    """
+    Monotonic timestamps of the marks of one boot
+    """
+
+    def __init__(self, origin):
+        """
+        :param origin: name of the mark the phases start from
+        """
+        self.origin = origin
+        self.marks = dict()
+
+    def __contains__(self, name):
+        return name in self.marks
+
+    def __getitem__(self, name):
+        return self.marks[name]
+
+    def add(self, name, timestamp):
+        """Add a mark, the first timestamp of a name is kept"""
+        self.marks.setdefault(name, timestamp)
+
+    def elapsed(self, name):
+        """Seconds from the origin until a mark"""
+        return self.marks[name] - self.marks[self.origin]
+
+    def phases(self):
+        """
+        Get the phases, each phase lasts from the previous mark until its
+        mark, the marks before the origin are ignored
+
+        :return: list of (name, seconds) in time order
+        """
+        start = self.marks[self.origin]
+        marks = sorted(
+            (t, name)
+            for name, t in self.marks.items()
+            if t >= start and name != self.origin
+        )
+        phases = []
+        last = start
+        for timestamp, name in marks:
+            phases.append((name, timestamp - last))
+            last = timestamp
+        return phases
+
+
+class BootProfiler(object):
+    """
+    Profile repeated boots of a VM
+    Example of usage:
+        profiler = BootProfiler(vm)
+        for i in range(iterations):
+            profiler.begin("qemu_start")
+            vm.create()
+            profiler.mark("qemu_start", vm.start_monotonic_time)
+            profiler.mark("qemu_ready")
+            vm.wait_for_serial_login()
+            profiler.mark("login")
+            timeline = profiler.end()
+        profiler.report(test)
+    """
+
+    def __init__(self, vm, markers=DEFAULT_MARKERS, events=("RESET",), interval=0.02):
+        """
+        :param vm: VM object
+        :param markers: tuple of the marker name and pattern of the serial
+                        console lines
+        :param events: names of the QMP events added into the timeline
+        :param interval: seconds between two reads of the serial log
+        """
+        self.vm = vm
+        self.markers = [(name, re.compile(pattern)) for name, pattern in markers]
+        self.events = events
+        self.interval = interval
+        self.timelines = []
+        self.timeline = None
+        self._path = None
+        self._offset = 0
+        self._buffer = ""
+        self._store = None
+        self._cursor = 0
+        self._hits = dict()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _log_size(self):
+        path = self.vm.serial_console_log
+        if path and os.path.exists(path):
+            return path, os.path.getsize(path)
+        return path, 0
+
+    def _read_log(self):
+        """Read the new complete lines of the serial log"""
+        if self._path is None:
+            self._path = self.vm.serial_console_log
+            if self._path is None:
+                return []
+        try:
+            with open(self._path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except (IOError, OSError):
+            return []
+        self._offset += len(data)
+        lines = (self._buffer + data.decode(errors="replace")).split("\n")
+        self._buffer = lines.pop()
+        return lines
+
+    def _match(self, lines, timestamp):
+        for line in lines:
+            # the log lines are prefixed by the time of utils_logfile
+            line = line.split(": ", 1)[-1]
+            for name, pattern in self.markers:
+                if pattern.search(line):
+                    self._hits.setdefault(name, []).append(timestamp)
+
+    def _tail(self):
+        while not self._stop.is_set():
+            self._match(self._read_log(), time.monotonic())
+            self._stop.wait(self.interval)
+
+    def begin(self, origin, timestamp=None):
+        """
+        Start to profile a boot, should be called before the boot starts
+
+        :param origin: name of the mark the phases start from
+        :param timestamp: monotonic time of the origin mark if known now
+        """
+        self.timeline = BootTimeline(origin)
+        if timestamp is not None:
+            self.timeline.add(origin, timestamp)
+        self._path, self._offset = self._log_size()
+        self._buffer = ""
+        self._hits = dict()
+        # no monitor while the VM is down, the events of the next monitor
+        # are all after begin then
+        self._store, self._cursor = None, 0
+        try:
+            self._store = get_event_store(self.vm)
+            self._store.read_events()
+            self._cursor = self._store.cursor
+        except Exception as err:
+            LOG_JOB.debug("Failed to get QMP events: %s", err)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._tail)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def mark(self, name, timestamp=None):
+        """Add a host side mark, now by default"""
+        self.timeline.add(name, time.monotonic() if timestamp is None else timestamp)
+
+    def _add_events(self):
+        """Add the QMP events since begin into the timeline"""
+        try:
+            store = get_event_store(self.vm)
+            store.read_events()
+        except Exception as err:
+            LOG_JOB.debug("Failed to get QMP events: %s", err)
+            return
+        if store is not self._store:
+            # the VM was started again with a new monitor
+            self._store, self._cursor = store, 0
+        events, self._cursor = store.get_new_events(self._cursor)
+        # the QMP timestamps are wall clock time
+        offset = time.time() - time.monotonic()
+        for event in events:
+            if event.get("event") not in self.events:
+                continue
+            stamp = event.get("timestamp", {})
+            wall = stamp.get("seconds", 0) + stamp.get("microseconds", 0) / 1e6
+            self.timeline.add(event["event"].lower(), wall - offset)
+
+    def end(self):
+        """
+        Stop profiling the boot
+
+        :return: BootTimeline of the boot
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._match(self._read_log(), time.monotonic())
+        self._add_events()
+        timeline = self.timeline
+        floor = timeline.marks.get("reset", timeline.marks.get(timeline.origin))
+        for name, hits in self._hits.items():
+            hits = [t for t in hits if floor is None or t >= floor]
+            if hits:
+                timeline.add(name, hits[0])
+        self.timelines.append(timeline)
+        for name, seconds in timeline.phases():
+            LOG_JOB.info("Boot phase %s: %.3fs", name, seconds)
+        return timeline
+
+    def breakdown(self):
+        """
+        Get the statistics of the phases over the boots
+
+        :return: dict of phase name and the dict of summarize
+        """
+        durations = dict()
+        order = []
+        for timeline in self.timelines:
+            for name, seconds in timeline.phases():
+                if name not in durations:
+                    order.append(name)
+                durations.setdefault(name, []).append(seconds)
+        return {name: summarize(durations[name]) for name in order}
+
+    def report(self, test, prefix="boot"):
+        """
+        Log the phase breakdown, and write it in test keyvals
+        """
+        keyvals = {"%s--boots" % prefix: len(self.timelines)}
+        for name, stat in self.breakdown().items():
+            LOG_JOB.info(
+                "Boot phase %s: mean %.3fs, stdev %.3fs, min %.3fs, max %.3fs",
+                name,
+                stat["mean"],
+                stat["stdev"],
+                stat["min"],
+                stat["max"],
+            )
+            for key in ("mean", "stdev", "min", "max"):
+                keyvals["%s--%s_%s" % (prefix, name, key)] = "%.3f" % stat[key]
+        test.write_test_keyval(keyvals)
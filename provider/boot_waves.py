@@ -0,0 +1,268 @@
+"""
+Module to boot many VMs in concurrent waves.
+
+The VMs are cloned from a base VM and started in waves of a bounded size,
+the guests of a wave boot at the same time and a pool of login waiters
+waits for them, so N guests cost about N / wave_size boot times instead of
+N. After each wave, all the sessions are checked by one command sent to
+all of them concurrently.
+
+The boot latency of each VM (from the start of its qemu process until the
+first login) is recorded, as well as the time the host took to reach each
+number of running guests.
+
+Available classes:
+- BootRecord: boot timings of one VM
+- WaveBooter: boot clones of a VM in concurrent waves
+"""
+
+import collections
+import csv
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from virttest import env_process
+
+from provider.perf_stats import Series, summarize
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+
+class BootRecord(
+    collections.namedtuple(
+        "BootRecord", ["name", "wave", "started", "created", "logged_in", "error"]
+    )
+):
+    """
+    Boot timings of one VM on the monotonic clock, logged_in is None if
+    the VM failed to boot, with the error
+    """
+
+    __slots__ = ()
+
+    @property
+    def latency(self):
+        """Seconds from the start of the VM until the first login"""
+        if self.logged_in is None:
+            return None
+        return self.logged_in - self.started
+
+
+class WaveBooter(object):
+    """
+    Boot clones of a VM in concurrent waves
+    Example of usage:
+        booter = WaveBooter(test, params, env, vm, wave_size=10)
+        booter.add_session(vm, session)
+        booter.boot(max_vms)
+        booter.report()
+        booter.close()
+    """
+
+    def __init__(
+        self,
+        test,
+        params,
+        env,
+        base_vm,
+        wave_size,
+        login_workers=None,
+        login_timeout=420,
+    ):
+        """
+        :param test: test object
+        :param params: test params, the names of the new VMs are appended
+                       into params["vms"]
+        :param env: test env
+        :param base_vm: VM object to clone
+        :param wave_size: number of VMs started at the same time
+        :param login_workers: number of the login waiters, wave_size by
+                              default
+        :param login_timeout: timeout of the login of one VM
+        """
+        self.test = test
+        self.params = params
+        self.env = env
+        self.base_vm = base_vm
+        self.wave_size = wave_size
+        self.login_workers = login_workers or wave_size
+        self.login_timeout = login_timeout
+        self.records = []
+        self.sessions = collections.OrderedDict()
+        self.milestones = Series("running")
+        self._start = time.monotonic()
+
+    @property
+    def running(self):
+        """Number of the guests booted up"""
+        return len(self.sessions)
+
+    def add_session(self, vm, session, logged_in=None):
+        """
+        Add a booted VM, e.g. the base VM
+
+        :param logged_in: monotonic time of the first login, now by default
+        """
+        logged_in = time.monotonic() if logged_in is None else logged_in
+        self.sessions[vm.name] = session
+        self.milestones.append(self.running, logged_in - self._start)
+
+    def _create(self, name, wave):
+        """Clone and start a VM, return the VM and its record"""
+        started = time.monotonic()
+        vm_params = self.base_vm.params.copy()
+        vm = self.base_vm.clone(name, vm_params)
+        self.env.register_vm(name, vm)
+        env_process.preprocess_vm(self.test, vm_params, self.env, name)
+        self.params["vms"] += " " + name
+        return vm, BootRecord(name, wave, started, time.monotonic(), None, None)
+
+    def _login(self, vm):
+        session = vm.wait_for_login(timeout=self.login_timeout)
+        return session, time.monotonic()
+
+    def boot_wave(self, names, wave=0):
+        """
+        Boot a wave of VMs
+
+        The qemu processes are started one by one, since the VM creation
+        changes the shared env, then the boots are waited for by the pool
+        of login waiters.
+
+        :param names: names of the new VMs
+        :param wave: wave index recorded
+        :return: list of BootRecord
+        """
+        created = []
+        records = []
+        for name in names:
+            try:
+                created.append(self._create(name, wave))
+            except Exception as err:
+                LOG_JOB.error("Failed to start guest %s: %s", name, err)
+                now = time.monotonic()
+                records.append(BootRecord(name, wave, now, now, None, str(err)))
+                break
+        booted = []
+        with ThreadPoolExecutor(max_workers=self.login_workers) as pool:
+            futures = [
+                (vm, record, pool.submit(self._login, vm)) for vm, record in created
+            ]
+            for vm, record, future in futures:
+                try:
+                    session, logged_in = future.result()
+                except Exception as err:
+                    LOG_JOB.error("Failed to login guest %s: %s", vm.name, err)
+                    records.append(record._replace(error=str(err)))
+                    continue
+                booted.append((vm, session, record._replace(logged_in=logged_in)))
+        # count the running guests in the order they logged in
+        for vm, session, record in sorted(booted, key=lambda b: b[2].logged_in):
+            LOG_JOB.info("Guest %s booted up in %.2fs", vm.name, record.latency)
+            records.append(record)
+            self.add_session(vm, session, record.logged_in)
+        self.records.extend(records)
+        return records
+
+    def sweep(self, cmd, timeout=60):
+        """
+        Check all the sessions respond to a command, the command is run in
+        all the sessions concurrently
+
+        :return: dict of the VM name and error of the unresponsive guests
+        """
+
+        def _check(session):
+            session.cmd(cmd, timeout=timeout)
+
+        failures = dict()
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.login_workers) as pool:
+            futures = [
+                (name, pool.submit(_check, session))
+                for name, session in self.sessions.items()
+            ]
+            for name, future in futures:
+                try:
+                    future.result()
+                except Exception as err:
+                    failures[name] = str(err)
+        LOG_JOB.debug(
+            "Checked %d guests in %.2fs", len(self.sessions), time.monotonic() - start
+        )
+        return failures
+
+    def boot(self, max_vms, alive_cmd=None, prefix="vm"):
+        """
+        Boot VMs in waves until max_vms guests are running or a boot fails
+
+        :param max_vms: total number of guests, including the VMs added
+        :param alive_cmd: command to check all the guests after each wave
+        :param prefix: prefix of the names of the new VMs
+        :return: number of the guests running
+        """
+        wave = 0
+        while self.running < max_vms:
+            first = self.running + 1
+            last = min(max_vms, self.running + self.wave_size)
+            names = ["%s%d" % (prefix, num) for num in range(first, last + 1)]
+            LOG_JOB.info("Booting wave #%d: guest #%d - #%d", wave, first, last)
+            records = self.boot_wave(names, wave)
+            failed = [r for r in records if r.error]
+            if failed:
+                LOG_JOB.error("%d guests failed to boot in wave #%d", len(failed), wave)
+                break
+            if alive_cmd:
+                failures = self.sweep(alive_cmd)
+                if failures:
+                    for name, err in failures.items():
+                        LOG_JOB.error("Guest %s is unresponsive: %s", name, err)
+                    break
+            wave += 1
+        return self.running
+
+    def latencies(self):
+        """Get the boot latencies of the VMs booted by the waves"""
+        return [r.latency for r in self.records if r.latency is not None]
+
+    def report(self, filename="boot_waves.csv"):
+        """
+        Write the boot records into a csv file in test results dir, and the
+        latency percentiles and the time to reach the running guests in
+        test keyvals
+        """
+        path = os.path.join(self.test.resultsdir, filename)
+        with open(path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "wave", "start", "create", "latency", "error"])
+            for r in self.records:
+                writer.writerow(
+                    [
+                        r.name,
+                        r.wave,
+                        "%.3f" % (r.started - self._start),
+                        "%.3f" % (r.created - r.started),
+                        "" if r.latency is None else "%.3f" % r.latency,
+                        r.error or "",
+                    ]
+                )
+        keyvals = {"boot--running": self.running}
+        stat = summarize(self.latencies())
+        if stat["count"]:
+            for key in ("mean", "median", "p95", "max"):
+                keyvals["boot--latency_%s" % key] = "%.2f" % stat[key]
+        for count, elapsed in zip(self.milestones.values, self.milestones.times):
+            keyvals["boot--time_to_%d" % count] = "%.2f" % elapsed
+        self.test.write_test_keyval(keyvals)
+        LOG_JOB.info(
+            "%d guests running after %.2fs, boot records saved in %s",
+            self.running,
+            self.milestones.times[-1] if len(self.milestones) else 0.0,
+            path,
+        )
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
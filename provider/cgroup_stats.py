@@ -0,0 +1,340 @@
+"""
+Module to collect the cgroup statistics of VMs on host.
+
+The cgroup of each VM is resolved from /proc/<pid>/cgroup, the io, cpu and
+memory statistics files of the cgroups are kept open and re-read at a fixed
+interval in background, every metric is recorded as an array backed time
+series. The cgroup v2 files are read (io.stat, cpu.stat, memory.current),
+or the equivalent cgroup v1 files of the blkio, cpuacct and memory
+controllers for the controllers not enabled in cgroup v2, e.g. on a v1 or
+hybrid host.
+
+The counters give the rates of the VMs, and the shares of a metric between
+the VMs in a steady-state window, which are more precise than the outputs
+of the workloads in the guests.
+
+Available classes:
+- CgroupCollector: sample the cgroup statistics of VMs in background
+
+Available functions:
+- resolve_cgroups: get the cgroup directories of a process
+- read_stats: read the statistics of a cgroup once
+"""
+
+import csv
+import logging
+import os
+import threading
+import time
+
+from provider.perf_stats import Series
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+# cgroup v2 controller, file
+V2_FILES = (("io", "io.stat"), ("cpu", "cpu.stat"), ("memory", "memory.current"))
+# metrics of io.stat of cgroup v2
+IO_KEYS = ("rbytes", "wbytes", "rios", "wios")
+# cgroup v1 file, operation, metric
+V1_IO_FILES = (
+    ("blkio", "blkio.throttle.io_service_bytes", {"Read": "rbytes", "Write": "wbytes"}),
+    ("blkio", "blkio.throttle.io_serviced", {"Read": "rios", "Write": "wios"}),
+)
+# cgroup v1 controller, file equivalent to each cgroup v2 controller
+V1_FILES = {
+    "io": tuple((c, n) for c, n, _ in V1_IO_FILES),
+    "cpu": (("cpuacct", "cpuacct.usage"),),
+    "memory": (("memory", "memory.usage_in_bytes"),),
+}
+
+
+def _get_mounts():
+    """Get dict of the cgroup v1 controller or "" (v2) and its mount point"""
+    mounts = dict()
+    with open("/proc/mounts") as f:
+        for line in f:
+            fields = line.split()
+            if fields[2] == "cgroup2":
+                mounts.setdefault("", fields[1])
+            elif fields[2] == "cgroup":
+                for option in fields[3].split(","):
+                    mounts.setdefault(option, fields[1])
+    return mounts
+
+
+def resolve_cgroups(pid):
+    """
+    Get the cgroup directories of a process
+
+    :param pid: process id
+    :return: dict of the controller and the cgroup directory, the key is
+             "" for the cgroup v2 directory
+    """
+    mounts = _get_mounts()
+    cgroups = dict()
+    with open("/proc/%s/cgroup" % pid) as f:
+        for line in f:
+            _, controllers, path = line.rstrip("\n").split(":", 2)
+            for controller in controllers.split(",") if controllers else [""]:
+                controller = controller.replace("name=", "")
+                if controller in mounts:
+                    cgroups[controller] = os.path.join(
+                        mounts[controller], path.lstrip("/")
+                    )
+    return cgroups
+
+
+def _parse_v2(name, text, stats):
+    if name == "io.stat":
+        # 8:0 rbytes=1 wbytes=2 rios=3 wios=4 dbytes=0 dios=0
+        for key in IO_KEYS:
+            stats[key] = 0
+        for line in text.splitlines():
+            for item in line.split()[1:]:
+                key, _, value = item.partition("=")
+                if key in IO_KEYS:
+                    stats[key] += int(value)
+    elif name == "cpu.stat":
+        for line in text.splitlines():
+            key, value = line.split()
+            stats[key] = int(value)
+    else:
+        stats[name.replace(".", "_")] = int(text)
+
+
+def _parse_v1(name, text, stats):
+    for _, filename, operations in V1_IO_FILES:
+        if name != filename:
+            continue
+        for key in operations.values():
+            stats[key] = 0
+        for line in text.splitlines():
+            fields = line.split()
+            if len(fields) == 3 and fields[1] in operations:
+                stats[operations[fields[1]]] += int(fields[2])
+        return
+    if name == "cpuacct.usage":
+        stats["usage_usec"] = int(text) // 1000
+    elif name == "memory.usage_in_bytes":
+        stats["memory_current"] = int(text)
+
+
+def _v2_controllers(cgroups):
+    """Get the controllers enabled in the cgroup v2 of a process"""
+    if "" not in cgroups:
+        return []
+    try:
+        with open(os.path.join(cgroups[""], "cgroup.controllers")) as f:
+            return f.read().split()
+    except (IOError, OSError):
+        return []
+
+
+def _get_files(cgroups):
+    """
+    Get the list of (path, name, parser) of the statistics files, each
+    controller is read from cgroup v2 if it's enabled there, or else from
+    its cgroup v1 hierarchy
+    """
+    controllers = _v2_controllers(cgroups)
+    files = []
+    for controller, name in V2_FILES:
+        if controller in controllers:
+            files.append((os.path.join(cgroups[""], name), name, _parse_v2))
+            continue
+        for v1_controller, v1_name in V1_FILES[controller]:
+            if v1_controller in cgroups:
+                path = os.path.join(cgroups[v1_controller], v1_name)
+                files.append((path, v1_name, _parse_v1))
+    return files
+
+
+def read_stats(cgroups):
+    """
+    Read the statistics of a cgroup once
+
+    :param cgroups: dict of resolve_cgroups
+    :return: dict of the metric and value, e.g. rbytes, wbytes, rios, wios,
+             usage_usec, memory_current
+    """
+    stats = dict()
+    for path, name, parser in _get_files(cgroups):
+        try:
+            with open(path) as f:
+                parser(name, f.read().strip(), stats)
+        except (IOError, OSError, ValueError):
+            continue
+    return stats
+
+
+class CgroupCollector(object):
+    """
+    Sample the cgroup statistics of VMs in background
+    Example of usage:
+        collector = CgroupCollector(interval=0.5)
+        for vm in vms:
+            collector.add(vm.name, vm.get_pid())
+        collector.start()
+        time.sleep(test_time)
+        collector.stop()
+        shares = collector.shares("rbytes", warmup=5)
+    """
+
+    def __init__(self, interval=1.0):
+        """
+        :param interval: seconds between two samples
+        """
+        self.interval = interval
+        self.series = dict()
+        self._files = dict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, name, pid, cgroups=None):
+        """
+        Add a VM to sample, should be called after the VM is assigned into
+        its cgroup
+
+        :param name: VM name
+        :param pid: qemu process id
+        :param cgroups: dict of the controller and cgroup directory, resolved
+                        from pid by default
+        """
+        cgroups = cgroups or resolve_cgroups(pid)
+        files = []
+        for path, filename, parser in _get_files(cgroups):
+            try:
+                files.append((os.open(path, os.O_RDONLY), filename, parser))
+            except (IOError, OSError) as err:
+                LOG_JOB.debug("Can't open %s: %s", path, err)
+        with self._lock:
+            self._files[name] = files
+            self.series[name] = dict()
+        LOG_JOB.debug("Collect cgroup stats of %s from %s", name, cgroups)
+
+    def _read(self, files):
+        stats = dict()
+        for fd, filename, parser in files:
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                parser(filename, os.read(fd, 65536).decode().strip(), stats)
+            except (IOError, OSError, ValueError):
+                continue
+        return stats
+
+    def sample(self):
+        """Sample all the VMs once"""
+        with self._lock:
+            for name, files in self._files.items():
+                stats = self._read(files)
+                now = time.monotonic()
+                for key, value in stats.items():
+                    series = self.series[name].setdefault(key, Series(key))
+                    series.append(value, now)
+
+    def _run(self):
+        start = time.monotonic()
+        count = 0
+        while not self._stop.is_set():
+            self.sample()
+            count += 1
+            self._stop.wait(max(0, start + count * self.interval - time.monotonic()))
+
+    def start(self):
+        """Start sampling in background"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, the samples are kept"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """Stop sampling and close the statistics files"""
+        self.stop()
+        with self._lock:
+            for files in self._files.values():
+                for fd, _, _ in files:
+                    os.close(fd)
+            self._files.clear()
+
+    def mark(self):
+        """Get the current monotonic time to window the samples later"""
+        return time.monotonic()
+
+    def get_series(self, name, metric, start=None, end=None):
+        """
+        Get the samples of a metric of a VM in the window [start, end)
+
+        :return: Series, empty if the metric is not available
+        """
+        with self._lock:
+            series = self.series[name].get(metric, Series(metric))
+            return series.window(start, end)
+
+    def rate(self, name, metric, start=None, end=None, warmup=0):
+        """
+        Get the mean rate of a counter of a VM in a window, i.e. the
+        increase per second between the first and the last samples
+
+        :param warmup: seconds to skip from the start of the window
+        :return: float, 0 if less than 2 samples
+        """
+        series = self.get_series(name, metric, start, end).skip(warmup)
+        if len(series) < 2 or series.times[-1] <= series.times[0]:
+            return 0.0
+        return (series.values[-1] - series.values[0]) / (
+            series.times[-1] - series.times[0]
+        )
+
+    def rates(self, metric, start=None, end=None, warmup=0):
+        """Get dict of the VM name and its mean rate of a counter"""
+        with self._lock:
+            names = list(self.series)
+        return {name: self.rate(name, metric, start, end, warmup) for name in names}
+
+    def shares(self, metric, start=None, end=None, warmup=0):
+        """
+        Get the shares of a counter rate between the VMs
+
+        :return: dict of the VM name and its share in [0, 1]
+        """
+        rates = self.rates(metric, start, end, warmup)
+        total = sum(rates.values())
+        return {name: rate / total if total else 0.0 for name, rate in rates.items()}
+
+    def report(self, test, prefix="cgroup", filename="cgroup_stats.csv"):
+        """
+        Write the samples into a csv file in test results dir, and the mean
+        rates of the counters in test keyvals
+        """
+        path = os.path.join(test.resultsdir, filename)
+        keyvals = dict()
+        with self._lock:
+            with open(path, "w") as f:
+                writer = csv.writer(f)
+                writer.writerow(["name", "metric", "time", "value"])
+                for name, metrics in self.series.items():
+                    for metric, series in metrics.items():
+                        for value, timestamp in zip(series.values, series.times):
+                            writer.writerow(
+                                [name, metric, "%.3f" % timestamp, int(value)]
+                            )
+        for name, metrics in self.series.items():
+            for metric in metrics:
+                if metric == "memory_current":
+                    series = self.get_series(name, metric)
+                    keyvals["%s--%s--memory_max" % (prefix, name)] = int(
+                        max(series.values)
+                    )
+                    continue
+                rate = self.rate(name, metric)
+                keyvals["%s--%s--%s_rate" % (prefix, name, metric)] = "%.1f" % rate
+        test.write_test_keyval(keyvals)
+        LOG_JOB.info("Cgroup stats saved in %s", path)
@@ -0,0 +1,378 @@
+"""
+Module to place the VM threads and device IRQs on host CPUs.
+
+The host topology is read from sysfs, the vCPU threads, iothreads, vhost
+threads and device IRQs of a VM are pinned to the CPUs of one NUMA node by
+a placement policy:
+
+- node: the legacy placement of utils_test.qemu.pin_vm_threads, the vCPU
+        and vhost threads get one CPU of the node each, the iothreads and
+        IRQs get the CPUs left
+- core: every thread or IRQ gets a physical core of its own, the sibling
+        hyper-threads are only used when the cores run out
+- sibling: vCPU N and vhost thread N share the sibling hyper-threads of one
+           core, the iothreads and IRQs get cores of their own
+
+Available classes:
+- HostTopology: host CPU topology read from sysfs
+- VMPlacement: place the threads and IRQs of a VM on host CPUs
+
+Available functions:
+- numactl_prefix: numactl command prefix binding to a node
+- pin_vm_threads: pin vCPU and vhost threads to a node, the legacy way
+- place_vm_threads: place a VM by the test params and report it
+
+Typical usage:
+
+    placement = VMPlacement(vm, params.get("numa_node"), "sibling")
+    placement.apply()
+    placement.report(test)
+
+or by the params numa_node, pin_policy, pin_irq_patterns, pin_reserved_cpus:
+
+    placement = place_vm_threads(test, params, vm)
+"""
+
+import glob
+import logging
+import os
+import re
+
+from virttest import utils_misc, utils_test
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+SYSFS_CPU = "/sys/devices/system/cpu"
+SYSFS_NODE = "/sys/devices/system/node"
+PLACEMENT_POLICIES = ("node", "core", "sibling")
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def parse_cpu_list(cpu_list):
+    """
+    Parse a cpu list string, e.g. '0-3,8,10-11'
+
+    :return: list of int
+    """
+    cpus = []
+    for item in cpu_list.split(","):
+        if not item:
+            continue
+        if "-" in item:
+            start, end = item.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(item))
+    return cpus
+
+
+def format_cpu_list(cpus):
+    """Format cpus into a cpu list string, e.g. [0, 1, 2, 8] -> '0-2,8'"""
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(
+        str(start) if start == end else "%d-%d" % (start, end) for start, end in ranges
+    )
+
+
+class HostTopology(object):
+    """
+    Host CPU topology read from sysfs
+    """
+
+    def __init__(self, sysfs_cpu=SYSFS_CPU, sysfs_node=SYSFS_NODE):
+        self.online_cpus = parse_cpu_list(_read(os.path.join(sysfs_cpu, "online")))
+        self.siblings = dict()
+        self.packages = dict()
+        for cpu in self.online_cpus:
+            topology = os.path.join(sysfs_cpu, "cpu%d" % cpu, "topology")
+            self.siblings[cpu] = tuple(
+                parse_cpu_list(_read(os.path.join(topology, "thread_siblings_list")))
+            )
+            self.packages[cpu] = int(
+                _read(os.path.join(topology, "physical_package_id"))
+            )
+        self.nodes = dict()
+        for path in glob.glob(os.path.join(sysfs_node, "node[0-9]*")):
+            node = int(re.search(r"node(\d+)$", path).group(1))
+            cpus = parse_cpu_list(_read(os.path.join(path, "cpulist")))
+            self.nodes[node] = [cpu for cpu in cpus if cpu in self.siblings]
+        if not self.nodes:
+            self.nodes[0] = list(self.online_cpus)
+
+    def node_cores(self, node, exclude=()):
+        """
+        Get the physical cores of a node
+
+        :param node: node id
+        :param exclude: cpus not to use
+        :return: list of the tuples of sibling cpus, one tuple per core
+        """
+        cores = []
+        seen = set()
+        for cpu in self.nodes[node]:
+            if cpu in seen:
+                continue
+            core = tuple(c for c in self.siblings[cpu] if c not in exclude)
+            seen.update(self.siblings[cpu])
+            if core:
+                cores.append(core)
+        return cores
+
+
+def numactl_prefix(node):
+    """
+    Get the numactl command prefix binding cpus and memory to a node
+
+    :param node: numa_node param, abs(node) - 1 is the node id
+    """
+    n = abs(int(node)) - 1
+    return "numactl --cpunodebind=%s --membind=%s " % (n, n)
+
+
+def pin_vm_threads(vm, node):
+    """
+    Pin vCPU and vhost threads to the cpus of a numa node, the legacy way
+
+    :param vm: VM object
+    :param node: numa node index or NumaNode object, nothing done if None
+    :return: NumaNode object or None
+    """
+    if node:
+        if not isinstance(node, utils_misc.NumaNode):
+            node = utils_misc.NumaNode(int(node))
+        utils_test.qemu.pin_vm_threads(vm, node)
+
+    return node
+
+
+class VMPlacement(object):
+    """
+    Place the vCPU threads, iothreads, vhost threads and device IRQs of a VM
+    on the CPUs of one host numa node
+    """
+
+    def __init__(
+        self,
+        vm,
+        node,
+        policy="node",
+        irq_patterns=(),
+        reserved_cpus=(),
+        topology=None,
+    ):
+        """
+        :param vm: VM object
+        :param node: numa_node param or NumaNode object
+        :param policy: placement policy in PLACEMENT_POLICIES
+        :param irq_patterns: patterns of the IRQ names in /proc/interrupts
+                             to pin, e.g. the host NIC or nvme name
+        :param reserved_cpus: cpus not to use, e.g. for housekeeping
+        :param topology: HostTopology object, read from sysfs by default
+        """
+        if policy not in PLACEMENT_POLICIES:
+            raise ValueError("Unknown placement policy: %s" % policy)
+        self.vm = vm
+        if not isinstance(node, utils_misc.NumaNode):
+            node = utils_misc.NumaNode(int(node))
+        self.numa_node = node
+        self.policy = policy
+        self.irq_patterns = list(irq_patterns)
+        self.reserved_cpus = set(reserved_cpus)
+        self.topology = topology or HostTopology()
+        self.placement = dict()
+
+    @property
+    def node_id(self):
+        return int(self.numa_node.node_id)
+
+    @property
+    def used_cpus(self):
+        """Set of the cpus the threads and IRQs are placed on"""
+        return set(
+            cpu for cpus in self.placement.values() for cpu in parse_cpu_list(cpus)
+        )
+
+    def get_iothreads(self):
+        """Get dict of iothread id and thread id"""
+        try:
+            iothreads = self.vm.monitor.cmd("query-iothreads")
+        except Exception as err:
+            LOG_JOB.debug("Failed to query iothreads: %s", err)
+            return dict()
+        return {t["id"]: t["thread-id"] for t in iothreads}
+
+    def get_irqs(self):
+        """Get dict of IRQ number and name matching irq_patterns"""
+        irqs = dict()
+        if not self.irq_patterns:
+            return irqs
+        with open("/proc/interrupts") as f:
+            lines = f.read().splitlines()
+        for line in lines[1:]:
+            fields = line.split()
+            if not fields or not fields[0].rstrip(":").isdigit():
+                continue
+            name = fields[-1]
+            if any(re.search(p, name) for p in self.irq_patterns):
+                irqs[int(fields[0].rstrip(":"))] = name
+        return irqs
+
+    def _get_tasks(self):
+        """Get the list of (kind, name, id) to place, in placement order"""
+        tasks = [("vcpu", str(i), t) for i, t in enumerate(self.vm.vcpu_threads)]
+        vhosts = [("vhost", str(i), t) for i, t in enumerate(self.vm.vhost_threads)]
+        if self.policy == "sibling":
+            # vhost thread N shares the core with vCPU N
+            paired = []
+            for i, task in enumerate(tasks):
+                paired.append(task)
+                if i < len(vhosts):
+                    paired.append(vhosts[i])
+            tasks = paired + vhosts[len(tasks) :]
+        else:
+            tasks.extend(vhosts)
+        tasks.extend(("iothread", i, t) for i, t in self.get_iothreads().items())
+        tasks.extend(("irq", str(i), i) for i in self.get_irqs())
+        return tasks
+
+    def _get_cpu_order(self):
+        """Get the cpus of the node in the order to assign"""
+        cores = self.topology.node_cores(self.node_id, self.reserved_cpus)
+        if not cores:
+            raise ValueError("No cpu available on node %s" % self.node_id)
+        if self.policy == "sibling":
+            return [cpu for core in cores for cpu in core]
+        # primary threads of all cores first, then the siblings
+        width = max(len(core) for core in cores)
+        return [core[i] for i in range(width) for core in cores if i < len(core)]
+
+    def _pin(self, kind, tid, cpus):
+        if kind == "irq":
+            with open("/proc/irq/%s/smp_affinity_list" % tid, "w") as f:
+                f.write(format_cpu_list(cpus))
+        else:
+            os.sched_setaffinity(int(tid), cpus)
+
+    def _get_affinity(self, kind, tid):
+        if kind == "irq":
+            return parse_cpu_list(_read("/proc/irq/%s/smp_affinity_list" % tid))
+        return sorted(os.sched_getaffinity(int(tid)))
+
+    def _get_pinned_cpus(self, tasks, kinds):
+        """Get the set of the cpus the tasks of kinds are pinned to"""
+        pinned = set()
+        for kind, _, tid in tasks:
+            if kind not in kinds:
+                continue
+            try:
+                affinity = self._get_affinity(kind, tid)
+            except (IOError, OSError):
+                continue
+            if len(affinity) == 1:
+                pinned.update(affinity)
+        return pinned
+
+    def apply(self):
+        """
+        Pin the threads and IRQs by the policy
+
+        :return: dict of "kind_name" and the cpu list string applied
+        """
+        tasks = self._get_tasks()
+        cpus = self._get_cpu_order()
+        if self.policy == "node":
+            pin_vm_threads(self.vm, self.numa_node)
+            # the iothreads and IRQs only get the cpus the vCPU and vhost
+            # threads didn't take, they are left alone if none is left
+            taken = self._get_pinned_cpus(tasks, ("vcpu", "vhost"))
+            cpus = [cpu for cpu in cpus if cpu not in taken]
+            tasks = [t for t in tasks if t[0] in ("iothread", "irq")]
+            if tasks and not cpus:
+                LOG_JOB.warning(
+                    "No cpu left on node %s for the iothreads and IRQs", self.node_id
+                )
+                tasks = []
+        for i, (kind, name, tid) in enumerate(tasks):
+            cpu = cpus[i % len(cpus)]
+            try:
+                self._pin(kind, tid, [cpu])
+            except (IOError, OSError) as err:
+                LOG_JOB.warning(
+                    "Failed to pin %s %s to cpu %s: %s", kind, name, cpu, err
+                )
+        if len(tasks) > len(cpus):
+            LOG_JOB.warning(
+                "%d tasks share %d cpus of node %s", len(tasks), len(cpus), self.node_id
+            )
+        self.placement = self.get_placement()
+        return self.placement
+
+    def get_placement(self):
+        """Get the current cpu affinity of the threads and IRQs"""
+        placement = dict()
+        for kind, name, tid in self._get_tasks():
+            try:
+                affinity = self._get_affinity(kind, tid)
+            except (IOError, OSError):
+                continue
+            placement["%s_%s" % (kind, name)] = format_cpu_list(affinity)
+        return placement
+
+    def report(self, test=None):
+        """
+        Log the placement, and write it in test keyvals if test is given
+        """
+        placement = self.placement or self.get_placement()
+        for key, cpus in sorted(placement.items()):
+            LOG_JOB.info("Placement of %s: cpu %s", key, cpus)
+        if test is not None:
+            prefix = "placement--%s--" % self.vm.name
+            keyvals = {prefix + k: v for k, v in placement.items()}
+            keyvals[prefix + "policy"] = self.policy
+            keyvals[prefix + "node"] = self.node_id
+            test.write_test_keyval(keyvals)
+
+
+def place_vm_threads(test, params, vm, node=None, reserved_cpus=()):
+    """
+    Place the threads and IRQs of a VM by the params, and report the
+    placement in the test keyvals
+
+    Params used:
+    - numa_node: host numa node, nothing done if not set
+    - pin_policy: placement policy in PLACEMENT_POLICIES, node by default
+    - pin_irq_patterns: patterns of the host IRQ names to pin
+    - pin_reserved_cpus: cpu list not to use, e.g. 0-1
+
+    :param test: test object, keyvals not written if None
+    :param params: test params
+    :param vm: VM object
+    :param node: NumaNode object used instead of numa_node param, e.g. to
+                 place the second VM on the node of the first one
+    :param reserved_cpus: cpus not to use besides pin_reserved_cpus, e.g.
+                          the used_cpus of the first VM
+    :return: VMPlacement object or None
+    """
+    node = node or params.get("numa_node")
+    if not node:
+        return None
+    reserved = set(parse_cpu_list(params.get("pin_reserved_cpus", "")))
+    placement = VMPlacement(
+        vm,
+        node,
+        params.get("pin_policy", "node"),
+        params.objects("pin_irq_patterns"),
+        reserved | set(reserved_cpus),
+    )
+    placement.apply()
+    placement.report(test)
+    return placement
@@ -0,0 +1,205 @@
+"""
+Module to parse the json output of fio.
+
+fio with --output-format=json prints one json document per run, the output
+of several runs (e.g. "fio ... && fio ...") is a stream of concatenated
+documents, which may be mixed with some plain text lines such as warnings.
+The documents are decoded one by one straight from the output buffer, and
+only the fields used by the tests are kept in compact records.
+
+Available classes:
+- FioJobResult: result of one fio job
+- FioResult: result of one fio run
+
+Available functions:
+- iter_fio_results: iterate over the results in a fio output
+- parse_fio_results: get the list of results in a fio output
+- split_fio_runs: split the results printed by fio --status-interval into
+                  the results of each run
+- get_interval_iops: get the per interval IOPS of a job from the results
+                     printed by fio --status-interval
+"""
+
+import collections
+import json
+
+from provider.perf_stats import Series
+
+_decoder = json.JSONDecoder()
+
+
+class FioJobResult(
+    collections.namedtuple(
+        "FioJobResult",
+        [
+            "jobname",
+            "read_iops",
+            "write_iops",
+            "read_bw",
+            "write_bw",
+            "read_lat_ns",
+            "write_lat_ns",
+            "ios",
+            "runtime",
+            "options",
+        ],
+    )
+):
+    """
+    Result of one fio job, bw is in KiB/s, lat_ns is the mean latency, ios
+    is the number of completed read and write IOs and runtime is the job
+    runtime in milliseconds
+    """
+
+    __slots__ = ()
+
+    @property
+    def iops(self):
+        return self.read_iops + self.write_iops
+
+    @property
+    def bw(self):
+        return self.read_bw + self.write_bw
+
+    @property
+    def lat_ns(self):
+        return self.read_lat_ns + self.write_lat_ns
+
+    @classmethod
+    def from_json(cls, job):
+        """
+        Create the record from a job object of fio json output
+
+        :param job: dict of one item in 'jobs'
+        """
+        read, write = job.get("read", {}), job.get("write", {})
+        return cls(
+            job["jobname"],
+            read.get("iops", 0),
+            write.get("iops", 0),
+            read.get("bw", 0),
+            write.get("bw", 0),
+            read.get("lat_ns", {}).get("mean", 0),
+            write.get("lat_ns", {}).get("mean", 0),
+            read.get("total_ios", 0) + write.get("total_ios", 0),
+            job.get("job_runtime", 0),
+            job.get("job options", {}),
+        )
+
+
+class FioResult(
+    collections.namedtuple(
+        "FioResult", ["global_options", "disk_name", "jobs", "timestamp_ms"]
+    )
+):
+    """
+    Result of one fio run, disk_name is the first device of 'disk_util',
+    jobs is the tuple of FioJobResult, timestamp_ms is the time the result
+    was printed in milliseconds since epoch
+    """
+
+    __slots__ = ()
+
+    @property
+    def filename(self):
+        """Directory or filename fio run on"""
+        options = self.global_options
+        return options.get("directory", options.get("filename"))
+
+    @classmethod
+    def from_json(cls, output):
+        """
+        Create the record from a decoded fio json output
+
+        :param output: dict of fio json output
+        """
+        disk_util = output.get("disk_util")
+        return cls(
+            output.get("global options", {}),
+            disk_util[0]["name"] if disk_util else None,
+            tuple(FioJobResult.from_json(job) for job in output.get("jobs", [])),
+            output.get("timestamp_ms", 0),
+        )
+
+
+def iter_fio_results(output):
+    """
+    Iterate over the results in fio output
+
+    :param output: fio output with option --output-format=json
+    :return: generator of FioResult
+    """
+    pos = output.find("{")
+    while pos != -1:
+        try:
+            document, end = _decoder.raw_decode(output, pos)
+        except ValueError:
+            # not a json document, e.g. "{" in a warning line
+            pos = output.find("{", pos + 1)
+            continue
+        if isinstance(document, dict) and "jobs" in document:
+            yield FioResult.from_json(document)
+        pos = output.find("{", end)
+
+
+def parse_fio_results(output):
+    """
+    Get the results in fio output
+
+    :param output: fio output with option --output-format=json
+    :return: list of FioResult
+    """
+    return list(iter_fio_results(output))
+
+
+def split_fio_runs(results):
+    """
+    Split the results printed by fio --status-interval into runs, e.g. the
+    output of "fio ... && fio ...", a new run starts when the runtime of the
+    first job goes backwards
+
+    :param results: list of FioResult in output order
+    :return: list of the lists of FioResult, the last one of each list is
+             the final result of the run
+    """
+    runs = []
+    prev_runtime = None
+    for result in results:
+        runtime = result.jobs[0].runtime if result.jobs else 0
+        if not runs or prev_runtime is None or runtime < prev_runtime:
+            runs.append([])
+        runs[-1].append(result)
+        prev_runtime = runtime
+    return runs
+
+
+def get_interval_iops(results, jobname, start=None):
+    """
+    Get the per interval IOPS of a job
+
+    With --status-interval fio prints the cumulative result of every
+    interval, the IOPS of an interval is computed from the deltas of the
+    completed IOs and runtime of two consecutive results.
+
+    :param results: list of FioResult in output order
+    :param jobname: job name
+    :param start: time in seconds since epoch, if set the samples are
+                  timestamped by the print time of results relative to it,
+                  which is a common time axis for the fio processes running
+                  on the same host
+    :return: Series of IOPS, timestamped by job runtime in seconds by default
+    """
+    iops = Series(jobname)
+    prev_ios = prev_runtime = 0
+    for result in results:
+        for job in result.jobs:
+            if job.jobname != jobname or job.runtime <= prev_runtime:
+                continue
+            elapsed = (job.runtime - prev_runtime) / 1000.0
+            if start is None:
+                timestamp = job.runtime / 1000.0
+            else:
+                timestamp = result.timestamp_ms / 1000.0 - start
+            iops.append((job.ios - prev_ios) / elapsed, timestamp)
+            prev_ios, prev_runtime = job.ios, job.runtime
+    return iops
@@ -0,0 +1,184 @@
+"""
+Module to probe the IOPS of host disks with fio and cache the results.
+
+The probe results are cached in a json file keyed by the disk serial, the
+host kernel release, the fio command and the probe mode, so the hosts
+running the performance tests many times a day do not probe the same disk
+again until the cached result expires.
+
+Available classes:
+- DiskIOPSCache: json file cache of the disk IOPS
+
+Available functions:
+- get_disk_serial: get the serial of the disk, or of the disk holding a file
+- probe_disk_iops: run fio and get the IOPS, optionally stop at convergence
+- get_disk_iops: get the IOPS from the cache or by probing the disk
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+
+from avocado.utils import process
+
+from provider.fio_parser import get_interval_iops, parse_fio_results
+from provider.perf_stats import is_stable, median
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+
+class DiskIOPSCache(object):
+    """
+    json file cache of the disk IOPS, shared by the test processes on the
+    same host, the file is locked while being updated.
+    """
+
+    def __init__(self, filename, ttl=86400):
+        """
+        :param filename: cache file path
+        :param ttl: seconds a cached result is valid
+        """
+        self.filename = filename
+        self.ttl = ttl
+
+    def _load(self, fd):
+        fd.seek(0)
+        try:
+            return json.load(fd)
+        except ValueError:
+            return dict()
+
+    def get(self, key):
+        """
+        Get the cached IOPS
+
+        :param key: cache key
+        :return: IOPS, or None if not cached or expired
+        """
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename) as fd:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            entry = self._load(fd).get(key)
+        if entry and time.time() - entry["time"] < self.ttl:
+            return entry["iops"]
+        return None
+
+    def set(self, key, iops):
+        """Cache the IOPS, and drop the expired entries"""
+        now = time.time()
+        with open(self.filename, "a+") as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            entries = self._load(fd)
+            entries = {k: v for k, v in entries.items() if now - v["time"] < self.ttl}
+            entries[key] = {"iops": iops, "time": now}
+            fd.seek(0)
+            fd.truncate()
+            json.dump(entries, fd, indent=2)
+
+
+def get_disk_serial(path):
+    """
+    Get the serial of the disk, for a regular file get the serial of the
+    disk holding it, for a partition or a device mapper volume get the
+    serial of the (first) disk under it.
+
+    :param path: disk device or file path
+    :return: serial string, or the device name if the disk has no serial
+    """
+    device = path
+    if not path.startswith("/dev/"):
+        if not os.path.exists(path):
+            path = os.path.dirname(path)
+        device = process.getoutput("findmnt -n -o SOURCE -T %s" % path).strip()
+    # the devices the device is built on, itself included, e.g.
+    # "vg-root lvm", "sda2 part", "sda disk"
+    out = process.getoutput("lsblk -s -n -r -o NAME,TYPE %s" % device)
+    for line in out.splitlines():
+        fields = line.split()
+        if fields[1:] == ["disk"]:
+            device = "/dev/%s" % fields[0]
+            break
+    out = process.getoutput("lsblk -n -d -o SERIAL,WWN %s" % device)
+    serials = [s for s in out.split() if s]
+    return serials[0] if serials else device
+
+
+def _get_cache_key(disk, cmd, fast=False, window=5, max_cv=0.05, **probe_args):
+    # the fast mode stops early, its result depends on the convergence args
+    mode = "fast:%s:%s" % (window, max_cv) if fast else "full"
+    return "%s:%s:%s:%s" % (
+        get_disk_serial(disk),
+        os.uname()[2],
+        hashlib.sha256(cmd.encode()).hexdigest(),
+        mode,
+    )
+
+
+def probe_disk_iops(cmd, fast=False, window=5, max_cv=0.05, poll_interval=0.5):
+    """
+    Run fio and get the IOPS of the first job.
+
+    In fast mode fio runs with --status-interval=1, it's stopped as soon
+    as the IOPS of the last 'window' intervals are stable, and the median
+    of them is returned.
+
+    :param cmd: fio command with --output-format=json
+    :param fast: stop fio once the IOPS converges
+    :param window: number of the interval samples to check convergence
+    :param max_cv: maximum coefficient of variation of the window
+    :param poll_interval: seconds between two reads of fio output
+    :return: IOPS
+    """
+    if not fast:
+        job = parse_fio_results(process.getoutput(cmd))[0].jobs[0]
+        return int(job.read_iops) + int(job.write_iops)
+
+    fio = process.SubProcess(cmd + " --status-interval=1", shell=True)
+    fio.start()
+    samples = []
+    try:
+        while fio.poll() is None:
+            time.sleep(poll_interval)
+            results = parse_fio_results(fio.get_stdout().decode())
+            if not results:
+                continue
+            samples = get_interval_iops(results, results[0].jobs[0].jobname).values
+            if is_stable(samples[-window:], max_cv, window):
+                LOG_JOB.debug("IOPS converged after %d samples", len(samples))
+                return int(median(samples[-window:]))
+    finally:
+        if fio.poll() is None:
+            fio.terminate()
+            fio.wait()
+    results = parse_fio_results(fio.get_stdout().decode())
+    if not results:
+        raise ValueError("No fio result found: %s" % fio.get_stdout().decode())
+    job = results[-1].jobs[0]
+    return int(job.read_iops) + int(job.write_iops)
+
+
+def get_disk_iops(cmd, disk, cache=None, fast=False, **probe_args):
+    """
+    Get the IOPS of the disk from cache, probe it if not cached.
+
+    :param cmd: fio command to probe the disk
+    :param disk: disk device or file path, used to build the cache key
+    :param cache: DiskIOPSCache object, None to always probe
+    :param fast: probe in fast mode, see probe_disk_iops
+    :return: IOPS
+    """
+    key = _get_cache_key(disk, cmd, fast, **probe_args) if cache else None
+    if cache:
+        iops = cache.get(key)
+        if iops is not None:
+            LOG_JOB.debug("Get cached IOPS of %s: %s", disk, iops)
+            return iops
+    iops = probe_disk_iops(cmd, fast, **probe_args)
+    LOG_JOB.debug("Probe IOPS of %s: %s", disk, iops)
+    if cache:
+        cache.set(key, iops)
+    return iops
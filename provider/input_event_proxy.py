@@ -1,6 +1,9 @@
+import base64
+import collections
 import json
 import logging
 import os
+import struct
 from queue import Queue
 
 from virttest import data_dir, utils_misc
@@ -19,6 +22,11 @@ class AgentMessageType:
     READY = "READY"
     EVENT = "EVENT"
     ERROR = "ERROR"
+    TABLES = "TABLES"
+
+
+# prefix of the plain lines carrying a batch of raw events
+BATCH_PREFIX = "@B "
 
 
 class AgentState:
@@ -66,6 +74,56 @@ class WheelEventData:
     ABS = "abs"
 
 
+InputEvent = collections.namedtuple(
+    "InputEvent", ["typeName", "codeName", "value", "timestamp"]
+)
+
+
+class EventDecoder(object):
+    """
+    Decode the batches of raw events sent by the Linux agent.
+
+    The event layout and the name tables are sent once by the agent, a
+    batch is unpacked by one struct.iter_unpack call and the names are
+    looked up by (type, code) in one dict.
+    """
+
+    def __init__(self, tables):
+        """
+        :param tables: content of the TABLES message
+        """
+        self._struct = struct.Struct(str(tables["format"]))
+        types = {int(k): v for k, v in tables["types"].items()}
+        self._names = {}
+        for etype, codes in tables["codes"].items():
+            etype = int(etype)
+            for code, name in codes.items():
+                self._names[(etype, int(code))] = (types[etype], name)
+        self._types = types
+
+    def _lookup(self, etype, code):
+        names = (self._types.get(etype, "UNKNOWN"), "UNKNOWN")
+        self._names[(etype, code)] = names
+        return names
+
+    def decode(self, data):
+        """
+        Decode a batch into event records
+
+        :param data: base64 encoded raw events
+        :return: list of InputEvent
+        """
+        names = self._names
+        lookup = self._lookup
+        events = []
+        for sec, usec, etype, code, value in self._struct.iter_unpack(
+            base64.b64decode(data)
+        ):
+            tname, cname = names.get((etype, code)) or lookup(etype, code)
+            events.append(InputEvent(tname, cname, value, sec * 10**6 + usec))
+        return events
+
+
 class _EventListener(object):
     """Base implementation for the event listener class."""
 
@@ -142,6 +200,9 @@ class _EventListener(object):
 
     def _parse_output(self, line):
         """Parse output of the agent."""
+        if line.startswith(BATCH_PREFIX):
+            self._parse_platform_batch(line[len(BATCH_PREFIX) :])
+            return
         try:
             message = json.loads(line)
         except:
@@ -159,6 +220,8 @@ class _EventListener(object):
             self._parse_platform_event(content)
         elif mtype == AgentMessageType.ERROR:
             self._report_error(content)
+        elif mtype == AgentMessageType.TABLES:
+            self._report_tables(content)
         else:
             LOG_JOB.error("Input event listener received unknown message")
 
@@ -172,10 +235,18 @@ class _EventListener(object):
         """Report errors."""
         pass
 
+    def _report_tables(self, content):
+        """Report the event tables of the agent."""
+        pass
+
     def _parse_platform_event(self, content):
         """Parse events of the certian platform."""
         raise NotImplementedError()
 
+    def _parse_platform_batch(self, line):
+        """Parse a batch of events of the certian platform."""
+        raise NotImplementedError()
+
 
 class EventListenerLinux(_EventListener):
     """Linux implementation for the event listener class."""
@@ -191,8 +262,9 @@ class EventListenerLinux(_EventListener):
     WHEELBACKWARD = 0xFFFFFFFF
 
     def __init__(self, vm):
-        super(EventListenerLinux, self).__init__(vm)
         self._buffers = {}
+        self._decoder = None
+        super(EventListenerLinux, self).__init__(vm)
 
     def _uninstall(self):
         cmd = " ".join(("rm", "-f", self.agent_target))
@@ -203,21 +275,30 @@ class EventListenerLinux(_EventListener):
         dev = content["device"]
         self._buffers[dev] = {}
 
+    def _report_tables(self, content):
+        self._decoder = EventDecoder(content)
+
+    def _parse_platform_batch(self, line):
+        dev, data = line.split(" ", 1)
+        for event in self._decoder.decode(data.strip()):
+            self._handle_event(dev, event.typeName, event.codeName, event.value)
+
     def _parse_platform_event(self, content):
         dev = content["device"]
         nevent = content["event"]
-        etype = nevent["typeName"]
-        value = nevent["value"]
+        self._handle_event(dev, nevent["typeName"], nevent["codeName"], nevent["value"])
+
+    def _handle_event(self, dev, etype, subtype, value):
+        """Compose the events until SYN_REPORT, then queue it."""
         ebuf = self._buffers[dev]
         if etype == "EV_SYN":
-            subtype = nevent["codeName"]
             if subtype == "SYN_REPORT":
                 # end of event, report it
                 ebuf[DevNameKey] = dev
                 self.events.put(ebuf)
                 ebuf = {EventTypeKey: EventType.UNKNOWN}
         elif etype == "EV_KEY":
-            keycode = nevent["codeName"]
+            keycode = subtype
             if value == self.KEYDOWN:
                 mtype = EventType.KEYDOWN
             elif value == self.KEYUP:
@@ -228,7 +309,6 @@ class EventListenerLinux(_EventListener):
                 ebuf[EventTypeKey] = mtype
             ebuf[KeyEventData.KEYCODE] = keycode
         elif etype == "EV_REL":
-            subtype = nevent["codeName"]
             if subtype in ("REL_X", "REL_Y"):
                 ebuf[EventTypeKey] = EventType.POINTERMOVE
                 if subtype.endswith("X"):
@@ -247,7 +327,6 @@ class EventListenerLinux(_EventListener):
                     ebuf[WheelEventData.HSCROLL] = 0
                 ebuf[WheelEventData.ABS] = 0
         elif etype == "EV_ABS":
-            subtype = nevent["codeName"]
             if subtype in ("ABS_X", "ABS_Y"):
                 ebuf[EventTypeKey] = EventType.POINTERMOVE
                 if subtype.endswith("X"):
@@ -263,7 +342,6 @@ class EventListenerLinux(_EventListener):
                 ebuf[WheelEventData.HSCROLL] = 0
                 ebuf[WheelEventData.ABS] = 1
         elif etype == "EV_MSC":
-            subtype = nevent["codeName"]
             if subtype == "MSC_SCAN":
                 ebuf[KeyEventData.SCANCODE] = value
         elif etype == "EV_LED":
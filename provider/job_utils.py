@@ -4,12 +4,47 @@ import time
 from avocado import fail_on
 from virttest import utils_misc
 
+from provider.qmp_event_store import get_event_store
+
 LOG_JOB = logging.getLogger("avocado.test")
 
 BLOCK_JOB_COMPLETED_EVENT = "BLOCK_JOB_COMPLETED"
 BLOCK_JOB_CANCELLED_EVENT = "BLOCK_JOB_CANCELLED"
 BLOCK_JOB_ERROR_EVENT = "BLOCK_JOB_ERROR"
 BLOCK_IO_ERROR_EVENT = "BLOCK_IO_ERROR"
+BLOCK_JOB_READY_EVENT = "BLOCK_JOB_READY"
+BLOCK_JOB_PENDING_EVENT = "BLOCK_JOB_PENDING"
+JOB_STATUS_CHANGE_EVENT = "JOB_STATUS_CHANGE"
+
+
+def get_job_event(vm, job_id, event_name):
+    """
+    Get the first event with the given name of the job
+
+    :param vm: VM object
+    :param job_id: job ID
+    :param event_name: job event name
+    :return: The event dict or None
+    """
+    # only JOB_STATUS_CHANGE and BLOCK_JOB_PENDING use 'id' for job ID
+    key = (
+        "id"
+        if event_name in (JOB_STATUS_CHANGE_EVENT, BLOCK_JOB_PENDING_EVENT)
+        else "device"
+    )
+    return get_event_store(vm).get_event(event_name, **{key: job_id})
+
+
+def get_job_status_by_event(vm, job_id):
+    """
+    Get the latest status of the job reported by JOB_STATUS_CHANGE
+
+    :param vm: VM object
+    :param job_id: job ID
+    :return: status string, or None if no status change was received
+    """
+    events = get_event_store(vm).get_events(JOB_STATUS_CHANGE_EVENT, id=job_id)
+    return events[-1]["data"]["status"] if events else None
 
 
 def get_job_status(vm, device):
@@ -44,38 +79,70 @@ def wait_until_job_status_match(vm, status, device, timeout):
 @fail_on
 def wait_until_block_job_completed(vm, job_id, timeout=900):
     """Block until block job completed"""
+    wait_until_block_jobs_completed(vm, [job_id], timeout)
+
 
-    def _wait_until_block_job_completed():
-        finished = False
-        status = get_job_status(vm, job_id)
+@fail_on
+def wait_until_block_jobs_completed(vm, job_ids, timeout=900):
+    """
+    Block until all the block jobs completed
+
+    Jobs in 'pending' state are finalized, jobs in 'ready' state are completed
+    and jobs in 'concluded' state are dismissed as soon as the status change
+    events are received, no 'query-jobs' is sent while waiting.
+
+    :param vm: VM object
+    :param job_ids: list of job IDs
+    :param timeout: blocked timeout
+    :return: dict of job ID and its BLOCK_JOB_COMPLETED event data
+    """
+    store = get_event_store(vm)
+    store.read_events()
+    waiting = list(job_ids)
+    handled = {job_id: None for job_id in waiting}
+    completed = dict()
+
+    def _handle_status(job_id, status):
+        if status == handled[job_id]:
+            return
+        handled[job_id] = status
         if status == "pending":
             block_job_finalize(vm, job_id)
-        if status == "ready":
+        elif status == "ready":
             try:
                 arguments = {"id": job_id}
                 vm.monitor.cmd("job-complete", arguments)
             except Exception as err:
                 LOG_JOB.debug("'job-complete' hit error: %s", err.data["desc"])
-        try:
-            for event in vm.monitor.get_events():
-                if event.get("event") != BLOCK_JOB_COMPLETED_EVENT:
-                    continue
-                data = event.get("data", dict())
-                if job_id in [data.get("id"), data.get("device")]:
-                    error = data.get("error")
-                    assert not error, "block backup job finished with error: %s" % error
-                    finished = True
-                    break
-        finally:
-            status = get_job_status(vm, job_id)
-            if status == "concluded":
+
+    for job_id in waiting:
+        if get_job_status_by_event(vm, job_id) is None:
+            # status changes may be cleared from monitor before waiting
+            _handle_status(job_id, get_job_status(vm, job_id))
+
+    def _wait_until_block_jobs_completed():
+        for job_id in waiting[:]:
+            status = get_job_status_by_event(vm, job_id)
+            if status is not None:
+                _handle_status(job_id, status)
+            event = get_job_event(vm, job_id, BLOCK_JOB_COMPLETED_EVENT)
+            if event is None:
+                continue
+            data = event.get("data", dict())
+            error = data.get("error")
+            assert not error, "block backup job finished with error: %s" % error
+            completed[job_id] = data
+            waiting.remove(job_id)
+            if get_job_status(vm, job_id) == "concluded":
                 block_job_dismiss(vm, job_id)
-        return finished
+        return not waiting
 
-    finished = utils_misc.wait_for(
-        _wait_until_block_job_completed, first=0.1, timeout=timeout
+    finished = store.wait_for(_wait_until_block_jobs_completed, timeout)
+    assert finished, "wait for block job %s complete event timeout in %s seconds" % (
+        ", ".join(waiting),
+        timeout,
     )
-    assert finished, "wait for block job complete event timeout in %s seconds" % timeout
+    return completed
 
 
 @fail_on
@@ -195,39 +262,28 @@ def get_event_by_condition(vm, event_name, tmo=30, **condition):
 
     :return: The event dict or None
     """
-    event = None
-    for i in range(tmo):
-        all_events = vm.monitor.get_events()
-        events = [e for e in all_events if e.get("event") == event_name]
-        if condition:
-            events = [
-                e
-                for e in events
-                if e.get("data")
-                and all(item in e["data"].items() for item in condition.items())
-            ]
-        if events:
-            event = events[0]
-            break
-        time.sleep(1)
-    return event
+    return get_event_store(vm).wait_for_event(event_name, tmo, **condition)
 
 
-def is_block_job_started(vm, jobid, tmo=10):
+def is_block_job_started(vm, jobid, tmo=10, step=0.2):
     """
     offset should be greater than 0 when block job starts,
     return True if offset > 0 in tmo, or return False
+
+    :param step: seconds between two queries of the job
     """
-    for i in range(tmo):
+    end_time = time.monotonic() + tmo
+    while True:
         job = get_block_job_by_id(vm, jobid)
         if not job:
             LOG_JOB.debug("job %s was not found", jobid)
             break
         elif job["offset"] > 0:
             return True
-        time.sleep(1)
-    else:
-        LOG_JOB.debug("block job %s never starts in %s", jobid, tmo)
+        if time.monotonic() >= end_time:
+            LOG_JOB.debug("block job %s never starts in %s", jobid, tmo)
+            break
+        time.sleep(step)
     return False
 
 
@@ -239,13 +295,16 @@ def check_block_jobs_started(vm, jobid_list, tmo=10):
     assert started, "Not all block jobs start successfully"
 
 
-def is_block_job_running(vm, jobid, tmo=200):
+def is_block_job_running(vm, jobid, tmo=200, step=0.2):
     """
     offset should keep increasing when block job keeps running,
     return True if offset increases in tmo, or return False
+
+    :param step: seconds between two queries of the job
     """
     offset = None
-    for i in range(tmo):
+    end_time = time.monotonic() + tmo
+    while True:
         job = get_block_job_by_id(vm, jobid)
         if not job:
             LOG_JOB.debug("job %s cancelled unexpectedly", jobid)
@@ -260,9 +319,10 @@ def is_block_job_running(vm, jobid, tmo=200):
                 offset = job["offset"]
         elif job["offset"] > offset:
             return True
-        time.sleep(1)
-    else:
-        LOG_JOB.debug("offset never changed for block job %s in %s", jobid, tmo)
+        if time.monotonic() >= end_time:
+            LOG_JOB.debug("offset never changed for block job %s in %s", jobid, tmo)
+            break
+        time.sleep(step)
     return False
 
 
@@ -274,15 +334,18 @@ def check_block_jobs_running(vm, jobid_list, tmo=200):
     assert running, "Not all block jobs are running"
 
 
-def is_block_job_paused(vm, jobid, tmo=50):
+def is_block_job_paused(vm, jobid, tmo=50, step=0.2):
     """
     offset should stay the same when block job paused,
     return True if offset never changed in tmo, or return False
+
+    :param step: seconds between two queries of the job
     """
     offset = None
     time.sleep(10)
 
-    for i in range(tmo):
+    end_time = time.monotonic() + tmo
+    while time.monotonic() < end_time:
         job = get_block_job_by_id(vm, jobid)
         if not job:
             LOG_JOB.debug("job %s cancelled unexpectedly", jobid)
@@ -295,7 +358,7 @@ def is_block_job_paused(vm, jobid, tmo=50):
         elif offset != job["offset"]:
             LOG_JOB.debug("offset %s changed for job %s in %s", offset, jobid, tmo)
             return False
-        time.sleep(1)
+        time.sleep(step)
     return True
 
 
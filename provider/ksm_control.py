@@ -0,0 +1,258 @@
+"""
+Module to drive the KSM allocators in guests and sample the host KSM.
+
+The allocator commands are sent to all the guest sessions first, then the
+outputs of the sessions are waited for in parallel, so a phase takes the
+time of the slowest guest instead of the sum of all guests.
+
+The KSM counters in sysfs are kept open and re-read by pread in a
+background thread, every counter is recorded as a time series, which
+gives the merge rate and the convergence time of the phases.
+
+Available classes:
+- KSMSampler: sample the host KSM counters in background
+- AllocatorGroup: drive ksm_overcommit_guest.py in several sessions at once
+"""
+
+import csv
+import logging
+import os
+import threading
+import time
+
+import aexpect
+from virttest import utils_misc
+
+from provider.perf_stats import Series
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+KSM_SYSFS = "/sys/kernel/mm/ksm"
+ALLOCATOR_PATTERNS = ["PASS:", "FAIL:"]
+
+
+class KSMSampler(object):
+    """
+    Sample all the KSM counters in sysfs in background
+    Example of usage:
+        sampler = KSMSampler(interval=0.5)
+        sampler.start()
+        sampler.mark("merge")
+        ...
+        sampler.convergence_time("merge", "pages_sharing", target)
+        sampler.stop()
+        sampler.report(test)
+    """
+
+    # tunables are not sampled
+    TUNABLES = (
+        "run",
+        "sleep_millisecs",
+        "pages_to_scan",
+        "merge_across_nodes",
+        "max_page_sharing",
+        "stable_node_chains_prune_millisecs",
+        "use_zero_pages",
+        "smart_scan",
+        "advisor_mode",
+        "advisor_max_cpu",
+        "advisor_min_pages_to_scan",
+        "advisor_max_pages_to_scan",
+        "advisor_target_scan_time",
+    )
+
+    def __init__(self, interval=1.0, sysfs=KSM_SYSFS):
+        """
+        :param interval: seconds between two samples
+        :param sysfs: KSM sysfs directory
+        """
+        self.interval = interval
+        self.series = dict()
+        self.marks = dict()
+        self._fds = dict()
+        for name in sorted(os.listdir(sysfs)):
+            path = os.path.join(sysfs, name)
+            if name in self.TUNABLES or not os.path.isfile(path):
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                int(os.pread(fd, 64, 0))
+            except (IOError, OSError, ValueError):
+                continue
+            self._fds[name] = fd
+            self.series[name] = Series(name)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def read(self, name):
+        """Read a counter now"""
+        return int(os.pread(self._fds[name], 64, 0))
+
+    def sample(self):
+        """Read all the counters in one pass"""
+        now = time.monotonic()
+        values = [(name, self.read(name)) for name in self._fds]
+        with self._lock:
+            for name, value in values:
+                self.series[name].append(value, now)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except (IOError, OSError, ValueError) as err:
+                LOG_JOB.debug("Failed to sample KSM counters: %s", err)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start sampling in background"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and close the counters"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def mark(self, phase):
+        """Mark the start time of a phase"""
+        self.marks[phase] = time.monotonic()
+
+    def get_series(self, name, phase=None):
+        """
+        Get the samples of a counter
+
+        :param phase: only the samples since the phase mark if given
+        :return: Series
+        """
+        with self._lock:
+            series = self.series[name]
+            start = self.marks[phase] if phase else None
+            return series.window(start)
+
+    def merge_rate(self, phase=None):
+        """
+        Get the pages_sharing increase per second
+
+        :return: Series of rates
+        """
+        return self.get_series("pages_sharing", phase).rates()
+
+    def wait_for(self, name, target, timeout, step=None):
+        """
+        Wait until a counter reaches the target
+
+        :return: the value of the counter, or None if timeout
+        """
+        step = step or self.interval
+
+        def _reached():
+            value = self.read(name)
+            return value if value >= target else None
+
+        return utils_misc.wait_for(_reached, timeout, 0.0, step)
+
+    def convergence_time(self, phase, name, target):
+        """
+        Get the seconds from the phase mark until the counter reached the
+        target, None if never reached
+        """
+        series = self.get_series(name, phase)
+        for value, timestamp in zip(series.values, series.times):
+            if value >= target:
+                return timestamp - self.marks[phase]
+        return None
+
+    def report(self, test, filename="ksm_stat.csv"):
+        """
+        Write all the samples into a csv file in test results dir, and the
+        summary of the counters in test keyvals
+        """
+        with self._lock:
+            names = sorted(self.series)
+            series = [self.series[name] for name in names]
+        if not series or not len(series[0]):
+            return
+        path = os.path.join(test.resultsdir, filename)
+        with open(path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["time"] + names)
+            start = series[0].times[0]
+            for i in range(len(series[0])):
+                row = ["%.3f" % (series[0].times[i] - start)]
+                row.extend(int(s.values[i]) for s in series)
+                writer.writerow(row)
+        keyvals = {"ksm--%s" % s.name: int(s.values[-1]) for s in series}
+        rates = self.merge_rate()
+        if len(rates):
+            stat = rates.summary()
+            keyvals["ksm--merge_rate_mean"] = "%.2f" % stat["mean"]
+            keyvals["ksm--merge_rate_max"] = "%.2f" % stat["max"]
+        test.write_test_keyval(keyvals)
+        LOG_JOB.info("KSM samples saved in %s", path)
+
+
+class AllocatorGroup(object):
+    """
+    Drive ksm_overcommit_guest.py in several sessions at once
+    """
+
+    def __init__(self, test, targets):
+        """
+        :param test: test object
+        :param targets: list of (vm, session)
+        """
+        self.test = test
+        self.targets = list(targets)
+
+    def _wait(self, vm, session, cmd, timeout):
+        try:
+            return session.read_until_last_line_matches(ALLOCATOR_PATTERNS, timeout)
+        except aexpect.ExpectProcessTerminatedError as details:
+            self.test.fail(
+                "Failed to execute command '%s' on ksm_overcommit_guest.py, "
+                "vm '%s': %s" % (cmd, vm.name, details)
+            )
+
+    def execute(self, commands, timeout):
+        """
+        Send the commands to all the sessions, then wait for the outputs
+        in parallel
+
+        :param commands: one command for all, or a list of command per target
+        :param timeout: timeout of each session
+        :return: list of (match index, data) in the order of targets
+        """
+        if isinstance(commands, str):
+            commands = [commands] * len(self.targets)
+        for (vm, session), cmd in zip(self.targets, commands):
+            LOG_JOB.debug(
+                "Executing '%s' on ksm_overcommit_guest.py loop, vm: %s", cmd, vm.name
+            )
+            session.sendline(cmd)
+        start = time.monotonic()
+        results = utils_misc.parallel(
+            [
+                (self._wait, (vm, session, cmd, timeout))
+                for (vm, session), cmd in zip(self.targets, commands)
+            ]
+        )
+        LOG_JOB.debug(
+            "%d allocators finished in %.2fs", len(results), time.monotonic() - start
+        )
+        return results
+
+    def start(self, timeout):
+        """Start the allocator in all the sessions"""
+        return self.execute(
+            "$(command -v python python3 | head -1) /tmp/ksm_overcommit_guest.py",
+            timeout,
+        )
@@ -0,0 +1,314 @@
+"""
+Module to sample the progress of a migration.
+
+The migration info of the monitor (query-migrate of QMP, or 'info migrate'
+of HMP) is sampled at a sub-second interval, or on the MIGRATION and
+MIGRATION_PASS events, every metric is recorded as an array backed time
+series on the monotonic clock. The series give the migration speed, and
+the analysis of the convergence, i.e. the dirty page rate of the guest
+against the migration bandwidth.
+
+The event mode needs the 'events' migration capability enabled, e.g. by
+migrate_capabilities = "{'events': 'on'}".
+
+Available classes:
+- MigrationSampler: sample the migration info of a VM
+
+Available functions:
+- parse_migrate_info: parse the migration info into status and metrics
+"""
+
+import csv
+import logging
+import os
+import re
+import threading
+import time
+
+import six
+from virttest import utils_misc
+
+from provider.perf_stats import Series
+from provider.qmp_event_store import get_event_store
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+MB = 1048576
+FINISHED_STATES = ("completed", "failed", "cancelled")
+MIGRATION_EVENTS = ("MIGRATION", "MIGRATION_PASS")
+
+# metric name: (QMP keys, HMP pattern, scale of HMP value to QMP unit)
+MIGRATION_METRICS = {
+    "transferred": (("ram", "transferred"), r"transferred ram: (\d+) kbytes", 1024),
+    "remaining": (("ram", "remaining"), r"remaining ram: (\d+) kbytes", 1024),
+    "total": (("ram", "total"), r"total ram: (\d+) kbytes", 1024),
+    "dirty_rate": (("ram", "dirty-pages-rate"), r"dirty pages rate: (\d+) pages", 1),
+    "pages_per_second": (("ram", "pages-per-second"), r"pages-per-second: (\d+)", 1),
+    "page_size": (("ram", "page-size"), r"page size: (\d+) kbytes", 1024),
+    "dirty_sync_count": (("ram", "dirty-sync-count"), r"dirty sync count: (\d+)", 1),
+    "mbps": (("ram", "mbps"), r"throughput: ([\d.]+) mbps", 1),
+    "expected_downtime": (
+        ("expected-downtime",),
+        r"expected downtime: (\d+) milliseconds",
+        1,
+    ),
+}
+
+
+def parse_migrate_info(info):
+    """
+    Parse the migration info of QMP or HMP
+
+    :param info: dict of query-migrate, or text of 'info migrate'
+    :return: tuple of status and dict of the metrics available, the sizes
+             are in bytes, the downtime in milliseconds
+    """
+    metrics = dict()
+    if isinstance(info, six.string_types):
+        match = re.search(r"Migration status: (\S+)", info)
+        status = match.group(1) if match else None
+        for name, (_, pattern, scale) in MIGRATION_METRICS.items():
+            match = re.search(pattern, info)
+            if match:
+                metrics[name] = float(match.group(1)) * scale
+        return status, metrics
+    status = info.get("status")
+    for name, (keys, _, _) in MIGRATION_METRICS.items():
+        value = info
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is not None:
+            metrics[name] = float(value)
+    return status, metrics
+
+
+class MigrationSampler(object):
+    """
+    Sample the migration info of a VM
+    Example of usage:
+        sampler = MigrationSampler(vm, interval=0.2)
+        vm.migrate(..., not_wait_for_migration=True)
+        sampler.wait_active(timeout)
+        sampler.run(duration)  # or start() and stop() in background
+        speed = sampler.speed().summary()
+        analysis = sampler.analyze()
+        sampler.report(test)
+    """
+
+    def __init__(self, vm, interval=1.0, use_events=False):
+        """
+        :param vm: source VM object
+        :param interval: seconds between two samples, or two event polls
+                         in the event mode
+        :param use_events: sample on the migration events instead of the
+                           interval
+        """
+        self.vm = vm
+        self.interval = interval
+        self.use_events = use_events
+        self.series = {name: Series(name) for name in MIGRATION_METRICS}
+        self.status = None
+        self.states = []
+        self.passes = Series("pass")
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_finished(self):
+        return self.status in FINISHED_STATES
+
+    def sample(self):
+        """
+        Sample the migration info once
+
+        :return: migration status
+        """
+        info = self.vm.monitor.info("migrate", debug=False)
+        now = time.monotonic()
+        status, metrics = parse_migrate_info(info)
+        with self._lock:
+            for name, value in metrics.items():
+                self.series[name].append(value, now)
+            if status != self.status:
+                self.states.append((now, status))
+            self.status = status
+        return status
+
+    def _poll_events(self):
+        """
+        Read the new migration events
+
+        :return: True if any new migration event
+        """
+        store = get_event_store(self.vm)
+        store.read_events()
+        events, self._cursor = store.get_new_events(self._cursor)
+        found = False
+        for event in events:
+            if event.get("event") not in MIGRATION_EVENTS:
+                continue
+            found = True
+            if event["event"] == "MIGRATION_PASS":
+                self.passes.append(event.get("data", {}).get("pass", 0))
+        return found
+
+    def _step(self):
+        if not self.use_events or self._poll_events():
+            self.sample()
+
+    def wait_active(self, timeout):
+        """
+        Wait until the migration is active, or already finished
+
+        :return: migration status, or None if timeout
+        """
+        if self.use_events:
+            store = get_event_store(self.vm)
+            store.read_events()
+            self._cursor = store.cursor
+
+        def _active():
+            status = self.sample()
+            return status if status == "active" or status in FINISHED_STATES else None
+
+        return utils_misc.wait_for(_active, timeout, 0.0, self.interval)
+
+    def run(self, duration):
+        """
+        Sample in foreground until the migration finishes or duration
+        elapses
+
+        :param duration: seconds to sample
+        :return: migration status
+        """
+        end_time = time.monotonic() + duration
+        while not self.is_finished and time.monotonic() < end_time:
+            self._step()
+            delay = min(self.interval, end_time - time.monotonic())
+            if delay > 0:
+                time.sleep(delay)
+        return self.status
+
+    def _run(self):
+        while not self._stop.is_set() and not self.is_finished:
+            try:
+                self._step()
+            except Exception as err:
+                LOG_JOB.debug("Failed to sample migration info: %s", err)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start sampling in background until the migration finishes"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling in background"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def get_series(self, name):
+        """Get a copy of the samples of a metric"""
+        with self._lock:
+            return self.series[name].window()
+
+    def speed(self, scale=MB):
+        """
+        Get the migration speed of the intervals
+
+        :param scale: unit of the speed in bytes, MB/s by default
+        :return: Series of the speed
+        """
+        rates = self.get_series("transferred").rates()
+        for i in range(len(rates.values)):
+            rates.values[i] /= scale
+        return rates
+
+    def analyze(self):
+        """
+        Analyze the convergence of the migration
+
+        The guest dirties memory at dirty_rate * page_size bytes/s, the
+        migration converges only if the bandwidth is higher, which shows
+        as the remaining ram decreasing over time.
+
+        :return: dict of
+            - duration: seconds sampled
+            - bandwidth: mean migration speed in bytes/s
+            - dirty_bandwidth: mean dirty page rate in bytes/s
+            - dirty_ratio: dirty_bandwidth / bandwidth
+            - remaining_slope: change of remaining ram in bytes/s
+            - converging: remaining ram decreases
+            - eta: seconds to transfer the remaining ram by its slope,
+                   None if not converging
+            - expected_downtime: the last expected downtime in ms
+            - passes: number of the dirty bitmap syncs
+            - status: migration status
+        """
+        transferred = self.get_series("transferred")
+        remaining = self.get_series("remaining")
+        dirty_rate = self.get_series("dirty_rate")
+        page_size = self.get_series("page_size")
+        result = {"status": self.status}
+        if len(transferred) > 1:
+            result["duration"] = transferred.times[-1] - transferred.times[0]
+        bandwidth = self.speed(1).summary().get("mean", 0.0)
+        result["bandwidth"] = bandwidth
+        if len(dirty_rate):
+            size = page_size.values[-1] if len(page_size) else 4096
+            dirty = dirty_rate.summary()["mean"] * size
+            result["dirty_bandwidth"] = dirty
+            result["dirty_ratio"] = dirty / bandwidth if bandwidth else float("inf")
+        if len(remaining) > 1:
+            slope = remaining.slope()
+            result["remaining_slope"] = slope
+            result["converging"] = slope < 0
+            result["eta"] = -remaining.values[-1] / slope if slope < 0 else None
+        for name in ("expected_downtime", "dirty_sync_count"):
+            series = self.get_series(name)
+            if len(series):
+                key = "passes" if name == "dirty_sync_count" else name
+                result[key] = int(series.values[-1])
+        if "passes" not in result and len(self.passes):
+            result["passes"] = int(self.passes.values[-1])
+        return result
+
+    def report(self, test, prefix="migration", filename=None):
+        """
+        Write the samples into a csv file in test results dir, the speed
+        and the analysis into test keyvals
+
+        :param prefix: prefix of the keyvals
+        :param filename: csv file name, "<prefix>_stat.csv" by default
+        """
+        with self._lock:
+            series = [s.window() for _, s in sorted(self.series.items()) if len(s)]
+        if not series:
+            return
+        times = sorted(set(t for s in series for t in s.times))
+        columns = [dict(zip(s.times, s.values)) for s in series]
+        path = os.path.join(test.resultsdir, filename or "%s_stat.csv" % prefix)
+        with open(path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["time"] + [s.name for s in series])
+            for t in times:
+                row = ["%.3f" % (t - times[0])]
+                row.extend(column.get(t, "") for column in columns)
+                writer.writerow(row)
+        keyvals = dict()
+        speed = self.speed().summary()
+        for key in ("mean", "min", "max", "p95"):
+            if key in speed:
+                keyvals["%s--speed_%s" % (prefix, key)] = "%.2f" % speed[key]
+        for key, value in self.analyze().items():
+            if isinstance(value, float):
+                value = "%.2f" % value
+            keyvals["%s--%s" % (prefix, key)] = value
+        test.write_test_keyval(keyvals)
+        LOG_JOB.info("Migration samples saved in %s", path)
@@ -1,9 +1,10 @@
 import logging
 import os
 
-import six
 from avocado.utils import process
-from virttest import data_dir, error_context, remote, utils_misc, utils_test
+from virttest import data_dir, error_context, remote
+
+from provider import cpu_placement, result_store
 
 LOG_JOB = logging.getLogger("avocado.test")
 
@@ -13,32 +14,28 @@ def pin_vm_threads(vm, node):
     pin vm threads to assigned node
 
     """
-    if node:
-        if not isinstance(node, utils_misc.NumaNode):
-            node = utils_misc.NumaNode(int(node))
-        utils_test.qemu.pin_vm_threads(vm, node)
-
-    return node
+    return cpu_placement.pin_vm_threads(vm, node)
 
 
 @error_context.context_aware
-def record_env_version(test, params, host, server_ctl, fd, test_duration):
+def record_env_version(test, params, host, server_ctl, store, test_duration):
     """
     Get host kernel/qemu/guest kernel version
 
+    :param store: ResultStore object to record the versions in
     """
     ver_cmd = params.get("ver_cmd", "rpm -q qemu-kvm")
     guest_ver_cmd = params.get("guest_ver_cmd", "uname -r")
 
-    test.write_test_keyval({"kvm-userspace-ver": ssh_cmd(host, ver_cmd).strip()})
-    test.write_test_keyval(
-        {"guest-kernel-ver": ssh_cmd(server_ctl, guest_ver_cmd).strip()}
-    )
+    qemu_ver = ssh_cmd(host, ver_cmd).strip()
+    guest_ver = ssh_cmd(server_ctl, guest_ver_cmd).strip()
+    test.write_test_keyval({"kvm-userspace-ver": qemu_ver})
+    test.write_test_keyval({"guest-kernel-ver": guest_ver})
     test.write_test_keyval({"session-length": test_duration})
-    fd.write("### kvm-userspace-ver : %s\n" % ssh_cmd(host, ver_cmd).strip())
-    fd.write("### guest-kernel-ver : %s\n" % ssh_cmd(server_ctl, guest_ver_cmd).strip())
-    fd.write("### kvm_version : %s\n" % os.uname()[2])
-    fd.write("### session-length : %s\n" % test_duration)
+    store.update_run(
+        qemu_version=qemu_ver, guest_version=guest_ver, host_version=os.uname()[2]
+    )
+    store.add_info("session-length", test_duration)
 
 
 def env_setup(test, params, session, ip, username, shell_port, password):
@@ -57,6 +54,11 @@ def env_setup(test, params, session, ip, username, shell_port, password):
 
     agent_path = os.path.join(test.virtdir, "scripts/netperf_agent.py")
     remote.scp_to_remote(ip, shell_port, username, password, agent_path, "/tmp")
+    if params.get("netperf_launcher", "no") == "yes":
+        launcher_path = os.path.join(
+            data_dir.get_deps_dir("netperf"), "netperf_launcher.py"
+        )
+        remote.scp_to_remote(ip, shell_port, username, password, launcher_path, "/tmp")
 
 
 def tweak_tuned_profile(params, server_ctl, client, host):
@@ -104,8 +106,7 @@ def netperf_thread(params, numa_enable, client_s, option, fname):
     """
     cmd = ""
     if numa_enable:
-        n = abs(int(params.get("numa_node"))) - 1
-        cmd += "numactl --cpunodebind=%s --membind=%s " % (n, n)
+        cmd += cpu_placement.numactl_prefix(params.get("numa_node"))
     cmd += option
     cmd += " >> %s" % fname
     LOG_JOB.info("Start netperf thread by cmd '%s'", cmd)
@@ -120,15 +121,7 @@ def format_result(result, base="17", fbase="2"):
     :param base: the length of converted string
     :param fbase: the decimal digit for float
     """
-    if isinstance(result, six.string_types):
-        value = "%" + base + "s"
-    elif isinstance(result, int):
-        value = "%" + base + "d"
-    elif isinstance(result, float):
-        value = "%" + base + "." + fbase + "f"
-    else:
-        raise TypeError(f"unexpected result type: {type(result).__name__}")
-    return value % result
+    return result_store.format_result(result, base, fbase)
 
 
 def netperf_record(results, filter_list, header=False, base="17", fbase="2"):
@@ -142,18 +135,4 @@ def netperf_record(results, filter_list, header=False, base="17", fbase="2"):
     :param base: the length of a variable
     :param fbase: the decimal digit for float
     """
-    key_list = []
-    for key in filter_list:
-        if key in results:
-            key_list.append(key)
-
-    record = ""
-    if header:
-        for key in key_list:
-            record += "%s|" % format_result(key, base=base, fbase=fbase)
-        record = record.rstrip("|")
-        record += "\n"
-    for key in key_list:
-        record += "%s|" % format_result(results[key], base=base, fbase=fbase)
-    record = record.rstrip("|")
-    return record, key_list
+    return result_store.format_record(results, filter_list, header, base, fbase)
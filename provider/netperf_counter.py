@@ -0,0 +1,163 @@
+"""
+Module to sample the guest network counters for netperf tests.
+
+The counter agent runs in guest in background, it reads the interface
+statistics, the TCP retransmissions and the virtio queue interrupts in one
+pass every interval and writes the deltas as json lines into a file, which
+is read back by one command when sampling stops. So only two commands are
+executed in guest during a netperf run.
+
+Available classes:
+- CounterAggregator: aggregate the samples of the agent
+- GuestCounterSampler: start and stop the agent in guest
+"""
+
+import json
+import logging
+import os
+
+from virttest import data_dir
+
+from provider import netperf_base
+from provider.perf_stats import Series
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+AGENT_SOURCE = os.path.join(
+    data_dir.get_deps_dir("netperf"), "netperf_counter_agent.py"
+)
+AGENT_TARGET = "/tmp/netperf_counter_agent.py"
+
+
+class CounterAggregator(object):
+    """
+    Aggregate the json lines printed by the counter agent
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.base = dict()
+        self.series = dict()
+        self._start = None
+
+    def feed(self, line):
+        """
+        Feed one line of the agent output, garbage lines are skipped
+
+        :param line: json line
+        """
+        try:
+            message = json.loads(line)
+            mtype, content = message["type"], message["content"]
+        except (ValueError, TypeError, KeyError):
+            return
+        if mtype == "BASE":
+            self.keys = content["keys"]
+            self.base = dict(zip(self.keys, content["values"]))
+            self.series = {key: Series(key) for key in self.keys}
+            self._start = content["t"]
+        elif mtype == "DELTA" and self.keys:
+            for key, delta in zip(self.keys, content["d"]):
+                self.series[key].append(delta, content["t"])
+        elif mtype == "ERROR":
+            LOG_JOB.error("Counter agent error: %s", content)
+
+    def feed_output(self, output):
+        """Feed the whole output of the agent"""
+        for line in output.splitlines():
+            self.feed(line)
+
+    def totals(self):
+        """
+        Get the total increase of each counter, and the sums of the rx and
+        tx queue interrupts
+
+        :return: dict of counter name and value
+        """
+        totals = {key: int(sum(series)) for key, series in self.series.items()}
+        for prefix in ("rx", "tx"):
+            queues = [k for k in self.keys if k.startswith("%s_intr_" % prefix)]
+            if queues:
+                totals["%s_intr_sum" % prefix] = sum(totals[k] for k in queues)
+        return totals
+
+    def rates(self):
+        """
+        Get the per second rates of each counter
+
+        :return: dict of counter name and Series of rates
+        """
+        rates = dict()
+        for key, series in self.series.items():
+            rate = Series(key)
+            prev = self._start
+            for delta, timestamp in zip(series.values, series.times):
+                if timestamp > prev:
+                    rate.append(delta / (timestamp - prev), timestamp)
+                prev = timestamp
+            rates[key] = rate
+        return rates
+
+    def report(self):
+        """Log the mean and max rates of each counter"""
+        for key, rate in sorted(self.rates().items()):
+            if len(rate):
+                stat = rate.summary()
+                LOG_JOB.debug(
+                    "%s rate: mean %.2f/s max %.2f/s", key, stat["mean"], stat["max"]
+                )
+
+
+class GuestCounterSampler(object):
+    """
+    Start and stop the counter agent in guest, the agent should be copied
+    to AGENT_TARGET in guest before.
+    Example of usage:
+        sampler = GuestCounterSampler(server_ctl, server_ip)
+        sampler.start()
+        ...
+        aggregator = sampler.stop()
+        ret.update(aggregator.totals())
+    """
+
+    def __init__(self, session, address, interval=1, python_bin=None):
+        """
+        :param session: session to the guest
+        :param address: IPv4 address of the sampled interface
+        :param interval: sampling interval in seconds
+        :param python_bin: python in guest
+        """
+        self._session = session
+        self.address = address
+        self.interval = interval
+        self.python_bin = python_bin or "`command -v python3 python | head -1`"
+        self.output = "/tmp/netperf_counters.%s.json" % os.getpid()
+        self._pid = None
+
+    def start(self):
+        """Start the agent in background"""
+        cmd = "%s %s -a %s -i %s > %s 2>&1 & echo $!" % (
+            self.python_bin,
+            AGENT_TARGET,
+            self.address,
+            self.interval,
+            self.output,
+        )
+        self._pid = netperf_base.ssh_cmd(self._session, cmd).split()[-1]
+        LOG_JOB.debug("Started counter agent %s in guest", self._pid)
+
+    def stop(self):
+        """
+        Stop the agent and read back its output
+
+        :return: CounterAggregator object
+        """
+        cmd = (
+            "kill {0}; while kill -0 {0} 2>/dev/null; do sleep 0.1; done;"
+            " cat {1}; rm -f {1}"
+        ).format(self._pid, self.output)
+        output = netperf_base.ssh_cmd(self._session, cmd, ignore_status=True)
+        self._pid = None
+        aggregator = CounterAggregator()
+        aggregator.feed_output(output)
+        return aggregator
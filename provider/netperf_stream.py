@@ -0,0 +1,203 @@
+"""
+Module to launch netperf clients behind a start barrier and stream results.
+
+The launcher (deps/netperf/netperf_launcher.py) runs on the client, it
+forks the netperf instances blocked on a barrier and releases them at the
+same time, then multiplexes the interim results of all the instances into
+json lines. The lines are read on host while the test is running, and the
+steady-state throughput is computed incrementally from the aggregated
+interim results after the warm-up time.
+
+Available classes:
+- ThroughputAggregator: aggregate the interim results of the instances
+- NetperfLauncher: run the launcher on the client and stream its output
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+from avocado.utils import process
+from virttest import data_dir, utils_misc
+
+from provider.perf_stats import is_stable
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+LAUNCHER_SOURCE = os.path.join(data_dir.get_deps_dir("netperf"), "netperf_launcher.py")
+LAUNCHER_TARGET = "/tmp/netperf_launcher.py"
+
+
+class ThroughputAggregator(object):
+    """
+    Aggregate the interim results of netperf instances
+
+    A sample of the total throughput is made once every instance reported
+    a new interim result, it's the sum of the latest results. The samples
+    in the warm-up time are dropped, the others are kept in a ring buffer
+    and summed up on arrival, so the steady-state throughput is ready
+    at any time without going through all the results.
+    """
+
+    def __init__(self, instances, warmup=0, ring_size=600):
+        """
+        :param instances: number of netperf instances
+        :param warmup: seconds to drop the samples since the barrier released
+        :param ring_size: number of the latest samples kept
+        """
+        self.instances = instances
+        self.warmup = warmup
+        self.samples = collections.deque(maxlen=ring_size)
+        self.up = False
+        self.done = False
+        self.lines = []
+        self._start = None
+        self._latest = dict()
+        self._pending = set()
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def feed(self, line):
+        """Feed one json line of the launcher output"""
+        try:
+            message = json.loads(line)
+            mtype, content = message["type"], message["content"]
+        except (ValueError, TypeError, KeyError):
+            return
+        with self._lock:
+            if mtype == "READY":
+                self._start = content["t"]
+            elif mtype == "UP":
+                self.up = True
+            elif mtype == "INTERIM":
+                self._add_interim(content["i"], content["t"], content["v"])
+            elif mtype == "LINE":
+                self.lines.append(content["l"])
+            elif mtype == "DONE":
+                self.done = True
+
+    def _add_interim(self, instance, timestamp, value):
+        self._latest[instance] = value
+        self._pending.add(instance)
+        if len(self._pending) < self.instances:
+            return
+        self._pending.clear()
+        total = sum(self._latest.values())
+        if self._start is not None and timestamp - self._start < self.warmup:
+            return
+        self.samples.append((timestamp, total))
+        self._sum += total
+        self._count += 1
+
+    @property
+    def throughput(self):
+        """Mean total throughput after the warm-up time, 0 if no sample"""
+        with self._lock:
+            return self._sum / self._count if self._count else 0.0
+
+    @property
+    def count(self):
+        """Number of the samples after the warm-up time"""
+        with self._lock:
+            return self._count
+
+    def is_stable(self, max_cv, window=5):
+        """Check the last 'window' samples are stable"""
+        with self._lock:
+            values = [value for _, value in list(self.samples)[-window:]]
+        return is_stable(values, max_cv, window)
+
+
+class NetperfLauncher(object):
+    """
+    Run the launcher on the client and stream its output into the
+    aggregator, the launcher should be copied to LAUNCHER_TARGET before.
+    Example of usage:
+        launcher = NetperfLauncher(client, cmd, ThroughputAggregator(4, 5))
+        launcher.start()
+        if launcher.wait_up(30):
+            ...
+            stop netperf clients
+            launcher.wait_done(30)
+            throughput = launcher.aggregator.throughput
+    """
+
+    def __init__(self, client, cmd, aggregator, interval=0.2):
+        """
+        :param client: client session, or "localhost"
+        :param cmd: launcher command
+        :param aggregator: ThroughputAggregator object
+        :param interval: seconds between two reads of the output
+        """
+        self.client = client
+        self.cmd = cmd
+        self.aggregator = aggregator
+        self.interval = interval
+        self._proc = None
+        self._offset = 0
+        self._buffer = ""
+        self._stop = threading.Event()
+        self._reader = None
+
+    def _read(self):
+        """Read the new output of the launcher"""
+        if self._proc is not None:
+            output = self._proc.get_stdout().decode(errors="replace")
+            new, self._offset = output[self._offset :], len(output)
+            return new
+        try:
+            return self.client.read_nonblocking(self.interval, self.interval)
+        except Exception:
+            return ""
+
+    def poll(self):
+        """Feed the complete lines received since last poll"""
+        lines = (self._buffer + self._read()).split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self.aggregator.feed(line.strip())
+
+    def _stream(self):
+        while not self._stop.is_set() and not self.aggregator.done:
+            self.poll()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start the launcher and the reader thread"""
+        LOG_JOB.info("Start netperf launcher by cmd '%s'", self.cmd)
+        if self.client == "localhost":
+            self._proc = process.SubProcess(self.cmd, shell=True)
+            self._proc.start()
+        else:
+            self.client.sendline(self.cmd)
+        self._reader = threading.Thread(target=self._stream)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def wait_up(self, timeout):
+        """Wait until all the instances start to work"""
+        return utils_misc.wait_for(
+            lambda: self.aggregator.up, timeout, 0.0, self.interval
+        )
+
+    def wait_done(self, timeout):
+        """Wait until the launcher exits, then stop the reader thread"""
+        end_time = time.time() + timeout
+        while not self.aggregator.done and time.time() < end_time:
+            time.sleep(self.interval)
+        self.stop()
+        return self.aggregator.done
+
+    def stop(self):
+        """Stop the reader thread and the launcher if it's still running"""
+        self._stop.set()
+        if self._reader:
+            self._reader.join()
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+        elif self._proc is None and not self.aggregator.done:
+            self.client.sendcontrol("c")
@@ -0,0 +1,369 @@
+"""
+Module to provide statistics for performance tests.
+
+Samples are kept in array backed series, and all the statistics are
+computed in one pass over the sorted samples instead of mutating python
+lists sample by sample.
+
+Available classes:
+- Series: time series of float samples
+
+Available functions:
+- percentile: percentile of samples, linear interpolation between ranks
+- median: median of samples
+- coefficient_of_variation: stdev / mean of samples
+- confidence_interval: confidence interval of the mean of samples
+- trim_deviation: keep the samples nearest to the median
+- summarize: dict of the common statistics of samples
+- is_stable: check the samples are stable enough to stop sampling
+- mann_whitney_u: Mann-Whitney U test of two groups of samples
+- bootstrap_ci: bootstrap confidence interval of a statistic difference
+- linear_fit: least squares line of samples
+- slope_interval: confidence interval of the least squares slope
+"""
+
+import bisect
+import math
+import random
+import statistics
+import time
+from array import array
+
+
+class Series(object):
+    """
+    Time series of float samples
+    """
+
+    def __init__(self, name="", values=None, times=None):
+        """
+        :param name: name of the series
+        :param values: initial samples
+        :param times: timestamps of the initial samples, default to the
+                      sample index
+        """
+        self.name = name
+        self.values = array("d", values or [])
+        if times is None:
+            times = range(len(self.values))
+        self.times = array("d", times)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __repr__(self):
+        return "Series(%r, %d samples)" % (self.name, len(self))
+
+    def append(self, value, timestamp=None):
+        """
+        Append a sample
+
+        :param value: sample value
+        :param timestamp: sample time, default to time.monotonic()
+        """
+        self.values.append(value)
+        self.times.append(time.monotonic() if timestamp is None else timestamp)
+
+    def extend(self, series):
+        """Append the samples of another series"""
+        self.values.extend(series.values)
+        self.times.extend(series.times)
+
+    def rates(self):
+        """
+        Get the rate series of a cumulative counter series, e.g. the
+        transferred bytes to bytes per second
+
+        :return: Series of the deltas per time unit, timestamped at the end
+                 of each interval
+        """
+        rates = Series(self.name)
+        for i in range(1, len(self.values)):
+            elapsed = self.times[i] - self.times[i - 1]
+            if elapsed > 0:
+                rates.append(
+                    (self.values[i] - self.values[i - 1]) / elapsed, self.times[i]
+                )
+        return rates
+
+    def window(self, start=None, end=None):
+        """
+        Get the samples in the time window [start, end)
+
+        :return: Series
+        """
+        lo = 0 if start is None else bisect.bisect_left(self.times, start)
+        hi = len(self.times) if end is None else bisect.bisect_left(self.times, end)
+        return Series(self.name, self.values[lo:hi], self.times[lo:hi])
+
+    def skip(self, warmup):
+        """
+        Get the samples after the warm-up time
+
+        :param warmup: seconds to skip from the first sample
+        :return: Series
+        """
+        if not self.times:
+            return Series(self.name)
+        return self.window(self.times[0] + warmup)
+
+    def summary(self, confidence=0.95):
+        """Get the dict of the common statistics of the samples"""
+        return summarize(self.values, confidence)
+
+    def slope(self):
+        """Get the change of the samples per time unit by least squares"""
+        return linear_fit(self.times, self.values)[0]
+
+
+def percentile(values, pct, presorted=False):
+    """
+    Get the percentile of samples, interpolated linearly between ranks
+
+    :param values: samples
+    :param pct: percentile in [0, 100]
+    :param presorted: samples are already sorted
+    """
+    data = values if presorted else sorted(values)
+    if not data:
+        raise ValueError("percentile requires at least one sample")
+    rank = (len(data) - 1) * pct / 100.0
+    lo = int(math.floor(rank))
+    hi = min(lo + 1, len(data) - 1)
+    return data[lo] + (data[hi] - data[lo]) * (rank - lo)
+
+
+def median(values):
+    """Get the median of samples"""
+    return percentile(values, 50)
+
+
+def coefficient_of_variation(values):
+    """Get stdev / mean of samples, 0 if less than 2 samples"""
+    if len(values) < 2:
+        return 0.0
+    mean = statistics.fmean(values)
+    return statistics.stdev(values) / mean if mean else float("inf")
+
+
+def _t_quantile(p, df):
+    """
+    Get the quantile of the Student's t distribution by the Cornish-Fisher
+    expansion of the normal quantile, accurate enough from df >= 3
+    """
+    z = statistics.NormalDist().inv_cdf(p)
+    if df <= 0:
+        return z
+    return (
+        z
+        + (z**3 + z) / (4 * df)
+        + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+        + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+    )
+
+
+def confidence_interval(values, confidence=0.95):
+    """
+    Get the confidence interval of the mean of samples
+
+    :return: tuple of (low, high)
+    """
+    mean = statistics.fmean(values)
+    if len(values) < 2:
+        return mean, mean
+    t = _t_quantile(0.5 + confidence / 2, len(values) - 1)
+    margin = t * statistics.stdev(values) / math.sqrt(len(values))
+    return mean - margin, mean + margin
+
+
+def trim_deviation(values, keep_rate):
+    """
+    Keep the samples nearest to the median, i.e. drop the samples with the
+    maximum deviation
+
+    :param values: samples
+    :param keep_rate: rate of samples to keep, in (0, 1]
+    :return: list of the kept samples in original order
+    """
+    keep = max(1, int(round(len(values) * keep_rate)))
+    if keep >= len(values):
+        return list(values)
+    center = median(values)
+    ranked = sorted(range(len(values)), key=lambda i: abs(values[i] - center))
+    return [values[i] for i in sorted(ranked[:keep])]
+
+
+def summarize(values, confidence=0.95):
+    """
+    Get the dict of the common statistics of samples: count, mean, median,
+    min, max, p5, p95, stdev, cv and ci (confidence interval of the mean)
+    """
+    data = sorted(values)
+    if not data:
+        return {"count": 0}
+    mean = statistics.fmean(data)
+    return {
+        "count": len(data),
+        "mean": mean,
+        "median": percentile(data, 50, True),
+        "min": data[0],
+        "max": data[-1],
+        "p5": percentile(data, 5, True),
+        "p95": percentile(data, 95, True),
+        "stdev": statistics.stdev(data) if len(data) > 1 else 0.0,
+        "cv": coefficient_of_variation(data),
+        "ci": confidence_interval(data, confidence),
+    }
+
+
+def is_stable(values, max_cv, min_count=3, confidence=0.95, max_ci_rate=None):
+    """
+    Check samples are stable enough to stop sampling
+
+    :param values: samples
+    :param max_cv: maximum coefficient of variation
+    :param min_count: minimum number of samples
+    :param confidence: confidence level of the interval of mean
+    :param max_ci_rate: maximum half width of the confidence interval
+                        relative to the mean, not checked if None
+    """
+    if len(values) < min_count:
+        return False
+    if coefficient_of_variation(values) > max_cv:
+        return False
+    if max_ci_rate is not None:
+        low, high = confidence_interval(values, confidence)
+        mean = statistics.fmean(values)
+        if not mean or (high - low) / 2 / abs(mean) > max_ci_rate:
+            return False
+    return True
+
+
+def _rank(values):
+    """Get the ranks of samples starting from 1, ties get the average rank"""
+    order = sorted(range(len(values)), key=values.__getitem__)
+    ranks = [0.0] * len(values)
+    ties = []
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2.0 + 1
+        if j > i:
+            ties.append(j - i + 1)
+        i = j + 1
+    return ranks, ties
+
+
+def mann_whitney_u(group1, group2, alternative="two-sided"):
+    """
+    Mann-Whitney U test of two groups of samples, with the normal
+    approximation and tie correction
+
+    :param group1: samples of the first group
+    :param group2: samples of the second group
+    :param alternative: 'two-sided', 'less' (group1 tends to be less than
+                        group2) or 'greater'
+    :return: tuple of (U statistic of group1, p-value)
+    """
+    n1, n2 = len(group1), len(group2)
+    if not n1 or not n2:
+        raise ValueError("Both groups need at least one sample")
+    ranks, ties = _rank(list(group1) + list(group2))
+    u1 = sum(ranks[:n1]) - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    tie_term = sum(t**3 - t for t in ties) / float(n * (n - 1)) if n > 1 else 0
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - tie_term))
+    if not sigma:
+        return u1, 1.0
+    mu = n1 * n2 / 2.0
+    norm = statistics.NormalDist()
+    if alternative == "two-sided":
+        z = (abs(u1 - mu) - 0.5) / sigma
+        p = 2 * (1 - norm.cdf(z))
+    elif alternative == "less":
+        p = norm.cdf((u1 - mu + 0.5) / sigma)
+    elif alternative == "greater":
+        p = 1 - norm.cdf((u1 - mu - 0.5) / sigma)
+    else:
+        raise ValueError("Unknown alternative: %s" % alternative)
+    return u1, min(max(p, 0.0), 1.0)
+
+
+def bootstrap_ci(
+    group1, group2, stat=median, confidence=0.95, resamples=2000, seed=None
+):
+    """
+    Bootstrap confidence interval of stat(group2) - stat(group1)
+
+    :param group1: samples of the first group
+    :param group2: samples of the second group
+    :param stat: statistic function, default median
+    :param confidence: confidence level
+    :param resamples: number of bootstrap resamples
+    :param seed: random seed, for reproducible results
+    :return: tuple of (low, high)
+    """
+    rand = random.Random(seed)
+    group1, group2 = list(group1), list(group2)
+    diffs = sorted(
+        stat(rand.choices(group2, k=len(group2)))
+        - stat(rand.choices(group1, k=len(group1)))
+        for _ in range(resamples)
+    )
+    alpha = (1 - confidence) / 2 * 100
+    return (
+        percentile(diffs, alpha, True),
+        percentile(diffs, 100 - alpha, True),
+    )
+
+
+def linear_fit(xs, ys):
+    """
+    Fit the samples to a line by least squares
+
+    :param xs: x of samples, e.g. the timestamps
+    :param ys: y of samples
+    :return: tuple of (slope, intercept), slope is 0 if less than 2 samples
+             or all the x are equal
+    """
+    if len(xs) != len(ys):
+        raise ValueError("linear_fit requires the same number of x and y")
+    if not xs:
+        return 0.0, 0.0
+    mean_x = statistics.fmean(xs)
+    mean_y = statistics.fmean(ys)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    if not sxx:
+        return 0.0, mean_y
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx
+    return slope, mean_y - slope * mean_x
+
+
+def slope_interval(xs, ys, confidence=0.95):
+    """
+    Get the confidence interval of the least squares slope of samples
+
+    :param xs: x of samples, e.g. the timestamps
+    :param ys: y of samples
+    :param confidence: confidence level
+    :return: tuple of (slope, low, high), the interval is (slope, slope)
+             with less than 3 samples
+    """
+    slope, intercept = linear_fit(xs, ys)
+    if len(xs) < 3:
+        return slope, slope, slope
+    mean_x = statistics.fmean(xs)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    if not sxx:
+        return slope, slope, slope
+    residual = sum((y - slope * x - intercept) ** 2 for x, y in zip(xs, ys))
+    stderr = math.sqrt(residual / (len(xs) - 2) / sxx)
+    margin = _t_quantile(0.5 + confidence / 2, len(xs) - 2) * stderr
+    return slope, slope - margin, slope + margin
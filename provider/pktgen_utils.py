@@ -4,10 +4,11 @@ import re
 import time
 
 import aexpect
-import six
 from avocado.utils import process
 from virttest import data_dir, utils_misc, utils_net
 
+from provider import result_store
+
 LOG_JOB = logging.getLogger("avocado.test")
 
 
@@ -218,15 +219,7 @@ def format_result(result, base, fbase):
     :param base: the length of converted string
     :param fbase: the decimal digit for float
     """
-    if isinstance(result, six.string_types):
-        value = "%" + base + "s"
-    elif isinstance(result, int):
-        value = "%" + base + "d"
-    elif isinstance(result, float):
-        value = "%" + base + "." + fbase + "f"
-    else:
-        raise TypeError(f"unexpected result type: {type(result).__name__}")
-    return value % result
+    return result_store.format_result(result, base, fbase)
 
 
 def run_tests_for_category(
@@ -1,12 +1,17 @@
 """qemu-img related functions."""
 
 import contextlib
+import json
 import logging
+import re
 import tempfile
+import time
+from multiprocessing.pool import ThreadPool
 
 import avocado
+from avocado.core import exceptions
 from avocado.utils import path, process
-from virttest import env_process, utils_misc
+from virttest import env_process, qemu_storage, utils_misc
 
 LOG_JOB = logging.getLogger("avocado.test")
 
@@ -117,3 +122,155 @@ def check_flag(strace_log, target_file, flag):
         for line in lines:
             LOG_JOB.debug(line.strip())
         return any(flag in line for line in lines)
+
+
+def _image_json(image, offset=None, size=None):
+    """
+    Get the json: filename of image, or of a slice of it when offset
+    and size are set.
+
+    :param image: QemuImg object
+    :param offset: slice offset in bytes
+    :param size: slice size in bytes
+    """
+    if image.encryption_config.key_secret:
+        # the image options with the key-secret of the encryption
+        meta = qemu_storage.get_image_json(image.tag, image.params, image.root_dir)
+        opts = json.loads(meta[len("json:") :])
+    else:
+        opts = {
+            "driver": image.image_format,
+            "file": qemu_storage.filename_to_file_opts(image.image_filename),
+        }
+    if offset is not None:
+        opts = {"driver": "raw", "offset": offset, "size": size, "file": opts}
+    return "json:%s" % json.dumps(opts)
+
+
+def _secret_objects(*images):
+    """Get the --object secret options needed to open images."""
+    objects = []
+    for image in images:
+        for obj in image._secret_objects:
+            if obj not in objects:
+                objects.append(obj)
+    return " ".join(objects)
+
+
+def get_image_data_extents(image, force_share=False):
+    """
+    Get the extents of image which are not read as zeroes.
+
+    :param image: QemuImg object
+    :param force_share: open image with -U
+    :return: tuple of (list of (start, length), image virtual size)
+    """
+    cmd = "%s map --output=json %s %s'%s'" % (
+        image.image_cmd,
+        _secret_objects(image),
+        "-U " if force_share else "",
+        _image_json(image),
+    )
+    extents = json.loads(process.run(cmd, shell=True).stdout_text)
+    size = extents[-1]["start"] + extents[-1]["length"] if extents else 0
+    return [(e["start"], e["length"]) for e in extents if e["data"]], size
+
+
+def _merge_ranges(ranges):
+    """Merge the overlapping or adjacent (start, length) ranges."""
+    merged = []
+    for start, length in sorted(ranges):
+        if merged and start <= merged[-1][0] + merged[-1][1]:
+            end = max(merged[-1][0] + merged[-1][1], start + length)
+            merged[-1] = (merged[-1][0], end - merged[-1][0])
+        else:
+            merged.append((start, length))
+    return merged
+
+
+def compare_images_by_chunks(
+    source, target, chunk_size=268435456, workers=4, force_share=False
+):
+    """
+    Compare the guest visible data of two images from host side.
+
+    Only the ranges holding data in any of the images are compared, they
+    are split into chunks compared concurrently by 'qemu-img compare' over
+    raw slices of the images, so no guest is needed.
+
+    :param source: source QemuImg object
+    :param target: target QemuImg object
+    :param chunk_size: bytes compared by one qemu-img process
+    :param workers: number of qemu-img processes run at the same time
+    :param force_share: open images with -U, e.g. when they are in use
+    :return: dict of 'identical', 'offset' of the first difference or None,
+             compared 'bytes', 'time' and 'bytes/s'
+    """
+
+    def _compare(chunk):
+        start, length = chunk if chunk else (0, None)
+        cmd = "%s compare %s %s'%s' '%s'" % (
+            source.image_cmd,
+            secret_objects,
+            "-U " if force_share else "",
+            _image_json(source, chunk and start, length),
+            _image_json(target, chunk and start, length),
+        )
+        result = process.run(cmd, shell=True, ignore_status=True)
+        if result.exit_status == 0:
+            return None
+        match = re.search(r"mismatch at offset (\d+)", result.stdout_text)
+        if result.exit_status == 1 and not match and not chunk:
+            # images differ in size and the tail is not zeroed
+            return size
+        if result.exit_status != 1 or not match:
+            raise exceptions.TestError(
+                "Failed to compare images: %s" % result.stderr_text
+            )
+        return start + int(match.group(1))
+
+    secret_objects = _secret_objects(source, target)
+    start_time = time.time()
+    src_extents, src_size = get_image_data_extents(source, force_share)
+    tgt_extents, tgt_size = get_image_data_extents(target, force_share)
+    size = min(src_size, tgt_size)
+    chunks = []
+    for start, length in _merge_ranges(src_extents + tgt_extents):
+        end = min(start + length, size)
+        while start < end:
+            chunks.append((start, min(chunk_size, end - start)))
+            start += chunk_size
+
+    pool = ThreadPool(max(1, min(workers, len(chunks))))
+    try:
+        offsets = [o for o in pool.map(_compare, chunks) if o is not None]
+    finally:
+        pool.close()
+        pool.join()
+    if src_size != tgt_size and not offsets:
+        # qemu-img compare checks the tail of the larger image is zeroed
+        offset = _compare(None)
+        if offset is not None:
+            offsets.append(offset)
+
+    elapsed = time.time() - start_time
+    compared = sum(length for start, length in chunks)
+    result = {
+        "identical": not offsets,
+        "offset": min(offsets) if offsets else None,
+        "bytes": compared,
+        "time": elapsed,
+        "bytes/s": compared / elapsed if elapsed else 0,
+    }
+    LOG_JOB.info(
+        "Compared %d bytes of %s and %s in %.3fs (%.2f MB/s), %s",
+        compared,
+        source.image_filename,
+        target.image_filename,
+        elapsed,
+        result["bytes/s"] / 1024 / 1024,
+        "identical"
+        if result["identical"]
+        else "first mismatch at offset %d" % result["offset"],
+    )
+    return result
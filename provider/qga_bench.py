@@ -0,0 +1,226 @@
+"""
+Module to benchmark qemu-ga by pipelined commands.
+
+The commands are written into the guest agent channel without waiting for
+the replies, up to a window of commands in flight, which is how many
+management clients polling one agent look like to it. The agent handles
+the commands in order and its replies carry no id, so the replies are
+matched to the commands in FIFO order. The stream is synced by
+guest-sync-delimited before the run and after a timeout: the agent sends a
+0xff byte before its reply, so the stale data before it is dropped.
+
+Every command is timestamped on the monotonic clock when it's written and
+when its reply is read, the latencies include the time queued in the
+agent, and give the percentiles and the commands per second of each
+command at each window.
+
+Available classes:
+- QGAPipeline: send pipelined commands over the guest agent channel
+
+The commands are written to the agent socket directly, under the lock of
+the QemuAgent object, both private to avocado-vt, check them by
+get_missing_internals before a benchmark.
+
+Available functions:
+- get_missing_internals: get the QemuAgent internals the pipeline lacks
+- run_benchmark: benchmark commands at several windows
+"""
+
+import collections
+import json
+import logging
+import random
+import select
+import time
+
+from provider.perf_stats import Series, percentile, summarize
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+SYNC_DELIMITER = b"\xff"
+# private attributes of QemuAgent the pipeline drives the channel by
+AGENT_INTERNALS = ("_acquire_lock", "_lock", "_socket")
+
+
+def get_missing_internals(agent):
+    """
+    Get the QemuAgent internals used by QGAPipeline missing in the agent,
+    e.g. after an avocado-vt change
+
+    :param agent: QemuAgent object
+    :return: list of the missing attribute names
+    """
+    return [name for name in AGENT_INTERNALS if not hasattr(agent, name)]
+
+
+class QGAPipeline(object):
+    """
+    Send pipelined commands over the guest agent channel, the lock of the
+    agent is held while in use, so nobody else reads the replies
+    Example of usage:
+        with QGAPipeline(vm.guest_agent) as pipeline:
+            latencies, elapsed, errors = pipeline.run("guest-info", 1000, 16)
+    """
+
+    def __init__(self, agent, timeout=30):
+        """
+        :param agent: QemuAgent object
+        :param timeout: seconds to wait for a reply
+        """
+        self.agent = agent
+        self.timeout = timeout
+        self._buffer = b""
+
+    def __enter__(self):
+        if not self.agent._acquire_lock():
+            raise RuntimeError("Could not acquire the lock of the guest agent")
+        try:
+            self.sync()
+        except Exception:
+            self.agent._lock.release()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        self.agent._lock.release()
+
+    def _send(self, data):
+        self.agent._socket.sendall(data)
+
+    def _read(self, timeout):
+        """Read the available data into the buffer"""
+        sock = self.agent._socket
+        if not select.select([sock], [], [], max(0, timeout))[0]:
+            return False
+        data = sock.recv(65536)
+        if not data:
+            raise IOError("Guest agent channel closed")
+        self._buffer += data
+        return True
+
+    def _replies(self):
+        """Pop the complete replies from the buffer"""
+        lines = self._buffer.split(b"\n")
+        self._buffer = lines.pop()
+        replies = []
+        for line in lines:
+            line = line.lstrip(SYNC_DELIMITER).strip()
+            if not line:
+                continue
+            try:
+                reply = json.loads(line)
+            except ValueError:
+                LOG_JOB.debug("Dropped invalid guest agent reply: %r", line)
+                continue
+            if isinstance(reply, dict) and ("return" in reply or "error" in reply):
+                replies.append(reply)
+        return replies
+
+    def sync(self):
+        """Sync the stream by guest-sync-delimited, drop the stale data"""
+        sync_id = random.randint(1, 2**31)
+        cmd = {"execute": "guest-sync-delimited", "arguments": {"id": sync_id}}
+        self._buffer = b""
+        self._send(SYNC_DELIMITER + json.dumps(cmd).encode() + b"\n")
+        end_time = time.monotonic() + self.timeout
+        while time.monotonic() < end_time:
+            if not self._read(end_time - time.monotonic()):
+                continue
+            pos = self._buffer.rfind(SYNC_DELIMITER)
+            if pos < 0:
+                continue
+            self._buffer = self._buffer[pos:]
+            for reply in self._replies():
+                if reply.get("return") == sync_id:
+                    return
+        raise RuntimeError("Could not sync with the guest agent")
+
+    def run(self, cmd, count, window=1, args=None):
+        """
+        Send a command count times, with window commands in flight
+
+        :param cmd: guest agent command, e.g. guest-info
+        :param count: number of the commands
+        :param window: maximum number of commands in flight
+        :param args: arguments of the command
+        :return: tuple of the Series of latencies in seconds, the seconds
+                 elapsed and the number of error replies
+        """
+        obj = {"execute": cmd}
+        if args is not None:
+            obj["arguments"] = args
+        data = json.dumps(obj).encode() + b"\n"
+        latencies = Series(cmd)
+        in_flight = collections.deque()
+        sent = errors = 0
+        start = time.monotonic()
+        while len(latencies) + errors < count:
+            burst = min(window - len(in_flight), count - sent)
+            if burst > 0:
+                now = time.monotonic()
+                self._send(data * burst)
+                in_flight.extend([now] * burst)
+                sent += burst
+            if not self._read(self.timeout):
+                raise RuntimeError(
+                    "No reply of %s in %ss, %d commands in flight"
+                    % (cmd, self.timeout, len(in_flight))
+                )
+            now = time.monotonic()
+            for reply in self._replies():
+                if not in_flight:
+                    LOG_JOB.debug("Dropped unexpected guest agent reply: %s", reply)
+                    continue
+                sent_time = in_flight.popleft()
+                if "error" in reply:
+                    errors += 1
+                    LOG_JOB.debug("Error reply of %s: %s", cmd, reply["error"])
+                    continue
+                latencies.append(now - sent_time, now)
+        return latencies, time.monotonic() - start, errors
+
+
+def run_benchmark(agent, commands, count, windows=(1,), timeout=30):
+    """
+    Benchmark guest agent commands at several windows
+
+    :param agent: QemuAgent object
+    :param commands: guest agent commands, e.g. ["guest-info", "guest-get-osinfo"]
+    :param count: number of each command at each window
+    :param windows: numbers of the commands in flight
+    :param timeout: seconds to wait for a reply
+    :return: list of dict of cmd, window, rate (commands per second),
+             errors and the summarize of the latencies in milliseconds,
+             with p99
+    """
+    results = []
+    with QGAPipeline(agent, timeout) as pipeline:
+        for cmd in commands:
+            for window in windows:
+                try:
+                    latencies, elapsed, errors = pipeline.run(cmd, count, window)
+                except RuntimeError as err:
+                    LOG_JOB.error("Benchmark of %s failed: %s", cmd, err)
+                    pipeline.sync()
+                    continue
+                values = [v * 1000 for v in latencies]
+                result = summarize(values)
+                result.update(
+                    p99=percentile(values, 99) if values else 0.0,
+                    cmd=cmd,
+                    window=window,
+                    rate=(len(latencies) + errors) / elapsed if elapsed else 0.0,
+                    errors=errors,
+                )
+                LOG_JOB.info(
+                    "%s window %d: %.1f cmd/s, latency p50 %.3fms p99 %.3fms, "
+                    "%d errors",
+                    cmd,
+                    window,
+                    result["rate"],
+                    result.get("median", 0.0),
+                    result.get("p99", 0.0),
+                    errors,
+                )
+                results.append(result)
+    return results
@@ -0,0 +1,223 @@
+"""
+Module to profile the resources of qemu-ga under a command load.
+
+A load generator sends guest agent commands at a configurable rate, while
+the memory, handles (or fds) and threads of the qemu-ga process are
+sampled at a fixed rate from a guest session into time series. Each
+resource is fitted against the number of commands executed by least
+squares, a leak is reported when the lower confidence bound of the slope,
+i.e. of the growth per command, is above the allowed growth. So a small
+leak is detected in one run by all the samples instead of by the first
+and last ones.
+
+Available classes:
+- CommandLoad: send guest agent commands at a rate in background
+- QGAProfiler: sample the qemu-ga resources under a command load
+
+Available functions:
+- get_resource_cmd: get the default command sampling qemu-ga in a guest
+"""
+
+import logging
+import threading
+import time
+
+from provider.perf_stats import Series, slope_interval
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+# the commands print "<handles or fds> <memory bytes> <threads>"
+RESOURCE_CMD_WINDOWS = (
+    'powershell "$p = Get-Process -Name qemu-ga; '
+    'Write-Output $p.HandleCount $p.PrivateMemorySize64 $p.Threads.Count"'
+)
+RESOURCE_CMD_LINUX = (
+    "pid=$(pgrep -x qemu-ga | head -1); "
+    "echo $(ls /proc/$pid/fd | wc -l) "
+    "$(awk '/^VmRSS/ {print $2 * 1024}' /proc/$pid/status) "
+    "$(awk '/^Threads/ {print $2}' /proc/$pid/status)"
+)
+RESOURCES = ("handles", "memory", "threads")
+
+
+def get_resource_cmd(os_type):
+    """Get the default command sampling qemu-ga in a guest of os_type"""
+    if os_type == "windows":
+        return RESOURCE_CMD_WINDOWS
+    return RESOURCE_CMD_LINUX
+
+
+class CommandLoad(threading.Thread):
+    """
+    Send guest agent commands at a rate in background, until the count of
+    rounds is done or it's stopped
+    """
+
+    def __init__(self, commands, rate=0, count=None):
+        """
+        :param commands: functions sending a command each, e.g.
+                         [gagent.get_osinfo, gagent.get_virtio_device],
+                         they are called in turn in each round
+        :param rate: rounds per second, as fast as possible if 0
+        :param count: number of rounds, no limit if None
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.commands = commands
+        self.rate = rate
+        self.count = count
+        self.executed = 0
+        self.errors = 0
+        self.exception = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        interval = 1.0 / self.rate if self.rate else 0
+        start = time.monotonic()
+        rounds = 0
+        while not self._stop_event.is_set():
+            if self.count is not None and rounds >= self.count:
+                break
+            for command in self.commands:
+                try:
+                    command()
+                except Exception as err:
+                    self.errors += 1
+                    self.exception = err
+                    LOG_JOB.debug("Guest agent command failed: %s", err)
+                self.executed += 1
+            rounds += 1
+            if interval:
+                delay = start + rounds * interval - time.monotonic()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+        LOG_JOB.info(
+            "%d guest agent commands executed, %d failed", self.executed, self.errors
+        )
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class QGAProfiler(object):
+    """
+    Sample the qemu-ga resources under a command load
+    Example of usage:
+        load = CommandLoad([gagent.guest_info], rate=50)
+        profiler = QGAProfiler(session, get_resource_cmd("windows"), 1)
+        profiler.run(load, duration=600)
+        verdict = profiler.verdict("memory", max_slope=1.0)
+        profiler.report(test)
+    """
+
+    def __init__(self, session, cmd, interval=5.0):
+        """
+        :param session: guest session to sample by
+        :param cmd: command printing the handles, memory bytes and threads
+        :param interval: seconds between two samples
+        """
+        self.session = session
+        self.cmd = cmd
+        self.interval = interval
+        self.series = {name: Series(name) for name in RESOURCES}
+        self.commands = Series("commands")
+
+    def sample(self, load=None):
+        """
+        Sample the resources once
+
+        :param load: CommandLoad object, the commands it executed are
+                     recorded with the sample
+        :return: dict of the resources
+        """
+        output = self.session.cmd_output(self.cmd).strip()
+        now = time.monotonic()
+        try:
+            values = [int(v) for v in output.split()[-len(RESOURCES) :]]
+        except ValueError:
+            LOG_JOB.warning("Invalid qemu-ga resources: %s", output)
+            return None
+        if len(values) != len(RESOURCES):
+            LOG_JOB.warning("Invalid qemu-ga resources: %s", output)
+            return None
+        resources = dict(zip(RESOURCES, values))
+        for name, value in resources.items():
+            self.series[name].append(value, now)
+        self.commands.append(load.executed if load else 0, now)
+        LOG_JOB.debug("qemu-ga resources: %s", resources)
+        return resources
+
+    def run(self, load, duration=None):
+        """
+        Start the load and sample until the load finishes or duration
+        elapses, the load is stopped then; the sampling times are
+        scheduled from the start so the errors don't accumulate
+
+        :param load: CommandLoad object not started
+        :param duration: seconds to sample, until the load finishes if None
+        """
+        start = time.monotonic()
+        self.sample(load)
+        load.start()
+        count = 0
+        try:
+            while load.is_alive():
+                count += 1
+                next_time = start + count * self.interval
+                if duration is not None and next_time > start + duration:
+                    break
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    load.join(delay)
+                self.sample(load)
+        finally:
+            load.stop()
+        self.sample(load)
+
+    def verdict(self, name, max_slope, warmup=0, confidence=0.95):
+        """
+        Check whether a resource leaks
+
+        :param name: resource name in RESOURCES
+        :param max_slope: allowed growth per command
+        :param warmup: seconds of the samples to skip
+        :param confidence: confidence level of the slope interval
+        :return: dict of slope, low, high, samples and leak, the leak is
+                 true if low > max_slope
+        """
+        series = self.series[name].skip(warmup)
+        commands = self.commands.skip(warmup)
+        slope, low, high = slope_interval(commands.values, series.values, confidence)
+        result = {
+            "slope": slope,
+            "low": low,
+            "high": high,
+            "samples": len(series),
+            "leak": len(series) > 2 and low > max_slope,
+        }
+        LOG_JOB.info(
+            "qemu-ga %s grows %.4f per command, %d%% interval [%.4f, %.4f] "
+            "in %d samples",
+            name,
+            slope,
+            confidence * 100,
+            low,
+            high,
+            len(series),
+        )
+        return result
+
+    def report(self, test, prefix="qga"):
+        """Write the first, last values and slopes in test keyvals"""
+        keyvals = dict()
+        for name, series in self.series.items():
+            if not len(series):
+                continue
+            slope = slope_interval(self.commands.values, series.values)[0]
+            keyvals["%s--%s_first" % (prefix, name)] = int(series.values[0])
+            keyvals["%s--%s_last" % (prefix, name)] = int(series.values[-1])
+            keyvals["%s--%s_slope" % (prefix, name)] = "%.6f" % slope
+        if len(self.commands):
+            keyvals["%s--commands" % prefix] = int(self.commands.values[-1])
+        test.write_test_keyval(keyvals)
@@ -0,0 +1,286 @@
+"""
+Module to provide an indexed store of the QMP events emitted by a VM.
+
+The events received by a QMP monitor are read incrementally and indexed by
+event name and by the data keys listed in INDEX_KEYS, so looking up an event
+costs the number of events with the same name or key instead of the number
+of all the events emitted since the VM started.
+
+Available classes:
+- QMPEventStore: indexed event store of one QMP monitor
+
+Available functions:
+- get_event_store: get the event store of the VM, one store per monitor
+
+Callers only interested in new events save a cursor and pass it back as
+'since' in the later lookups, e.g.:
+
+    store = get_event_store(vm)
+    cursor = store.cursor
+    vm.monitor.cmd("device_del", {"id": "disk1"})
+    event = store.wait_for_event("DEVICE_DELETED", 60, since=cursor,
+                                 device="disk1")
+
+Pollers handling every new event once use get_new_events, which returns
+the cursor to pass in the next poll together with the events.
+"""
+
+import collections
+import threading
+import time
+import weakref
+
+INDEX_KEYS = ("id", "device", "node-name")
+
+_Entry = collections.namedtuple("_Entry", ["seq", "time", "event"])
+
+
+class QMPEventStore(object):
+    """
+    Indexed store of the QMP events received by one monitor
+
+    Events are evicted from the store when it holds more than max_events
+    events or when they are older than max_age seconds, so memory stays
+    bounded on long running VMs. Events cleared from the monitor with
+    clear_event(s) are removed from the store too.
+    """
+
+    def __init__(self, monitor, max_events=10000, max_age=None, interval=0.05):
+        """
+        :param monitor: QMP monitor object
+        :param max_events: maximum number of events kept, None for no limit
+        :param max_age: maximum age of events kept in seconds, None for no limit
+        :param interval: interval to read new events from monitor, in seconds
+        """
+        self._monitor = monitor
+        self.max_events = max_events
+        self.max_age = max_age
+        self._interval = interval
+        self._cond = threading.Condition()
+        self._reading = False
+        self._seq = 0
+        self._entries = collections.deque()
+        self._named = dict()
+        self._keyed = dict()
+        # position and the last event read from the monitor event list
+        self._mark = 0
+        self._last_event = None
+
+    @property
+    def cursor(self):
+        """Sequence number of the latest stored event"""
+        with self._cond:
+            return self._seq
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+    @staticmethod
+    def _index_keys(event):
+        data = event.get("data") or dict()
+        for key in INDEX_KEYS:
+            value = data.get(key)
+            if isinstance(value, str):
+                yield key, value
+
+    def _add(self, event):
+        self._seq += 1
+        entry = _Entry(self._seq, time.time(), event)
+        self._entries.append(entry)
+        self._named.setdefault(event.get("event"), collections.deque()).append(entry)
+        for key in self._index_keys(event):
+            self._keyed.setdefault(key, collections.deque()).append(entry)
+
+    def _evict(self):
+        """Evict the oldest events exceeding max_events or max_age"""
+        expire = time.time() - self.max_age if self.max_age is not None else None
+        while self._entries:
+            oldest = self._entries[0]
+            if (self.max_events is None or len(self._entries) <= self.max_events) and (
+                expire is None or oldest.time >= expire
+            ):
+                break
+            self._entries.popleft()
+            # indexes are ordered as well, the evicted entry is their head
+            name = oldest.event.get("event")
+            self._named[name].popleft()
+            if not self._named[name]:
+                del self._named[name]
+            for key in self._index_keys(oldest.event):
+                self._keyed[key].popleft()
+                if not self._keyed[key]:
+                    del self._keyed[key]
+
+    def _rebuild(self, alive):
+        """Drop the stored events cleared from monitor and rebuild indexes"""
+        entries = [e for e in self._entries if id(e.event) in alive]
+        self._entries = collections.deque(entries)
+        self._named.clear()
+        self._keyed.clear()
+        for entry in entries:
+            name = entry.event.get("event")
+            self._named.setdefault(name, collections.deque()).append(entry)
+            for key in self._index_keys(entry.event):
+                self._keyed.setdefault(key, collections.deque()).append(entry)
+
+    def _get_new_events(self, events):
+        """Get the events not read yet from the monitor event list"""
+        if self._mark == 0 or (
+            len(events) >= self._mark and events[self._mark - 1] is self._last_event
+        ):
+            return events[self._mark :]
+        # monitor event list was cleared, the events read before are
+        # still a prefix of the list, the new events follow them
+        alive = set(id(e) for e in events)
+        self._rebuild(alive)
+        stored = set(id(e.event) for e in self._entries)
+        stored.add(id(self._last_event))
+        for pos in range(len(events) - 1, -1, -1):
+            if id(events[pos]) in stored:
+                return events[pos + 1 :]
+        return events
+
+    def read_events(self):
+        """
+        Read and index the events received since last read
+
+        :return: number of the new events
+        """
+        with self._cond:
+            if self._reading:
+                # another waiter is reading the monitor, its result will
+                # be notified to all the waiters
+                return 0
+            self._reading = True
+        try:
+            events = self._monitor.get_events()
+        finally:
+            with self._cond:
+                self._reading = False
+        with self._cond:
+            new_events = self._get_new_events(events)
+            for event in new_events:
+                self._add(event)
+            self._mark = len(events)
+            self._last_event = events[-1] if events else None
+            self._evict()
+            if new_events:
+                self._cond.notify_all()
+            return len(new_events)
+
+    def _lookup(self, event_name, condition):
+        """Get the smallest index matching the event name or a condition"""
+        candidates = []
+        if event_name is not None:
+            candidates.append(self._named.get(event_name, ()))
+        for key in INDEX_KEYS:
+            if isinstance(condition.get(key), str):
+                candidates.append(self._keyed.get((key, condition[key]), ()))
+        if not candidates:
+            return self._entries
+        return min(candidates, key=len)
+
+    def get_events(self, event_name=None, since=0, **condition):
+        """
+        Get the stored events
+
+        :param event_name: event name, None for any event
+        :param since: cursor, only return the events stored after it
+        :param condition: items the event data must contain, the keys in
+                          INDEX_KEYS are looked up by index
+        :return: list of the event dicts in received order
+        """
+        with self._cond:
+            entries = self._lookup(event_name, condition)
+            events = []
+            for entry in reversed(entries):
+                if entry.seq <= since:
+                    break
+                event = entry.event
+                if event_name is not None and event.get("event") != event_name:
+                    continue
+                if condition:
+                    data = event.get("data")
+                    if not data or not all(
+                        item in data.items() for item in condition.items()
+                    ):
+                        continue
+                events.append(event)
+            events.reverse()
+            return events
+
+    def get_new_events(self, since, event_name=None, **condition):
+        """
+        Get the stored events after a cursor, and the cursor of the latest
+        of them taken in the same lock, so no event is returned twice or
+        missed by the next call
+
+        :return: tuple of (list of the event dicts, cursor)
+        """
+        with self._cond:
+            return self.get_events(event_name, since, **condition), self._seq
+
+    def get_event(self, event_name=None, since=0, **condition):
+        """Get the first stored event matching, or None"""
+        events = self.get_events(event_name, since, **condition)
+        return events[0] if events else None
+
+    def wait_for(self, func, timeout):
+        """
+        Block until func returns a true value or timeout
+
+        func is evaluated after each read of the monitor and whenever any
+        other waiter indexed new events.
+
+        :param func: callable without arguments
+        :param timeout: timeout in seconds
+        :return: the last return value of func
+        """
+        end_time = time.time() + timeout
+        while True:
+            self.read_events()
+            result = func()
+            remaining = end_time - time.time()
+            if result or remaining <= 0:
+                return result
+            with self._cond:
+                self._cond.wait(min(self._interval, remaining))
+
+    def wait_for_event(self, event_name, timeout, since=0, **condition):
+        """
+        Block until an event matching is stored or timeout
+
+        :return: the first event dict matching, or None
+        """
+        return self.wait_for(
+            lambda: self.get_event(event_name, since, **condition), timeout
+        )
+
+
+_stores = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_event_store(vm):
+    """
+    Get the event store of VM, one store per monitor
+
+    The store limits are set by VM params 'qmp_event_store_max_events'
+    and 'qmp_event_store_max_age'.
+
+    :param vm: VM object
+    :return: QMPEventStore object
+    """
+    monitor = vm.monitor
+    with _stores_lock:
+        store = _stores.get(monitor)
+        if store is None:
+            max_age = vm.params.get_numeric("qmp_event_store_max_age", 0)
+            store = QMPEventStore(
+                monitor,
+                max_events=vm.params.get_numeric("qmp_event_store_max_events", 10000),
+                max_age=max_age or None,
+            )
+            _stores[monitor] = store
+        return store
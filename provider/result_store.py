@@ -0,0 +1,454 @@
+"""
+Module to store the results of performance tests.
+
+Each sample of a test is a typed record carrying the versions of host,
+guest and qemu and the tags of the run, the records are appended into a
+sqlite database, so the results of many runs are compared by queries
+instead of parsing the fixed-width text files. The database can be shared
+by runs with param result_store_path, and exported into csv.
+
+The "RHS" text files (fixed-width columns separated by '|') are generated
+as a view of the records of one run, the tests choose the order of the
+version lines and whether a category line heads the rows of a category, so
+the files keep the layout of each test. A test writes its RHS file as it
+runs by open_rhs, each record added is appended to the file, so a test
+killed by the timeout still leaves its rows.
+
+The database is connected for each operation only, a store holds no open
+connection or file between the calls.
+
+Available classes:
+- ResultRecord: one sample of a test
+- ResultStore: sqlite database of the records
+
+Available functions:
+- format_result: format a value to a fixed length string
+- format_record: format the values to one RHS row
+- open_store: open the store of a test by the params
+"""
+
+import collections
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+import time
+
+import six
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    test TEXT,
+    started REAL,
+    host_version TEXT,
+    guest_version TEXT,
+    qemu_version TEXT,
+    info TEXT,
+    tags TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    run INTEGER REFERENCES runs(id),
+    timestamp REAL,
+    category TEXT,
+    tags TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    record INTEGER REFERENCES records(id),
+    idx INTEGER,
+    name TEXT,
+    value
+);
+CREATE INDEX IF NOT EXISTS records_run ON records(run);
+CREATE INDEX IF NOT EXISTS metrics_record ON metrics(record);
+CREATE INDEX IF NOT EXISTS metrics_name ON metrics(name);
+"""
+
+# the RHS header lines of the versions
+VERSION_LINES = (
+    ("qemu_version", "kvm-userspace-ver"),
+    ("guest_version", "guest-kernel-ver"),
+    ("host_version", "kvm_version"),
+)
+
+
+def format_result(result, base="17", fbase="2"):
+    """
+    Format the result to a fixed length string.
+
+    :param result: result need to convert
+    :param base: the length of converted string
+    :param fbase: the decimal digit for float
+    """
+    if isinstance(result, six.string_types):
+        value = "%" + base + "s"
+    elif isinstance(result, int):
+        value = "%" + base + "d"
+    elif isinstance(result, float):
+        value = "%" + base + "." + fbase + "f"
+    else:
+        raise TypeError(f"unexpected result type: {type(result).__name__}")
+    return value % result
+
+
+def format_record(values, keys, header=False, base="17", fbase="2"):
+    """
+    Format the values to one RHS row
+
+    :param values: dict of column name and value
+    :param keys: column names in order, the ones not in values are skipped
+    :param header: if prepend a row of the column names
+    :param base: the length of a column
+    :param fbase: the decimal digit for float
+    :return: tuple of the row and the column names in the row
+    """
+    key_list = [key for key in keys if key in values]
+    rows = [[values[key] for key in key_list]]
+    if header:
+        rows.insert(0, key_list)
+    record = "\n".join(
+        "|".join(format_result(value, base=base, fbase=fbase) for value in row)
+        for row in rows
+    )
+    return record, key_list
+
+
+class _RHSRows(object):
+    """Format the records of a run into RHS rows in the order added"""
+
+    def __init__(self, keys=None, base="17", fbase="2", category=True):
+        self.keys = keys
+        self.base = base
+        self.fbase = fbase
+        self.category = category
+        self._last = None
+        self._columns = None
+
+    def lines(self, category, values):
+        """Get the lines of a record, headed by its category if it's new"""
+        lines = []
+        header = self._columns is None or category != self._last
+        if header:
+            self._last = category
+            self._columns = self.keys or list(values)
+            if self.category:
+                lines.append("Category:%s" % category)
+        line, _ = format_record(
+            values, self._columns, header=header, base=self.base, fbase=self.fbase
+        )
+        lines.append(line)
+        return lines
+
+
+class ResultRecord(
+    collections.namedtuple(
+        "ResultRecord",
+        [
+            "id",
+            "run",
+            "test",
+            "timestamp",
+            "category",
+            "host_version",
+            "guest_version",
+            "qemu_version",
+            "tags",
+            "values",
+        ],
+    )
+):
+    """
+    One sample of a test, values is the OrderedDict of the metric name and
+    value in the column order, tags is the dict of the run and sample tags
+    """
+
+    __slots__ = ()
+
+
+class ResultStore(object):
+    """
+    sqlite database of the test results.
+    Example of usage:
+        store = ResultStore(path)
+        store.start_run("netperf", host_version=..., qemu_version=...)
+        store.open_rhs(rhs_path)
+        store.add("TCP_STREAM (RX)", {"size": 64, "throughput": 9410.8})
+    """
+
+    def __init__(self, path, timeout=60):
+        """
+        :param path: database file, created if not exists
+        :param timeout: seconds to wait for the lock of a shared database
+        """
+        self.path = path
+        self.timeout = timeout
+        self.run = None
+        self._rhs_path = None
+        self._rhs_rows = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            conn.commit()
+
+    def _connect(self):
+        return contextlib.closing(sqlite3.connect(self.path, timeout=self.timeout))
+
+    def start_run(
+        self,
+        test,
+        host_version="",
+        guest_version="",
+        qemu_version="",
+        tags=None,
+    ):
+        """
+        Start a run, the following records are added into it
+
+        :param test: test name
+        :param tags: dict of the run tags, e.g. the test variant
+        :return: run id
+        """
+        if not host_version:
+            host_version = os.uname()[2]
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (test, started, host_version, guest_version,"
+                " qemu_version, info, tags) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    test,
+                    time.time(),
+                    host_version.strip(),
+                    guest_version.strip(),
+                    qemu_version.strip(),
+                    json.dumps([]),
+                    json.dumps(tags or {}),
+                ),
+            )
+            conn.commit()
+        self.run = cursor.lastrowid
+        return self.run
+
+    def _get_run(self, run):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT test, host_version, guest_version, qemu_version, info, tags"
+                " FROM runs WHERE id = ?",
+                (run,),
+            ).fetchone()
+        if row is None:
+            raise ValueError("No run %s in %s" % (run, self.path))
+        return row
+
+    def update_run(self, **versions):
+        """Update the versions of current run, e.g. guest_version='...'"""
+        for key in versions:
+            if key not in dict(VERSION_LINES):
+                raise ValueError("Unknown version: %s" % key)
+        with self._connect() as conn:
+            for key, value in versions.items():
+                conn.execute(
+                    "UPDATE runs SET %s = ? WHERE id = ?" % key,
+                    (value.strip(), self.run),
+                )
+            conn.commit()
+
+    def add_info(self, name, value):
+        """Add an info of current run, which is shown in the RHS header"""
+        info = json.loads(self._get_run(self.run)[4])
+        info.append([name, value])
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE runs SET info = ? WHERE id = ?", (json.dumps(info), self.run)
+            )
+            conn.commit()
+
+    def _header_lines(self, run, versions):
+        """Get the RHS lines of the versions and the info of a run"""
+        row = self._get_run(run)
+        run_versions = dict(
+            zip(("host_version", "guest_version", "qemu_version"), row[1:4])
+        )
+        lines = []
+        for key, name in versions:
+            if run_versions[key]:
+                lines.append("### %s : %s" % (name, run_versions[key]))
+        for name, value in json.loads(row[4]):
+            lines.append("### %s : %s" % (name, value))
+        return lines
+
+    def open_rhs(
+        self,
+        path,
+        keys=None,
+        base="17",
+        fbase="2",
+        versions=VERSION_LINES,
+        category=True,
+    ):
+        """
+        Write the RHS header of current run into file, the records added
+        later are appended to it, see rhs_view for the args; call it after
+        the versions and the info are recorded
+        """
+        self._rhs_rows = _RHSRows(keys, base, fbase, category)
+        self._rhs_path = path
+        with open(path, "w") as f:
+            f.write("\n".join(self._header_lines(self.run, versions)) + "\n")
+
+    def add(self, category, values, tags=None):
+        """
+        Add a record into current run, and append it to the RHS file if
+        opened by open_rhs
+
+        :param category: category of the record, e.g. the protocol
+        :param values: dict of metric name and int/float/str value, an
+                       OrderedDict keeps the column order of RHS view
+        :param tags: dict of the record tags
+        :return: record id
+        """
+        if self.run is None:
+            raise ValueError("No run started in %s" % self.path)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO records (run, timestamp, category, tags)"
+                " VALUES (?, ?, ?, ?)",
+                (self.run, time.time(), category, json.dumps(tags or {})),
+            )
+            record = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO metrics (record, idx, name, value) VALUES (?, ?, ?, ?)",
+                [
+                    (record, idx, name, value)
+                    for idx, (name, value) in enumerate(values.items())
+                ],
+            )
+            conn.commit()
+        if self._rhs_path:
+            with open(self._rhs_path, "a") as f:
+                f.write("\n".join(self._rhs_rows.lines(category, values)) + "\n")
+        return record
+
+    def records(self, run=None, test=None, category=None):
+        """
+        Iterate over the records in the order added
+
+        :param run: run id, all the runs if None
+        :param test: test name to filter
+        :param category: category to filter
+        """
+        query = (
+            "SELECT r.id, r.run, u.test, r.timestamp, r.category, u.host_version,"
+            " u.guest_version, u.qemu_version, u.tags, r.tags"
+            " FROM records r JOIN runs u ON r.run = u.id"
+        )
+        conditions, args = [], []
+        for column, value in (("r.run", run), ("u.test", test)):
+            if value is not None:
+                conditions.append("%s = ?" % column)
+                args.append(value)
+        if category is not None:
+            conditions.append("r.category = ?")
+            args.append(category)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY r.id"
+        records = []
+        with self._connect() as conn:
+            for row in conn.execute(query, args).fetchall():
+                values = collections.OrderedDict(
+                    conn.execute(
+                        "SELECT name, value FROM metrics WHERE record = ? ORDER BY idx",
+                        (row[0],),
+                    ).fetchall()
+                )
+                tags = json.loads(row[8])
+                tags.update(json.loads(row[9]))
+                records.append(ResultRecord(*(row[:8] + (tags, values))))
+        return iter(records)
+
+    def rhs_view(
+        self,
+        run=None,
+        keys=None,
+        base="17",
+        fbase="2",
+        versions=VERSION_LINES,
+        category=True,
+    ):
+        """
+        Generate the RHS text of a run
+
+        :param run: run id, current run by default
+        :param keys: column names in order, the columns of the first record
+                     of each category by default
+        :param base: the length of a column
+        :param fbase: the decimal digit for float
+        :param versions: (version, line name) pairs in the order of the
+                         version lines
+        :param category: if write a "Category:" line before the header row
+                         of each category
+        """
+        run = self.run if run is None else run
+        lines = self._header_lines(run, versions)
+        rows = _RHSRows(keys, base, fbase, category)
+        for record in self.records(run):
+            lines.extend(rows.lines(record.category, record.values))
+        return "\n".join(lines) + "\n"
+
+    def write_rhs(self, path, run=None, keys=None, base="17", fbase="2", **view):
+        """Write the RHS text of a run into file, see rhs_view for the args"""
+        with open(path, "w") as f:
+            f.write(self.rhs_view(run, keys, base, fbase, **view))
+
+    def export_csv(self, path, run=None, test=None):
+        """
+        Export the records into a csv file, one row per record and one
+        column per metric
+        """
+        records = list(self.records(run, test))
+        fields = [
+            "run",
+            "test",
+            "timestamp",
+            "category",
+            "host_version",
+            "guest_version",
+            "qemu_version",
+            "tags",
+        ]
+        metrics = []
+        for record in records:
+            metrics.extend(k for k in record.values if k not in metrics)
+        with open(path, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields + metrics)
+            for record in records:
+                row = [getattr(record, field) for field in fields[:-1]]
+                row.append(json.dumps(record.tags, sort_keys=True))
+                row.extend(record.values.get(k, "") for k in metrics)
+                writer.writerow(row)
+
+
+def open_store(test, params, name):
+    """
+    Open the result store of a test and start a run
+
+    Params used:
+    - result_store_path: database file shared by runs, results.sqlite in
+                         test results dir by default
+    - result_store_tags: names of the params saved as the run tags
+
+    :param test: test object
+    :param params: test params
+    :param name: test name of the run
+    :return: ResultStore object
+    """
+    path = params.get("result_store_path")
+    if not path:
+        path = os.path.join(test.resultsdir, "results.sqlite")
+    store = ResultStore(path)
+    tags = {key: params.get(key) for key in params.objects("result_store_tags")}
+    tags["shortname"] = params.get("shortname", "")
+    store.start_run(name, tags=tags)
+    return store
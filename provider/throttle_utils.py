@@ -3,21 +3,28 @@ Module for IO throttling relevant interfaces.
 """
 
 import copy
-import json
 import logging
 import random
 import re
 import string
-import tempfile
+import threading
+from functools import partial
 from math import ceil
 from multiprocessing.pool import ThreadPool
 from time import sleep
 
 from virttest.qemu_devices.qdevices import QThrottleGroup
 from virttest.qemu_monitor import QMPCmdError
-from virttest.utils_misc import get_linux_drive_path
+from virttest.utils_misc import get_linux_drive_path, wait_for
 from virttest.utils_version import VersionInterval
 
+from provider.fio_parser import (
+    get_interval_iops,
+    iter_fio_results,
+    parse_fio_results,
+    split_fio_runs,
+)
+
 LOG_JOB = logging.getLogger("avocado.test")
 
 
@@ -211,6 +218,82 @@ def _get_drive_path(session, params, image):
     return get_linux_drive_path(session, serial)
 
 
+class FioBarrier(object):
+    """
+    Guest side barrier to start the fio commands running in several sessions
+    at the same time, only for Linux guest.
+
+    Each wrapped command marks itself ready and waits for a release file in
+    the guest, release() creates the file once all the parties are ready, so
+    the start skew does not depend on the session and thread scheduling on
+    host.
+    Example of usage:
+        barrier = FioBarrier(session, 2)
+        # in two threads
+        session1.cmd(barrier.wrap(fio_cmd1))
+        session2.cmd(barrier.wrap(fio_cmd2))
+        # in main thread
+        barrier.release()
+    """
+
+    def __init__(self, session, parties, timeout=120):
+        """
+        :param session: Session object connect to guest, used to release
+        :param parties: number of the commands to start together
+        :param timeout: timeout to wait for all the parties ready
+        """
+        self._session = session
+        self.parties = parties
+        self.timeout = timeout
+        self.released = None
+        self._count = 0
+        self._lock = threading.Lock()
+        self._dir = "/tmp/fio_barrier_" + "".join(
+            random.sample(string.ascii_lowercase, 8)
+        )
+        self._session.cmd("rm -rf {0} && mkdir -p {0}".format(self._dir))
+
+    def wrap(self, cmd):
+        """
+        Wrap the command to run behind the barrier.
+
+        :param cmd: command to run in guest
+        :return: wrapped command
+        """
+        # called from the fio threads, each party needs its own ready file
+        with self._lock:
+            self._count += 1
+            index = self._count
+        wait = "while [ -d {0} ] && [ ! -e {0}/go ]; do sleep 0.01; done"
+        return (
+            "touch {0}/ready.{1}; " + wait + "; [ -e {0}/go ] && {{ {2}; }}"
+        ).format(self._dir, index, cmd)
+
+    def release(self):
+        """
+        Release the parties once all of them are ready.
+
+        :return: guest time of release in seconds since epoch
+        """
+        ready_cmd = "ls %s | grep -c ready" % self._dir
+        if not wait_for(
+            lambda: (
+                int(self._session.cmd_output(ready_cmd).strip() or 0) >= self.parties
+            ),
+            self.timeout,
+            step=0.5,
+        ):
+            raise ThrottleError("Not all the fio commands are ready to start")
+        out = self._session.cmd_output("touch %s/go; date +%%s.%%N" % self._dir)
+        self.released = float(out.strip().splitlines()[-1])
+        LOG_JOB.debug("Released %d fio commands at %s", self.parties, self.released)
+        return self.released
+
+    def cleanup(self):
+        """Remove the barrier files in guest, the parties not released exit"""
+        self._session.cmd_output("rm -rf %s" % self._dir)
+
+
 class ThrottleTester(object):
     """
     FIO test for in throttle group disks, It contains building general fio
@@ -238,7 +321,7 @@ class ThrottleTester(object):
         "normal": {"read": 0, "write": 0, "total": 0},
     }
     # Default data struct of raw image data.
-    raw_image_data = {"name": "", "fio_option": "", "output": {}}
+    raw_image_data = {"name": "", "fio_option": "", "output": {}, "samples": []}
 
     def __init__(self, test, params, vm, session, group, images=None):
         """
@@ -272,45 +355,13 @@ class ThrottleTester(object):
     @staticmethod
     def _generate_output_by_json(output):
         """
-        Convert fio command output to dict object.
+        Convert fio command output to dict of results.
 
         :param output: fio command output with option --output-format=json.
-        :return: dict of fio command output.
-        """
-
-        with tempfile.TemporaryFile(mode="w+") as tmp:
-            tmp.write(output)
-            tmp.seek(0)
-            line = tmp.readline()
-            begin_flag = False
-            block_index = 1
-            block = {}
-            data = ""
-            while line:
-                if line == "{\n":
-                    if not begin_flag:
-                        begin_flag = True
-                    else:
-                        # error
-                        break
-                if begin_flag:
-                    data += line
-                if line == "}\n":
-                    if begin_flag:
-                        begin_flag = False
-                    else:
-                        # error
-                        break
-                    block[block_index] = json.loads(data)
-                    data = ""
-                    block_index += 1
-
-                line = tmp.readline()
-
-            if begin_flag:
-                LOG_JOB.error("Wrong data format")
-                return {}
-            return block
+        :return: dict of FioResult, indexed from 1 in output order.
+        """
+
+        return dict(enumerate(iter_fio_results(output), 1))
 
     def set_fio(self, fio):
         """
@@ -321,11 +372,14 @@ class ThrottleTester(object):
 
         self._fio = fio
 
-    def run_fio(self, *args):
+    def run_fio(self, *args, barrier=None, status_interval=0):
         """
         Start to fio command in guest.
 
         :param args: image data,data struct refer to raw_image_data.
+        :param barrier: FioBarrier object, start fio behind it.
+        :param status_interval: seconds to sample the interval results,
+                                they are kept in image data "samples".
         :return: fio command output.
         """
 
@@ -337,18 +391,65 @@ class ThrottleTester(object):
         cmd = " ".join((self._fio.cfg.fio_path, fio_option))
         burst = self._throttle["expected"]["burst"]
         expected_burst = burst["read"] + burst["write"] + burst["total"]
+        if status_interval:
+            cmd += " --status-interval=%d" % status_interval
         if expected_burst:
             cmd += " && " + cmd
+        if barrier:
+            cmd = barrier.wrap(cmd)
         LOG_JOB.info("run_fio:%s", cmd)
         out = session.cmd(cmd, 1800)
-        image_info["output"] = self._generate_output_by_json(out)
+        if status_interval:
+            results = parse_fio_results(out)
+            image_info["samples"] = results
+            runs = split_fio_runs(results)
+            image_info["output"] = dict(enumerate((run[-1] for run in runs), 1))
+        else:
+            image_info["output"] = self._generate_output_by_json(out)
         return image_info["output"]
 
-    def check_output(self, images):
+    def run_image_fio(self, image, barrier=None, status_interval=0):
+        """
+        Start to fio command on the image in guest.
+
+        :param image: name of image
+        :param barrier: FioBarrier object, start fio behind it.
+        :param status_interval: seconds to sample the interval results.
+        :return: fio command output.
+        """
+
+        return self.run_fio(
+            self._throttle["images"][image],
+            barrier=barrier,
+            status_interval=status_interval,
+        )
+
+    def get_image_samples(self, image, start):
+        """
+        Get the interval IOPS of the image on the common time axis.
+
+        :param image: name of image
+        :param start: time axis origin in seconds since epoch, e.g. the
+                      release time of FioBarrier.
+        :return: Series of IOPS, empty if not sampled.
+        """
+
+        samples = self._throttle["images"][image]["samples"]
+        if not samples or not samples[0].jobs:
+            return get_interval_iops([], "")
+        # only the last run is taken when burst is expected
+        run = split_fio_runs(samples)[-1]
+        return get_interval_iops(run, run[0].jobs[0].jobname, start)
+
+    def check_output(self, images, window=None):
         """
         Check the output whether match the expected result.
 
         :param images: list of participating images.
+        :param window: tuple of (start, end, origin), check the normal IOPS
+                       by the interval samples in [start, end) on the time
+                       axis starting from origin, i.e. the time all the fio
+                       were running together.
         :return: True for succeed.
         """
 
@@ -367,24 +468,23 @@ class ThrottleTester(object):
         sum_normal = 0
         num_images = len(images)
         for image in images:
-            output = self._throttle["images"][image]["output"]  # type: dict
+            output = self._throttle["images"][image]["output"]
             num_samples = len(output)
             LOG_JOB.debug("Check %s in total %d images.", image, num_images)
             if expected_burst:
                 if num_samples < 2:
                     self._test.error("At lease 2 Data samples:%d" % num_samples)
-                read = output[1]["jobs"][0]["read"]["iops"]
-                write = output[1]["jobs"][0]["write"]["iops"]
-                total = read + write
-                sum_burst += total
+                sum_burst += output[1].jobs[0].iops
             else:
                 if num_samples < 1:
                     self._test.error("At lease 1 Data samples:%d" % num_samples)
 
-            read = output[num_samples]["jobs"][0]["read"]["iops"]
-            write = output[num_samples]["jobs"][0]["write"]["iops"]
-            total = read + write
-            sum_normal += total
+            samples = self.get_image_samples(image, window[2]) if window else None
+            if samples and len(samples.window(window[0], window[1])):
+                samples = samples.window(window[0], window[1])
+                sum_normal += sum(samples) / len(samples)
+            else:
+                sum_normal += output[num_samples].jobs[0].iops
 
         LOG_JOB.debug(
             "expected_burst:%d %d expected_normal:%d %d",
@@ -455,6 +555,12 @@ class ThrottleTester(object):
 
         return ret
 
+    def get_burst_empty_time(self):
+        """
+        Get the time to empty burst
+        """
+        return self._throttle["expected"]["burst"].get("burst_empty_time", 0)
+
     def wait_empty_burst(self):
         """
         Wait some time to empty burst
@@ -700,10 +806,22 @@ class ThrottleGroupsTester(object):
         t2.build_images_fio_option()
         testers = ThrottleGroupsTester([t1,t2])
         testers.start()
+
+    With synchronized=True, the fio commands of all the groups start at the
+    same time behind a FioBarrier, and with status_interval the normal IOPS
+    are checked by the samples in the time window all the fio were running.
     """
 
-    def __init__(self, testers):
+    def __init__(self, testers, synchronized=False, status_interval=0):
+        """
+        :param testers: list of ThrottleTester
+        :param synchronized: start fio of all groups behind a FioBarrier,
+                             only for Linux guest.
+        :param status_interval: seconds to sample IOPS in synchronized mode.
+        """
         self.testers = testers.copy()
+        self.synchronized = synchronized
+        self.status_interval = status_interval
 
     @staticmethod
     def proc_wrapper(func):
@@ -727,10 +845,81 @@ class ThrottleGroupsTester(object):
         else:
             raise ThrottleError("No found the corresponding group tester.")
 
+    def _run_synchronized(self, tasks):
+        """
+        Run fio on images of groups behind one barrier and check the results.
+
+        :param tasks: list of (tester, image)
+        """
+        session = tasks[0][0]._vm.wait_for_login()
+        barrier = FioBarrier(session, len(tasks))
+        pool = ThreadPool(len(tasks))
+        results = []
+        try:
+            for tester, image in tasks:
+                LOG_JOB.debug("Start synchronized run_fio :%s %s", tester.group, image)
+                func = partial(
+                    tester.run_image_fio, image, barrier, self.status_interval
+                )
+                results.append(pool.apply_async(self.proc_wrapper, (func,)))
+            pool.close()
+            barrier.release()
+            pool.join()
+        finally:
+            barrier.cleanup()
+            pool.join()
+            session.close()
+
+        if not all(result.successful() for result in results):
+            raise ThrottleError("Throttle testing failed,please check log.")
+
+        window = None
+        if self.status_interval:
+            # the samples are timestamped at the end of each interval
+            series = [t.get_image_samples(img, barrier.released) for t, img in tasks]
+            if all(len(s) for s in series):
+                start = max(s.times[0] for s in series) + self.status_interval
+                end = min(s.times[-1] for s in series)
+                LOG_JOB.debug("Common sampling window: %s - %s", start, end)
+                window = (start, end + self.status_interval, barrier.released)
+
+        groups = dict()
+        for tester, image in tasks:
+            groups.setdefault(tester, []).append(image)
+        for tester, images in groups.items():
+            tester.check_output(images, window)
+
+    def start_synchronized(self):
+        """
+        Start multi groups testing parallel, each step of all groups starts
+        at the same time: one image of each group, then all images of the
+        groups having more than one image.
+        """
+        testers = [tester for tester in self.testers if tester.images]
+        if not testers:
+            return
+        self._run_synchronized([(tester, tester.images[0]) for tester in testers])
+        tasks = [
+            (tester, image)
+            for tester in testers
+            if len(tester.images) > 1
+            for image in tester.images
+        ]
+        if tasks:
+            max(testers, key=lambda t: t.get_burst_empty_time()).wait_empty_burst()
+            self._run_synchronized(tasks)
+        LOG_JOB.debug("ThrottleGroupsSynchronizedTester End")
+
     def start(self):
         """
         Start multi groups testing parallel.
         """
+        if self.synchronized:
+            if self.testers and self.testers[0]._params["os_type"] == "windows":
+                LOG_JOB.warning("Synchronized start is not supported on windows")
+            else:
+                return self.start_synchronized()
+
         num = len(self.testers)
         pool = ThreadPool(num)
 
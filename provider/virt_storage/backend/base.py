@@ -6,6 +6,8 @@ from provider.virt_storage import virt_source, virt_target
 
 class BaseStoragePool(object):
     TYPE = "none"
+    # volume attributes indexed for get_volume_by_*
+    INDEX_ATTRS = ("name", "path", "key", "url")
 
     def __init__(self, name):
         self.name = name
@@ -13,21 +15,21 @@ class BaseStoragePool(object):
         self.source = None
         self.target = None
         self._helper = None
-        self._capacity = None
-        self._available = None
         self._volumes = set()
+        # attr -> str(value) -> volumes, the attributes of volumes are lazy
+        # and may change after added, so volumes changed since last lookup
+        # are indexed on next lookup
+        self._index = {attr: dict() for attr in self.INDEX_ATTRS}
+        self._indexed = dict()
+        self._unindexed = dict()
 
     @property
     def capacity(self):
-        if self._capacity is None:
-            self._capacity = self.helper.capacity
-        return self._capacity
+        return self.helper.capacity
 
     @property
     def available(self):
-        if self._available is None:
-            self._available = self.helper.available
-        return self._available
+        return self.helper.available
 
     @classmethod
     def pool_define_by_params(cls, name, params):
@@ -60,6 +62,10 @@ class BaseStoragePool(object):
         """Destroy storage pools"""
         self.stop()
         self._volumes.clear()
+        for index in self._index.values():
+            index.clear()
+        self._indexed.clear()
+        self._unindexed.clear()
 
     def find_sources(self):
         raise NotImplementedError
@@ -99,16 +105,48 @@ class BaseStoragePool(object):
         :raise:
         """
 
-        matched_volumes = list(
-            filter(lambda x: str(getattr(x, attr)) == str(val), self.get_volumes())
-        )
-        return matched_volumes[0] if matched_volumes else None
+        self._update_index()
+        volumes = self._index[attr].get(str(val))
+        return volumes[0] if volumes else None
+
+    def _unindex_volume(self, volume):
+        _, values = self._indexed.pop(id(volume), (None, {}))
+        for attr, value in values.items():
+            volumes = [v for v in self._index[attr][value] if v is not volume]
+            if volumes:
+                self._index[attr][value] = volumes
+            else:
+                del self._index[attr][value]
+
+    def _update_index(self):
+        """Index the volumes added or changed since last lookup"""
+        while self._unindexed:
+            _, volume = self._unindexed.popitem()
+            self._unindex_volume(volume)
+            values = dict()
+            for attr in self.INDEX_ATTRS:
+                value = getattr(volume, attr)
+                if value is not None:
+                    values[attr] = str(value)
+                    self._index[attr].setdefault(values[attr], []).append(volume)
+            self._indexed[id(volume)] = (volume, values)
+
+    def update_volume_index(self, volume):
+        """Index the volume again on next lookup, called when it's changed"""
+        if id(volume) in self._indexed:
+            self._unindexed[id(volume)] = volume
 
     def get_volumes(self):
         return self._volumes
 
     def add_volume(self, volume):
         self._volumes.add(volume)
+        self._unindexed[id(volume)] = volume
+
+    def discard_volume(self, volume):
+        self._volumes.discard(volume)
+        self._unindexed.pop(id(volume), None)
+        self._unindex_volume(volume)
 
     def acquire_volume(self, volume):
         if volume.is_allocated:
@@ -48,12 +48,14 @@ class DirectoryPool(base.BaseStoragePool):
 
     def create_volume(self, volume):
         storage_util.create_volume(volume)
+        self.helper.invalidate_cache()
         volume.is_allocated = True
         return volume
 
     def remove_volume(self, volume):
         self.helper.remove_file(volume.path)
-        self._volumes.discard(volume)
+        self.helper.invalidate_cache()
+        self.discard_volume(volume)
 
     def get_volume_path_by_param(self, params):
         image_name = params.get("image_name", self.name)
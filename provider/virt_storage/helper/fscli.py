@@ -1,19 +1,25 @@
 import os
 import shutil
+import time
 
 from avocado.utils import process
 
 
 class FsCli(object):
+    # seconds the df result is cached
+    df_cache_ttl = 5
+
     def __init__(self, dir_path):
         self.dir_path = dir_path
         self._is_export = None
         self._protocol = r"file://"
+        self._df_cache = None
 
     def create(self):
         if not self.is_exists:
             os.makedirs(self.dir_path)
         self._is_export = True
+        self.invalidate_cache()
 
     def remove(self):
         if os.path.isdir(self.dir_path):
@@ -68,14 +74,24 @@ class FsCli(object):
             self._is_export = os.path.isdir(self.dir_path)
         return self._is_export
 
+    def _df(self):
+        """Get (size, avail) of the filesystem in bytes, cached for a while"""
+        now = time.monotonic()
+        if self._df_cache is None or now - self._df_cache[0] > self.df_cache_ttl:
+            cmd = "df -k --output=size,avail %s |tail -n1" % self.dir_path
+            output = process.system_output(cmd, shell=True)
+            size, avail = output.split()
+            self._df_cache = (now, int(size) * 1024, int(avail) * 1024)
+        return self._df_cache[1:]
+
+    def invalidate_cache(self):
+        """Drop the cached df result, e.g. after files created or removed"""
+        self._df_cache = None
+
     @property
     def capacity(self):
-        cmd = "df -k --output=size %s |tail -n1" % self.dir_path
-        output = process.system_output(cmd, shell=True)
-        return int(output) * 1024
+        return self._df()[0]
 
     @property
     def available(self):
-        cmd = "df -k --output=avail %s |tail -n1" % self.dir_path
-        output = process.system_output(cmd, shell=True)
-        return int(output) * 1024
+        return self._df()[1]
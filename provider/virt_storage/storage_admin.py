@@ -1,5 +1,5 @@
+import itertools
 import logging
-from functools import reduce
 
 from . import exception
 from .backend import directory, rbd
@@ -15,6 +15,8 @@ class StoragePoolAdmin(object):
     }
 
     __pools = set()
+    __pools_by_name = dict()
+    __pools_by_path = dict()
 
     @classmethod
     def _find_storage_driver(cls, backend_type):
@@ -42,6 +44,8 @@ class StoragePoolAdmin(object):
         pool.refresh()
         state.register_pool_state_machine(pool)
         cls.__pools.add(pool)
+        cls.__pools_by_name[pool.name] = pool
+        cls.__pools_by_path.setdefault(pool.target.path, pool)
         return pool
 
     @classmethod
@@ -53,10 +57,9 @@ class StoragePoolAdmin(object):
     @classmethod
     def list_volumes(cls):
         """List all volumes in host"""
-        out = reduce(
-            lambda x, y: x.union(y), [p.get_volumes() for p in sp_admin.list_pools()]
+        return list(
+            set(itertools.chain.from_iterable(p.get_volumes() for p in cls.__pools))
         )
-        return list(out)
 
     @classmethod
     def list_pools(cls):
@@ -64,10 +67,7 @@ class StoragePoolAdmin(object):
 
     @classmethod
     def find_pool_by_name(cls, name):
-        for pool in cls.__pools:
-            if pool.name == name:
-                return pool
-        return None
+        return cls.__pools_by_name.get(name)
 
     @staticmethod
     def find_pool_by_volume(volume):
@@ -75,12 +75,10 @@ class StoragePoolAdmin(object):
 
     @classmethod
     def find_pool_by_path(cls, path):
-        try:
-            pools = list(filter(lambda x: x.target.path == path, cls.list_pools()))
-            return pools[0]
-        except IndexError:
+        pool = cls.__pools_by_path.get(path)
+        if pool is None:
             LOG_JOB.warning("no storage pool with matching path '%s'", path)
-        return None
+        return pool
 
     @staticmethod
     def start_pool(pool):
@@ -151,20 +149,25 @@ class StoragePoolAdmin(object):
         pool = cls.find_pool_by_volume(volume)
         pool.remove_volume(volume)
 
+    @classmethod
+    def _get_volume_by_attr(cls, attr, val):
+        for pool in cls.__pools:
+            volume = getattr(pool, "get_volume_by_%s" % attr)(val)
+            if volume is not None:
+                return volume
+        return None
+
     @classmethod
     def get_volume_by_name(cls, name):
-        volumes = list(filter(lambda x: x.name == name, cls.list_volumes()))
-        return volumes[0] if volumes else None
+        return cls._get_volume_by_attr("name", name)
 
     @classmethod
     def get_volume_by_path(cls, path):
-        volumes = list(filter(lambda x: x.path == path, cls.list_volumes()))
-        return volumes[0] if volumes else None
+        return cls._get_volume_by_attr("path", path)
 
     @classmethod
     def get_volume_by_url(cls, url):
-        volumes = list(filter(lambda x: x.url == url, cls.list_volumes()))
-        return volumes[0] if volumes else None
+        return cls._get_volume_by_attr("url", url)
 
 
 sp_admin = StoragePoolAdmin()
@@ -8,7 +8,7 @@ from . import virt_encryption
 
 class StorageVolume(object):
     def __init__(self, pool):
-        self.name = None
+        self._name = None
         self.pool = pool
         self._url = None
         self._path = None
@@ -28,6 +28,15 @@ class StorageVolume(object):
         self._no_raw_format_node = False
         self.pool.add_volume(self)
 
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+        self.pool.update_volume_index(self)
+
     @property
     def url(self):
         if self._url is None:
@@ -39,6 +48,7 @@ class StorageVolume(object):
     @url.setter
     def url(self, url):
         self._url = url
+        self.pool.update_volume_index(self)
 
     @property
     def path(self):
@@ -51,6 +61,7 @@ class StorageVolume(object):
     @path.setter
     def path(self, path):
         self._path = path
+        self.pool.update_volume_index(self)
 
     @property
     def key(self):
@@ -64,6 +75,7 @@ class StorageVolume(object):
     @key.setter
     def key(self, key):
         self._key = key
+        self.pool.update_volume_index(self)
 
     @property
     def format(self):
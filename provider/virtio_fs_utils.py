@@ -7,6 +7,8 @@ from avocado.utils import process
 from virttest import data_dir, error_context, utils_misc
 from virttest.utils_windows import virtio_win
 
+from provider.virtio_fs_workload import OPERATIONS, VirtioFsWorkload
+
 LOG_JOB = logging.getLogger("avocado.test")
 
 
@@ -115,6 +117,69 @@ def basic_io_test(test, params, session):
     create_sub_folder_test(params, session, fs_dest, fs_source)
 
 
+@error_context.context_aware
+def workload_test(test, params, session, host_dir, guest_dest):
+    """
+    Virtio_fs parallel workload test. Run concurrent metadata and data
+    operations over a tree of files in guest, compare the contents with the
+    chunked hashes on host and report the throughput of each operation.
+
+    :param test: QEMU test object
+    :param params: Dictionary with the test parameters
+    :param session: the session from guest
+    :param host_dir: The shared directory on host
+    :param guest_dest: The shared directory on guest
+    """
+    error_context.context("Running viofs workload test", LOG_JOB.info)
+    if params.get("os_type") == "windows":
+        test.error("The virtio-fs workload supports Linux guests only.")
+    sizes = [
+        int(float(utils_misc.normalize_data_size(size, "B", "1024")))
+        for size in params.objects("fs_workload_sizes") or ["1M"]
+    ]
+    workload = VirtioFsWorkload(
+        session,
+        host_dir,
+        guest_dest,
+        count=params.get_numeric("fs_workload_files", 100),
+        sizes=sizes,
+        depth=params.get_numeric("fs_workload_depth", 2),
+        fanout=params.get_numeric("fs_workload_fanout", 4),
+        workers=params.get_numeric("fs_workload_workers", 8),
+        chunk_size=int(
+            float(
+                utils_misc.normalize_data_size(
+                    params.get("fs_workload_chunk", "1M"), "B", "1024"
+                )
+            )
+        ),
+        timeout=params.get_numeric("fs_io_timeout", 600),
+        seed=params.get("fs_workload_seed"),
+    )
+    operations = params.objects("fs_workload_ops") or list(OPERATIONS)
+    errors = []
+    try:
+        workload.prepare()
+        for op in operations:
+            workload.run_op(op)
+            if op in ("read", "write"):
+                errors.extend(workload.verify(op))
+            else:
+                errors.extend(
+                    "%s of %s is not visible on host" % (op, path)
+                    for path in workload.check_metadata(op)
+                )
+        workload.report(test)
+    finally:
+        session.cmd("rm -rf %s" % workload.guest_root, workload.timeout)
+        workload.cleanup()
+    if errors:
+        test.fail(
+            "virtio-fs workload failed with %d errors:\n%s"
+            % (len(errors), "\n".join(errors[:10]))
+        )
+
+
 def create_sub_folder_test(params, session, guest_dest, host_dir):
     """
     Test for creating the sub folder at the shared directory.
@@ -0,0 +1,424 @@
+"""
+Module to run a parallel workload on a virtio-fs share.
+
+A tree of files of known sizes is generated in the shared directory on
+host, the lists of the files are written beside it, so the guest reads the
+lists through the share and no long command is sent to the guest. The
+guest runs each operation over all the files by a pool of concurrent
+workers (xargs -P), and times the whole operation itself, so the session
+latency isn't counted:
+
+- create: make the directories and empty files
+- stat: stat the files
+- read: read and hash the files generated on host
+- write: write random files of the tree
+- unlink: remove the files
+
+The contents are compared by a manifest of the files hashed in chunks on
+host by a pool of workers. The guest hashes of the files must match the
+manifest, and the first mismatching chunk of a file is located by hashing
+the chunks in the guest. The metadata operations report ops per second,
+the data operations MB per second.
+
+The guest commands are for Linux guests (GNU coreutils and findutils).
+
+Available classes:
+- FileDigest: chunked hashes of a file
+- OpResult: result of one operation
+- VirtioFsWorkload: run the workload on a share
+
+Available functions:
+- build_tree: generate the paths and sizes of a tree of files
+- hash_file: hash a file in chunks
+- build_manifest: hash files in chunks in parallel
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import random
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+MB = 1024**2
+OPERATIONS = ("create", "stat", "read", "write", "unlink")
+METADATA_OPERATIONS = ("create", "stat", "unlink")
+
+# the guest commands run in the workload directory, %(workers)s is the
+# number of the concurrent workers
+GUEST_COMMANDS = {
+    "create": (
+        "xargs -a dirs.lst -P %(workers)s -n 64 mkdir -p && "
+        "xargs -a meta.lst -P %(workers)s -n 64 touch"
+    ),
+    "stat": "xargs -a meta.lst -P %(workers)s -n 64 stat -c %%s > /dev/null",
+    "read": "xargs -a read.lst -P %(workers)s -n 16 md5sum > %(result)s",
+    "write": (
+        "xargs -a write.lst -P %(workers)s -L 1 "
+        'sh -c \'head -c "$1" /dev/urandom > "$0"\' && sync'
+    ),
+    "unlink": "xargs -a meta.lst -P %(workers)s -n 64 rm -f",
+}
+GUEST_HASH_CMD = "xargs -a written.lst -P %(workers)s -n 16 md5sum > %(result)s"
+GUEST_CHUNK_CMD = "dd if=%s bs=%d skip=%d count=1 status=none | md5sum"
+TIMED_CMD = (
+    "cd %s && s=$(date +%%s.%%N) && %s && e=$(date +%%s.%%N) && echo elapsed $s $e"
+)
+
+
+class FileDigest(
+    collections.namedtuple("FileDigest", ["path", "size", "md5", "chunks"])
+):
+    """
+    Hashes of a file, md5 of the whole file and the list of md5 of its
+    chunks
+    """
+
+    __slots__ = ()
+
+
+class OpResult(
+    collections.namedtuple("OpResult", ["name", "ops", "nbytes", "seconds"])
+):
+    """
+    Result of one operation over the files, nbytes is 0 for metadata
+    operations
+    """
+
+    __slots__ = ()
+
+    @property
+    def ops_per_sec(self):
+        return self.ops / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_sec(self):
+        return self.nbytes / float(MB) / self.seconds if self.seconds else 0.0
+
+
+def build_tree(count, sizes, depth=2, fanout=4, seed=None):
+    """
+    Generate the paths and sizes of a tree of files
+
+    :param count: number of the files
+    :param sizes: file sizes in bytes to choose from
+    :param depth: depth of the directories
+    :param fanout: sub directories of each directory
+    :param seed: seed of the random sizes and directories
+    :return: tuple of the list of directories and the list of (path, size),
+             the paths are relative
+    """
+    rand = random.Random(seed)
+    dirs = [""]
+    for _ in range(depth):
+        dirs = [
+            os.path.join(parent, "d%d" % i) for parent in dirs for i in range(fanout)
+        ]
+    files = [
+        (os.path.join(rand.choice(dirs), "f%06d" % i), rand.choice(sizes))
+        for i in range(count)
+    ]
+    return [d for d in dirs if d], files
+
+
+def hash_file(path, chunk_size=MB):
+    """
+    Hash a file in chunks
+
+    :param path: file path
+    :param chunk_size: bytes of a chunk
+    :return: FileDigest
+    """
+    # md5 to compare with md5sum in guest, not for security, FIPS allows it
+    whole = hashlib.md5(usedforsecurity=False)
+    chunks = []
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            whole.update(data)
+            chunks.append(hashlib.md5(data, usedforsecurity=False).hexdigest())
+            size += len(data)
+    return FileDigest(path, size, whole.hexdigest(), chunks)
+
+
+def build_manifest(root, paths, chunk_size=MB, workers=None):
+    """
+    Hash files in chunks in parallel
+
+    :param root: directory of the files
+    :param paths: relative paths of the files
+    :param chunk_size: bytes of a chunk
+    :param workers: number of the hashing threads, cpu count by default
+    :return: dict of the relative path and FileDigest, or None if the file
+             is missing
+    """
+
+    def _hash(path):
+        try:
+            return hash_file(os.path.join(root, path), chunk_size)
+        except (IOError, OSError) as err:
+            LOG_JOB.debug("Failed to hash %s: %s", path, err)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return dict(zip(paths, pool.map(_hash, paths)))
+
+
+def _write_random(path, size):
+    with open(path, "wb") as f:
+        while size > 0:
+            data = os.urandom(min(size, MB))
+            f.write(data)
+            size -= len(data)
+
+
+class VirtioFsWorkload(object):
+    """
+    Run a parallel workload on a virtio-fs share
+    Example of usage:
+        workload = VirtioFsWorkload(session, fs_source, fs_dest, count=1000)
+        workload.prepare()
+        workload.run(OPERATIONS)
+        mismatches = workload.verify("read") + workload.verify("write")
+        workload.report(test)
+        workload.cleanup()
+    """
+
+    def __init__(
+        self,
+        session,
+        host_dir,
+        guest_dir,
+        count=100,
+        sizes=(MB,),
+        depth=2,
+        fanout=4,
+        workers=8,
+        chunk_size=MB,
+        timeout=600,
+        seed=None,
+        name="virtio_fs_workload",
+    ):
+        """
+        :param session: guest session
+        :param host_dir: shared directory on host
+        :param guest_dir: mount point of the share in guest
+        :param count: number of the files of each data operation
+        :param sizes: file sizes in bytes to choose from
+        :param depth: depth of the directories
+        :param fanout: sub directories of each directory
+        :param workers: number of the concurrent workers in guest, and the
+                        hashing threads on host
+        :param chunk_size: bytes of a chunk of the manifest
+        :param timeout: timeout of one operation in guest
+        :param seed: seed of the tree
+        :param name: name of the workload directory in the share
+        """
+        self.session = session
+        self.host_root = os.path.join(host_dir, name)
+        self.guest_root = "%s/%s" % (guest_dir.rstrip("/"), name)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.results = collections.OrderedDict()
+        self.manifests = dict()
+        self.guest_hashes = dict()
+        self.dirs, files = build_tree(count, sizes, depth, fanout, seed)
+        # the data operations use separate trees, so they can run in any order
+        self.files = {
+            op: [(os.path.join(op, p), s) for p, s in files]
+            for op in ("read", "write", "meta")
+        }
+
+    def _meta_dirs(self):
+        return ["meta"] + [os.path.join("meta", d) for d in self.dirs]
+
+    def _write_list(self, name, lines):
+        with open(os.path.join(self.host_root, name), "w") as f:
+            for line in lines:
+                f.write("%s\n" % line)
+
+    def prepare(self):
+        """Generate the files of the read tree and the lists on host"""
+        if os.path.exists(self.host_root):
+            shutil.rmtree(self.host_root)
+        for op in ("read", "write"):
+            for d in self.dirs or [""]:
+                os.makedirs(os.path.join(self.host_root, op, d))
+        files = self.files["read"]
+        LOG_JOB.info(
+            "Generating %d files of %d MB on host",
+            len(files),
+            sum(s for _, s in files) // MB,
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(
+                pool.map(
+                    lambda f: _write_random(os.path.join(self.host_root, f[0]), f[1]),
+                    files,
+                )
+            )
+        self.manifests["read"] = build_manifest(
+            self.host_root, [p for p, _ in files], self.chunk_size, self.workers
+        )
+        self._write_list("dirs.lst", self._meta_dirs())
+        self._write_list("meta.lst", [p for p, _ in self.files["meta"]])
+        self._write_list("read.lst", [p for p, _ in files])
+        self._write_list("write.lst", ["%s %d" % f for f in self.files["write"]])
+        self._write_list("written.lst", [p for p, _ in self.files["write"]])
+
+    def _guest_result(self, op):
+        return "/tmp/%s.md5" % op
+
+    def _run_timed(self, cmd):
+        """Run a command in the workload directory, return guest seconds"""
+        output = self.session.cmd(TIMED_CMD % (self.guest_root, cmd), self.timeout)
+        match = re.search(r"elapsed (\S+) (\S+)", output)
+        return float(match.group(2)) - float(match.group(1))
+
+    def _read_guest_hashes(self, op):
+        output = self.session.cmd_output(
+            "cat %s; rm -f %s" % (self._guest_result(op), self._guest_result(op)),
+            self.timeout,
+        )
+        hashes = dict()
+        for line in output.splitlines():
+            fields = line.split()
+            if len(fields) == 2 and len(fields[0]) == 32:
+                hashes[fields[1]] = fields[0]
+        return hashes
+
+    def run_op(self, op):
+        """
+        Run an operation over the files in guest
+
+        :param op: operation name in OPERATIONS
+        :return: OpResult
+        """
+        params = {"workers": self.workers, "result": self._guest_result(op)}
+        seconds = self._run_timed(GUEST_COMMANDS[op] % params)
+        if op == "create":
+            ops = len(self._meta_dirs()) + len(self.files["meta"])
+        else:
+            ops = len(self.files["meta" if op in METADATA_OPERATIONS else op])
+        nbytes = 0
+        if op == "read":
+            nbytes = sum(s for _, s in self.files["read"])
+            self.guest_hashes["read"] = self._read_guest_hashes("read")
+        elif op == "write":
+            nbytes = sum(s for _, s in self.files["write"])
+            params["result"] = self._guest_result("written")
+            self.session.cmd(
+                "cd %s && %s" % (self.guest_root, GUEST_HASH_CMD % params),
+                self.timeout,
+            )
+            self.guest_hashes["write"] = self._read_guest_hashes("written")
+            self.manifests["write"] = build_manifest(
+                self.host_root,
+                [p for p, _ in self.files["write"]],
+                self.chunk_size,
+                self.workers,
+            )
+        result = OpResult(op, ops, nbytes, seconds)
+        self.results[op] = result
+        if op in METADATA_OPERATIONS:
+            LOG_JOB.info(
+                "virtio-fs %s: %d ops in %.2fs, %.1f ops/s",
+                op,
+                ops,
+                seconds,
+                result.ops_per_sec,
+            )
+        else:
+            LOG_JOB.info(
+                "virtio-fs %s: %d MB in %.2fs, %.1f MB/s",
+                op,
+                nbytes // MB,
+                seconds,
+                result.mb_per_sec,
+            )
+        return result
+
+    def run(self, operations=OPERATIONS):
+        """Run the operations in order, unlink needs create first"""
+        for op in operations:
+            self.run_op(op)
+
+    def check_metadata(self, op):
+        """
+        Check the metadata operation is visible on host
+
+        :return: list of the paths in wrong state
+        """
+        exists = op != "unlink"
+        return [
+            p
+            for p, _ in self.files["meta"]
+            if os.path.exists(os.path.join(self.host_root, p)) != exists
+        ]
+
+    def _locate_chunk(self, path, digest):
+        """Get the index of the first chunk of a file mismatching in guest"""
+        guest_path = "%s/%s" % (self.guest_root, path)
+        for index, md5 in enumerate(digest.chunks):
+            output = self.session.cmd_output(
+                GUEST_CHUNK_CMD % (guest_path, self.chunk_size, index), self.timeout
+            )
+            if output.split()[:1] != [md5]:
+                return index
+        return None
+
+    def verify(self, op, locate=3):
+        """
+        Compare the guest hashes of a data operation with the host manifest
+
+        :param op: read or write
+        :param locate: number of the mismatching files to locate the first
+                       mismatching chunk of
+        :return: list of the mismatch messages
+        """
+        mismatches = []
+        manifest = self.manifests.get(op, {})
+        hashes = self.guest_hashes.get(op, {})
+        for path, digest in manifest.items():
+            md5 = hashes.get(path)
+            if digest is None:
+                mismatches.append("%s is missing on host" % path)
+            elif md5 is None:
+                mismatches.append("%s is not hashed in guest" % path)
+            elif md5 != digest.md5:
+                msg = "%s differs between host and guest" % path
+                if locate > 0:
+                    locate -= 1
+                    msg += ", from chunk %s" % self._locate_chunk(path, digest)
+                mismatches.append(msg)
+        LOG_JOB.info(
+            "virtio-fs %s: %d files compared, %d mismatches",
+            op,
+            len(manifest),
+            len(mismatches),
+        )
+        return mismatches
+
+    def report(self, test, prefix="virtio_fs"):
+        """Write the ops/s and MB/s of the operations in test keyvals"""
+        keyvals = dict()
+        for op, result in self.results.items():
+            keyvals["%s--%s--seconds" % (prefix, op)] = "%.3f" % result.seconds
+            keyvals["%s--%s--ops_per_sec" % (prefix, op)] = "%.1f" % result.ops_per_sec
+            if result.nbytes:
+                keyvals["%s--%s--mb_per_sec" % (prefix, op)] = (
+                    "%.1f" % result.mb_per_sec
+                )
+        test.write_test_keyval(keyvals)
+
+    def cleanup(self):
+        """Remove the workload directory on host"""
+        shutil.rmtree(self.host_root, ignore_errors=True)
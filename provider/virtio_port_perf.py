@@ -0,0 +1,202 @@
+"""
+Module for the throughput tests of virtio ports.
+
+The payload is allocated once and sent through a memoryview, so the data
+is never copied or rebuilt in python, and the partial writes of a big
+buffer continue from the offset sent. The transferred bytes are sampled
+on the monotonic clock into an array backed series, and the rates are
+computed from the real elapsed time of each interval.
+
+Available classes:
+- ThBulkSend: send a payload in a loop by bulk writes
+- ThBulkRecv: receive data into a preallocated buffer and drop it
+- RateSampler: sample the transferred bytes of a thread
+
+Available functions:
+- make_payload: allocate a random payload
+"""
+
+import logging
+import os
+import select
+import socket
+import time
+from threading import Thread
+
+from provider.perf_stats import Series
+
+LOG_JOB = logging.getLogger("avocado.test")
+
+# size of the random block repeated to fill a payload
+RANDOM_BLOCK = 1048576
+
+
+def make_payload(size):
+    """
+    Allocate a random payload, a random block is repeated for the big ones
+
+    :param size: payload size in bytes
+    :return: bytearray
+    """
+    block = os.urandom(min(size, RANDOM_BLOCK))
+    payload = bytearray(size)
+    view = memoryview(payload)
+    for offset in range(0, size, len(block)):
+        chunk = view[offset : offset + len(block)]
+        chunk[:] = block[: len(chunk)]
+    return payload
+
+
+class ThBulkSend(Thread):
+    """
+    Send a payload in a loop, the same interface as
+    qemu_virtio_port.ThSend without its limit of the payload size.
+    """
+
+    def __init__(self, port, data, exit_event, quiet=False, timeout=0.1):
+        """
+        :param port: destination socket
+        :param data: payload, bytes-like object
+        :param exit_event: exit event
+        :param quiet: if true, log the failure instead of raising it
+        :param timeout: seconds to wait for the port being writable, the
+                        exit event is checked between the waits
+        """
+        Thread.__init__(self)
+        self.port = port
+        self.data = memoryview(data)
+        self.exitevent = exit_event
+        self.timeout = timeout
+        self.idx = 0
+        self.quiet = quiet
+        self.ret_code = 1  # sets to 0 when finish properly
+
+    def run(self):
+        LOG_JOB.debug("ThBulkSend %s: run", self.name)
+        port_timeout = self.port.gettimeout()
+        self.port.setblocking(False)
+        poller = select.poll()
+        poller.register(self.port, select.POLLOUT)
+        size = len(self.data)
+        offset = 0
+        try:
+            while not self.exitevent.is_set():
+                if not poller.poll(self.timeout * 1000):
+                    continue
+                try:
+                    sent = self.port.send(self.data[offset:])
+                except (BlockingIOError, InterruptedError):
+                    continue
+                self.idx += sent
+                offset = (offset + sent) % size
+            LOG_JOB.debug("ThBulkSend %s: exit(%d)", self.name, self.idx)
+            self.ret_code = 0
+        except Exception as err:
+            if not self.quiet:
+                raise
+            LOG_JOB.debug(err)
+            self.ret_code = 0
+        finally:
+            self.port.settimeout(port_timeout)
+
+
+class ThBulkRecv(Thread):
+    """
+    Receive data into a preallocated buffer and drop it, the same interface
+    as qemu_virtio_port.ThRecv.
+    """
+
+    def __init__(self, port, event, blocklen=1024, quiet=False):
+        """
+        :param port: data source socket
+        :param event: exit event
+        :param blocklen: size of the receive buffer
+        :param quiet: if true, log the failure instead of raising it
+        """
+        Thread.__init__(self)
+        self.port = port
+        self.exitevent = event
+        self.buffer = bytearray(blocklen)
+        self.idx = 0
+        self.quiet = quiet
+        self.ret_code = 1  # sets to 0 when finish properly
+
+    def run(self):
+        LOG_JOB.debug("ThBulkRecv %s: run", self.name)
+        port_timeout = self.port.gettimeout()
+        self.port.settimeout(0.1)
+        try:
+            while not self.exitevent.is_set():
+                try:
+                    self.idx += self.port.recv_into(self.buffer)
+                except socket.timeout:
+                    pass
+            LOG_JOB.debug("ThBulkRecv %s: exit(%d)", self.name, self.idx)
+            self.ret_code = 0
+        except Exception as err:
+            if not self.quiet:
+                raise
+            LOG_JOB.debug(err)
+            self.ret_code = 0
+        finally:
+            self.port.settimeout(port_timeout)
+
+
+class RateSampler(object):
+    """
+    Sample the transferred bytes of a thread on the monotonic clock
+    Example of usage:
+        sampler = RateSampler(thread)
+        thread.start()
+        sampler.run(duration, 100)
+        rates = sampler.rates(1048576)
+    """
+
+    def __init__(self, thread, attr="idx"):
+        """
+        :param thread: thread counting the transferred bytes
+        :param attr: attribute of the counter
+        """
+        self.thread = thread
+        self.attr = attr
+        self.series = Series("%s.%s" % (thread.name, attr))
+
+    def sample(self):
+        self.series.append(getattr(self.thread, self.attr), time.monotonic())
+
+    def run(self, duration, count=100):
+        """
+        Take count + 1 samples in duration, the sampling times are scheduled
+        from the start so the sleeping error doesn't accumulate
+
+        :return: seconds elapsed more than duration
+        """
+        interval = float(duration) / count
+        start = time.monotonic()
+        self.sample()
+        for i in range(1, count + 1):
+            delay = start + i * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.sample()
+        return time.monotonic() - start - duration
+
+    def rates(self, scale=1.0):
+        """
+        Get the transfer rates of the intervals
+
+        :param scale: unit of the rates in bytes, e.g. 1048576 for MB/s
+        :return: Series of the rates
+        """
+        rates = self.series.rates()
+        for i in range(len(rates.values)):
+            rates.values[i] /= scale
+        return rates
+
+    @property
+    def throughput(self):
+        """Mean bytes per second of the whole sampling time"""
+        times, values = self.series.times, self.series.values
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (values[-1] - values[0]) / (times[-1] - times[0])
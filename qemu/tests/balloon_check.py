@@ -9,6 +9,7 @@ from virttest.utils_numeric import normalize_data_size
 from virttest.utils_test.qemu import MemoryBaseTest
 
 from provider import win_driver_utils
+from provider.balloon_tracker import BalloonTracker
 
 
 class BallooningTest(MemoryBaseTest):
@@ -21,6 +22,9 @@ class BallooningTest(MemoryBaseTest):
         super(BallooningTest, self).__init__(test, params, env)
 
         self.vm = env.get_vm(params["main_vm"])
+        self.tracker = None
+        if params.get("balloon_track_stats", "no") == "yes":
+            self.tracker = self.get_tracker()
         if params.get("paused_after_start_vm") != "yes":
             self.params["balloon_test_setup_ready"] = False
             if self.params.get("os_type") == "windows":
@@ -127,6 +131,33 @@ class BallooningTest(MemoryBaseTest):
         )
         time.sleep(sleep_time)
 
+    def get_tracker(self):
+        """
+        Get the tracker of the balloon, polling the guest statistics
+
+        :return: BalloonTracker object
+        """
+        base_path = self.params.get("base_path", "/machine/peripheral/")
+        device_path = base_path + self.params["balloon"]
+        # track the same guest memory as get_memory_status
+        if (
+            self.params["os_type"] == "windows"
+            or self.params.get("balloon_opt_deflate_on_oom") == "yes"
+        ):
+            metric = "stat-used-memory"
+        else:
+            metric = "stat-total-memory"
+        tracker = BalloonTracker(
+            self.vm,
+            device_path,
+            interval=float(self.params.get("balloon_track_interval", 0.25)),
+            metric=metric,
+            window=float(self.params.get("balloon_settle_window", 3)),
+            max_rate=float(self.params.get("balloon_settle_rate", 5)),
+        )
+        tracker.enable_polling(int(self.params.get("polling_interval", 1)))
+        return tracker
+
     def get_memory_stat(self, device_path):
         """
         Get memory statistics from qmp.
@@ -202,6 +233,8 @@ class BallooningTest(MemoryBaseTest):
         """
         self.env["balloon_test"] = 0
         error_context.context("Change VM memory to %s" % new_mem, self.test.log.info)
+        if self.tracker:
+            self.tracker.begin()
         try:
             self.vm.balloon(new_mem)
             self.env["balloon_test"] = 1
@@ -224,10 +257,13 @@ class BallooningTest(MemoryBaseTest):
             compare_mem = new_mem
 
         balloon_timeout = float(self.params.get("balloon_timeout", 480))
-        status = utils_misc.wait_for(
-            (lambda: compare_mem == self.get_ballooned_memory()), balloon_timeout
-        )
-        if status is None:
+        if self.tracker and self.tracker.tracking:
+            status = self.tracker.wait(balloon_timeout, target=compare_mem)
+        else:
+            status = utils_misc.wait_for(
+                (lambda: compare_mem == self.get_ballooned_memory()), balloon_timeout
+            )
+        if not status:
             raise exceptions.TestFail(
                 "Failed to balloon memory to expect value during %ss" % balloon_timeout
             )
@@ -279,6 +315,9 @@ class BallooningTest(MemoryBaseTest):
         """
         Wait until guest memory don't change
         """
+        if self.tracker:
+            self.tracker.wait(float(timeout))
+            return
         self.test.log.info("Wait until guest memory don't change")
         threshold = int(self.params.get("guest_stable_threshold", 100))
         is_stable = self._mem_state(threshold)
@@ -679,4 +718,6 @@ def run(test, params, env):
         if params.get("os_type") == "windows":
             win_driver_utils.memory_leak_check(balloon_test.vm, test, params)
     finally:
+        if balloon_test.tracker:
+            balloon_test.tracker.report(test)
         balloon_test.close_sessions()
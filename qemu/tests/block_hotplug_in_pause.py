@@ -7,6 +7,7 @@ from virttest.qemu_devices import qdevices
 from virttest.qemu_devices.utils import DeviceError, DeviceUnplugError
 
 from provider import win_driver_utils
+from provider.qmp_event_store import get_event_store
 
 
 @error_context.context_aware
@@ -80,24 +81,15 @@ def run(test, params, env):
         return devs
 
     def verify_deleted_event(device_list, timeout=120):
-        def get_deleted_event(dev_qid):
-            for event in vm.monitor.get_events():
-                if (
-                    "DEVICE_DELETED" in event.get("event")
-                    and "device" in event.get("data")
-                    and dev_qid == event.get("data")["device"]
-                ):
-                    return True
-            return False
-
+        event_store = get_event_store(vm)
         for dev in device_list:
             # QObjects don't receive a DELETED EVENT back from QMP
             # Filter them out
             if isinstance(dev, qdevices.QObject):
                 continue
             dev_qid = dev.get_qid()
-            if not utils_misc.wait_for(
-                lambda: get_deleted_event(dev_qid), timeout, 0, 0
+            if not event_store.wait_for_event(
+                "DEVICE_DELETED", timeout, device=dev_qid
             ):
                 test.fail(
                     "Failed to get deleted event of %s "
@@ -1,14 +1,23 @@
-import copy
 import itertools
 import json
-import statistics as st
+import os
 import time
 
 from avocado.utils import process
-from virttest import env_process, utils_disk
+from virttest import data_dir, env_process, utils_disk
 from virttest.utils_misc import get_linux_drive_path
 from virttest.utils_windows.drive import get_disk_props_by_serial_number
 
+from provider import host_disk_probe
+from provider.fio_parser import get_interval_iops, parse_fio_results
+from provider.perf_stats import (
+    Series,
+    bootstrap_ci,
+    is_stable,
+    mann_whitney_u,
+    summarize,
+    trim_deviation,
+)
 from provider.storage_benchmark import generate_instance
 
 
@@ -58,6 +67,8 @@ def run(test, params, env):
         fio_opts = params["fio_cmd"]
 
         fio_opts += params.get("fio_addition_cmd", "")
+        if fio_status_interval:
+            fio_opts += " --status-interval=%s" % fio_status_interval
         fio_opts += params.get("fio_stonewall_cmd", "")
         fio_opts += fio_combination
         results["fio_opts"] = fio_opts
@@ -202,68 +213,81 @@ def run(test, params, env):
                 if fio_interval:
                     time.sleep(fio_interval)
 
+            if stop_when_stable and i >= min_run_times and is_results_stable(results):
+                logger.info("Results are stable after %s runs, stop testing", i)
+                break
+
+    def is_results_stable(results):
+        """Check the IOPS of all jobs are stable enough to stop testing"""
+        for img in results["images"]:
+            for key, job in results[img]["jobs"].items():
+                if not is_stable(job["iops"], dispersion, min_run_times):
+                    logger.debug("%s %s is not stable: %s", img, key, job["iops"])
+                    return False
+        return True
+
     def parse_fio_result(cmd_output, img, results, record=False):
         # if record:
         #     logger.debug(cmd_output)
         try:
-            json_output = json.loads(cmd_output)
+            fio_results = parse_fio_results(cmd_output)
+            if not fio_results:
+                raise ValueError("No fio json output found")
             img_result = results[img]
+            # with --status-interval the last result is the final one
+            fio_result = fio_results[-1]
             if record:
-                img_result["results"].append(copy.deepcopy(json_output))
-            if "directory" in json_output["global options"]:
-                filename = json_output["global options"]["directory"]
-            else:
-                filename = json_output["global options"]["filename"]
+                img_result["results"].append(fio_result)
+            filename = fio_result.filename
             if img_result.get("filename"):
                 if filename != img_result["filename"]:
                     test.fail("Wrong data %s %s" % (filename, img_result["filename"]))
             else:
                 # init global info
-                global_options = copy.deepcopy(json_output["global options"])
                 img_result["filename"] = filename
-                img_result["global_options"] = global_options
+                img_result["global_options"] = fio_result.global_options
                 img_result["jobs"] = {}
                 if os_type == "linux":
-                    disk_name = "unknown"
-                    if json_output.get("disk_util"):
-                        disk_name = json_output["disk_util"][0]["name"]
-                    img_result["disk_name"] = disk_name
+                    img_result["disk_name"] = fio_result.disk_name or "unknown"
 
             jobs = img_result["jobs"]
-            for job in json_output["jobs"]:
-                jobname = job["jobname"]
+            for job in fio_result.jobs:
+                jobname = job.jobname
                 if jobname not in jobs:
                     # init job info
                     logger.debug("Add job: %s %s", filename, jobname)
                     jobs[jobname] = {
-                        "options": job["job options"].copy(),
+                        "options": job.options,
                         "iops": [],
                         "iops_avg": 0,
                         "lat": [],
                         "lat_avg": 0,
                         "job_runtime": 0,
                         "bw": [],
+                        "interval_iops": Series(jobname),
                     }
-                read = int(job["read"]["iops"])
-                write = int(job["write"]["iops"])
+                read = int(job.read_iops)
+                write = int(job.write_iops)
                 iops = read + write
-                bw = int(job["read"]["bw"]) + int(job["write"]["bw"])
-                lat = int(job["read"]["lat_ns"]["mean"]) + int(
-                    job["write"]["lat_ns"]["mean"]
-                )
+                bw = int(job.read_bw) + int(job.write_bw)
+                lat = int(job.read_lat_ns) + int(job.write_lat_ns)
                 logger.debug(
                     "Get %s %s  runtime:%s IOPS read:%s write:%s sum:%s",
                     filename,
                     jobname,
-                    job["job_runtime"],
+                    job.runtime,
                     read,
                     write,
                     iops,
                 )
-                img_result["jobs"][jobname]["iops"].append(iops)
-                img_result["jobs"][jobname]["lat"].append(lat)
-                img_result["jobs"][jobname]["bw"].append(bw)
-                img_result["jobs"][jobname]["job_runtime"] = job["job_runtime"]
+                jobs[jobname]["iops"].append(iops)
+                jobs[jobname]["lat"].append(lat)
+                jobs[jobname]["bw"].append(bw)
+                jobs[jobname]["job_runtime"] = job.runtime
+                if len(fio_results) > 1:
+                    jobs[jobname]["interval_iops"].extend(
+                        get_interval_iops(fio_results, jobname).skip(fio_ramp_time)
+                    )
 
             return img_result
 
@@ -271,17 +295,31 @@ def run(test, params, env):
             logger.error("Exception:%s %s", err, cmd_output)
             raise err
 
-    def remove_maximum_deviation(alist):
-        if not alist:
-            return -1
-        average = sum(alist) * 1.0 / len(alist)
-        max_deviation = 0
-        pos = 0
-        for i, a in enumerate(alist):
-            if abs(a - average) > max_deviation:
-                max_deviation = abs(a - average)
-                pos = i
-        return alist.pop(pos)
+    def is_significant(obj1_job, obj2_job, key):
+        """
+        Check the IOPS of obj1 is greater than obj2 by Mann-Whitney U test,
+        the interval samples are used if fio run with --status-interval.
+        Too few samples are always taken as significant.
+        """
+        samples = []
+        for job in (obj1_job, obj2_job):
+            interval_iops = job["interval_iops"]
+            samples.append(
+                interval_iops.values if len(interval_iops) else job["sample_iops"]
+            )
+        if min(len(samples[0]), len(samples[1])) < min_run_times:
+            return True
+        u, p = mann_whitney_u(samples[0], samples[1], "greater")
+        low, high = bootstrap_ci(samples[1], samples[0])
+        logger.debug(
+            "%s: Mann-Whitney U:%s p:%.4f median gap CI:(%.1f, %.1f)",
+            key,
+            u,
+            p,
+            low,
+            high,
+        )
+        return p < significance
 
     def compare_fio_result(results):
         # preprocess data to smooth data
@@ -292,33 +330,41 @@ def run(test, params, env):
                 raw_iops = job["iops"]
                 raw_lat = job["lat"]
                 logger.debug("%s raw %s iops:%s", img, key, raw_iops)
-                job["sample_iops"] = raw_iops.copy()
-                job["sample_lat"] = raw_lat.copy()
-                iops = job["sample_iops"]
-                lat = job["sample_lat"]
-
                 # Discard maximum deviation
-                if run_times > 3:
-                    drop_num = round(run_times * (1 - sampling_rate))
-                    logger.debug("Drop %s sample data...", drop_num)
-                    for i in range(drop_num):
-                        remove_maximum_deviation(iops)
-                        remove_maximum_deviation(lat)
-                sample_num = len(iops)
-                iops_avg = int(sum(iops) / sample_num)
+                if len(raw_iops) > 3:
+                    logger.debug("Keep %s of sample data...", sampling_rate)
+                    job["sample_iops"] = trim_deviation(raw_iops, sampling_rate)
+                    job["sample_lat"] = trim_deviation(raw_lat, sampling_rate)
+                else:
+                    job["sample_iops"] = raw_iops.copy()
+                    job["sample_lat"] = raw_lat.copy()
+                iops = job["sample_iops"]
+                stat = summarize(iops)
+                iops_avg = int(stat["mean"])
                 job["iops_avg"] = iops_avg
-                job["iops_std"] = 0 if sample_num == 1 else st.stdev(iops)
-                job["iops_dispersion"] = round(job["iops_std"] / iops_avg, 6)
-                job["lat_avg"] = int(sum(lat) / sample_num)
+                job["iops_median"] = stat["median"]
+                job["iops_ci"] = stat["ci"]
+                job["iops_std"] = stat["stdev"]
+                job["iops_dispersion"] = round(stat["cv"], 6)
+                job["lat_avg"] = int(sum(job["sample_lat"]) / len(job["sample_lat"]))
                 logger.debug(
-                    "%s smooth %s iops:%s AVG:%s lat:%s V:%s%%",
+                    "%s smooth %s iops:%s AVG:%s median:%s CI:%s lat:%s V:%s%%",
                     img,
                     key,
                     iops,
                     iops_avg,
+                    stat["median"],
+                    stat["ci"],
                     job["lat_avg"],
                     job["iops_dispersion"] * 100,
                 )
+                if len(job["interval_iops"]):
+                    logger.debug(
+                        "%s %s interval iops: %s",
+                        img,
+                        key,
+                        job["interval_iops"].summary(),
+                    )
         # compare data
         unexpected_result = {}
         warning_result = {}
@@ -362,7 +408,10 @@ def run(test, params, env):
                     r = (obj1_name, obj2_name, obj1_avg, obj2_avg)
                     rs = None
                     if obj1_avg > obj2_avg * (1 + error_threshold):
-                        rs = unexpected_result
+                        if is_significant(obj1_job, obj2_job, key):
+                            rs = unexpected_result
+                        else:
+                            rs = warning_result
                     elif obj1_avg > obj2_avg * (1 + warn_threshold):
                         # warn threshold
                         rs = warning_result
@@ -382,17 +431,17 @@ def run(test, params, env):
     def get_disk_iops(disk):
         cmd = host_test_cmd % disk
         logger.debug(cmd)
-        cmd_output = process.getoutput(cmd)
         try:
-            json_output = json.loads(cmd_output)
-            job = json_output["jobs"][0]
-            read = int(job["read"]["iops"])
-            write = int(job["write"]["iops"])
-            iops = read + write
-            logger.debug("Find read:%s write:%s total:%s", read, write, iops)
-            return iops
+            return host_disk_probe.get_disk_iops(
+                cmd,
+                disk,
+                host_iops_cache,
+                host_iops_fast_probe,
+                window=host_iops_probe_window,
+                max_cv=dispersion,
+            )
         except Exception as err:
-            logger.error("Exception:%s %s", err, cmd_output)
+            logger.error("Failed to get iops of %s: %s", disk, err)
             raise err
 
     def choose_fastest_disk(disks):
@@ -562,6 +611,11 @@ def run(test, params, env):
     guest_deinit_operation = params.get("guest_deinit_operation")
     host_deinit_operation = params.get("host_deinit_operation")
     sampling_rate = params.get_numeric("sampling_rate", 0.8, float)
+    fio_status_interval = params.get_numeric("fio_status_interval", 0)
+    fio_ramp_time = params.get_numeric("fio_ramp_time", 0, float)
+    significance = params.get_numeric("significance", 0.05, float)
+    stop_when_stable = params.get("stop_when_stable", "no") == "yes"
+    min_run_times = params.get_numeric("min_run_times", 3)
     dispersion = params.get_numeric("dispersion", 0.1, float)
     error_threshold = params.get_numeric("error_threshold", 0.1, float)
     warn_threshold = params.get_numeric("warn_threshold", 0.05, float)
@@ -569,6 +623,18 @@ def run(test, params, env):
     select_disk_request = params.get("select_disk_request")
     select_disk_name = params.get("select_disk_name", "")
     select_disk_minimum_size = params.get_numeric("select_disk_minimum_size", 20)
+    host_iops_cache_ttl = params.get_numeric("host_iops_cache_ttl", 0)
+    host_iops_cache = None
+    if host_iops_cache_ttl > 0:
+        host_iops_cache = host_disk_probe.DiskIOPSCache(
+            params.get(
+                "host_iops_cache_file",
+                os.path.join(data_dir.get_data_dir(), "host_disk_iops.json"),
+            ),
+            host_iops_cache_ttl,
+        )
+    host_iops_fast_probe = params.get("host_iops_fast_probe", "no") == "yes"
+    host_iops_probe_window = params.get_numeric("host_iops_probe_window", 5)
     vm = None
 
     locals_var = locals()
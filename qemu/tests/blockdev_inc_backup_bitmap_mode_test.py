@@ -1,4 +1,5 @@
 from provider import backup_utils, block_dirty_bitmap, blockdev_base
+from provider.qemu_img_utils import compare_images_by_chunks
 
 
 class BlockdevIncreamentalBackupBitmapTest(blockdev_base.BlockdevBaseTest):
@@ -105,8 +106,10 @@ class BlockdevIncreamentalBackupBitmapTest(blockdev_base.BlockdevBaseTest):
         overlay_tag = src_params.objects("image_backup_chain")[-1]
         src_img = self.disk_define_by_params(self.params, src_tag)
         dst_img = self.disk_define_by_params(self.params, overlay_tag)
-        result = src_img.compare_to(dst_img)
-        assert result.exit_status == 0, result.stdout
+        result = compare_images_by_chunks(
+            src_img, dst_img, workers=self.params.get_numeric("compare_workers", 4)
+        )
+        assert result["identical"], "Images mismatch at offset %s" % result["offset"]
 
 
 def run(test, params, env):
@@ -2,6 +2,7 @@ from virttest import data_dir, qemu_storage
 
 from provider import backup_utils, job_utils
 from provider.blockdev_mirror_base import BlockdevMirrorBaseTest
+from provider.qemu_img_utils import compare_images_by_chunks
 from provider.storage_benchmark import generate_instance
 
 
@@ -53,11 +54,19 @@ class BlockdevMirrorPauseAndCompareTest(BlockdevMirrorBaseTest):
                     self.params.object_params(tgt_tag), data_dir.get_data_dir(), tgt_tag
                 )
 
-                src_path = src_img_obj.image_filename
-                tgt_path = tgt_img_obj.image_filename
-
-                self.test.log.info("Comparing %s with %s", src_path, tgt_path)
-                src_img_obj.compare_images(src_path, tgt_path, force_share=True)
+                self.test.log.info(
+                    "Comparing %s with %s",
+                    src_img_obj.image_filename,
+                    tgt_img_obj.image_filename,
+                )
+                result = compare_images_by_chunks(
+                    src_img_obj,
+                    tgt_img_obj,
+                    workers=self.params.get_numeric("compare_workers", 4),
+                    force_share=True,
+                )
+                if not result["identical"]:
+                    self.test.fail("Images mismatch at offset %d" % result["offset"])
 
         finally:
             if self.main_vm.is_paused():
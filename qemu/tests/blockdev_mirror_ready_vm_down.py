@@ -1,5 +1,3 @@
-import time
-
 from virttest import utils_misc, utils_qemu
 from virttest.utils_version import VersionInterval
 
@@ -27,23 +25,10 @@ class BlockdevMirrorReadyVMDownTest(BlockdevMirrorNowaitTest):
 
         def _wait_mirror_job_completed(jobid):
             tmo = self.params.get_numeric("job_completed_timeout", 200)
-            for i in range(tmo):
-                events = self.main_vm.monitor.get_events()
-                completed_events = [
-                    e
-                    for e in events
-                    if e.get("event") == job_utils.BLOCK_JOB_COMPLETED_EVENT
-                ]
-                job_events = [
-                    e
-                    for e in completed_events
-                    if e.get("data")
-                    and jobid in (e["data"].get("id"), e["data"].get("device"))
-                ]
-                if job_events:
-                    break
-                time.sleep(1)
-            else:
+            event = job_utils.get_event_by_condition(
+                self.main_vm, job_utils.BLOCK_JOB_COMPLETED_EVENT, tmo, device=jobid
+            )
+            if event is None:
                 self.test.fail("job complete event never received in %s" % tmo)
 
         list(map(_wait_mirror_job_completed, self._jobs))
@@ -53,23 +38,10 @@ class BlockdevMirrorReadyVMDownTest(BlockdevMirrorNowaitTest):
 
         def _wait_mirror_job_cancelled(jobid):
             tmo = self.params.get_numeric("job_cancelled_timeout", 200)
-            for i in range(tmo):
-                events = self.main_vm.monitor.get_events()
-                cancelled_events = [
-                    e
-                    for e in events
-                    if e.get("event") == job_utils.BLOCK_JOB_CANCELLED_EVENT
-                ]
-                job_events = [
-                    e
-                    for e in cancelled_events
-                    if e.get("data")
-                    and jobid in (e["data"].get("id"), e["data"].get("device"))
-                ]
-                if job_events:
-                    break
-                time.sleep(1)
-            else:
+            event = job_utils.get_event_by_condition(
+                self.main_vm, job_utils.BLOCK_JOB_CANCELLED_EVENT, tmo, device=jobid
+            )
+            if event is None:
                 self.test.fail("job cancelled event not received in %s" % tmo)
 
         list(map(_wait_mirror_job_cancelled, self._jobs))
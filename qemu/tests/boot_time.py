@@ -1,6 +1,8 @@
 from virttest import env_process, error_context, utils_misc
 from virttest.staging import utils_memory
 
+from provider.boot_profiler import BootProfiler, parse_markers
+
 
 @error_context.context_aware
 def run(test, params, env):
@@ -9,7 +11,9 @@ def run(test, params, env):
     1) Set init run level to 1
     2) Send a shutdown command to the guest, or issue a system_powerdown
        monitor command (depending on the value of shutdown_method)
-    3) Boot up the guest and measure the boot time
+    3) Boot up the guest and measure the boot time, profile the boot
+       phases by the serial console and QMP events, repeat 2) and 3)
+       boot_iterations times
     4) set init run level back to the old one
 
     :param test: QEMU test object
@@ -27,16 +31,34 @@ def run(test, params, env):
     session.cmd(single_user_cmd)
 
     try:
-        error_context.context("Shut down guest", test.log.info)
-        session.cmd("sync")
-        vm.destroy()
-
-        error_context.context("Boot up guest and measure the boot time", test.log.info)
-        utils_memory.drop_caches()
-        vm.create()
-        vm.verify_alive()
-        session = vm.wait_for_serial_login(timeout=timeout)
-        boot_time = utils_misc.monotonic_time() - vm.start_monotonic_time
+        profiler = BootProfiler(
+            vm,
+            parse_markers(params.get("boot_phase_markers")),
+            params.objects("boot_phase_events") or ("RESET",),
+        )
+        boot_times = []
+        for i in range(int(params.get("boot_iterations", 1))):
+            error_context.context("Shut down guest", test.log.info)
+            session.cmd("sync")
+            vm.destroy()
+
+            error_context.context(
+                "Boot up guest and measure the boot time", test.log.info
+            )
+            utils_memory.drop_caches()
+            profiler.begin("qemu_start")
+            vm.create()
+            profiler.mark("qemu_start", vm.start_monotonic_time)
+            profiler.mark("qemu_ready")
+            vm.verify_alive()
+            session = vm.wait_for_serial_login(timeout=timeout)
+            boot_time = utils_misc.monotonic_time() - vm.start_monotonic_time
+            profiler.mark("login", vm.start_monotonic_time + boot_time)
+            profiler.end()
+            boot_times.append(boot_time)
+            test.log.info("Boot up time #%d: %ss", i, boot_time)
+        profiler.report(test)
+        boot_time = sum(boot_times) / len(boot_times)
         test.write_test_keyval({"result": "%ss" % boot_time})
         expect_time = int(params.get("expect_bootup_time", "17"))
         test.log.info("Boot up time: %ss", boot_time)
@@ -18,6 +18,8 @@ from virttest.staging import utils_memory
 from virttest.staging.utils_cgroup import Cgroup, CgroupModules, get_load_per_cpu
 from virttest.utils_test import VMStress
 
+from provider.cgroup_stats import CgroupCollector
+
 # Serial ID of the attached disk
 RANDOM_DISK_NAME = "RANDOM46464634164145"
 
@@ -244,6 +246,10 @@ def run(test, params, env):
         :param cfg: cgroup_test_time - test duration '60'
         :param cfg: cgroup_weights - list of R/W weights '[100, 1000]'
         :param cfg: cgroup_limit{ ,_read,_write} - allowed R/W threshold '0.1'
+        :param cfg: cgroup_host_stats - measure the speeds by the io stats of
+                    the VM cgroups on host instead of the dd outputs 'no'
+        :param cfg: cgroup_stats_interval - seconds between two samples '1'
+        :param cfg: cgroup_warmup - seconds of the samples to skip '5'
         """
 
         def _test(direction):
@@ -259,7 +265,9 @@ def run(test, params, env):
             dd_cmd = get_dd_cmd(direction, count=3)
             for i in range(no_vms):
                 sessions[i * 2].sendline(dd_cmd)
+            start = time.monotonic()
             time.sleep(test_time)
+            end = time.monotonic()
             for i in range(no_vms):
                 # Force stats in case no dd cmd finished
                 sessions[i * 2 + 1].sendline(stat_cmd)
@@ -275,6 +283,19 @@ def run(test, params, env):
                 )
 
             for i in range(no_vms):
+                if collector:
+                    # bytes per second of the VM cgroup in the steady state
+                    metric = "rbytes" if direction == "read" else "wbytes"
+                    out[i] = int(
+                        collector.rate(vms[i].name, metric, start, end, warmup)
+                    )
+                    if not out[i]:
+                        test.error(
+                            "No %s of %s counted by the cgroup stats on host, "
+                            "check the %s samples in cgroup_stats.csv"
+                            % (direction, vms[i].name, metric)
+                        )
+                    continue
                 # Get all dd loops' statistics
                 # calculate avg from duration and data
                 duration = 0
@@ -361,6 +382,14 @@ def run(test, params, env):
             blkio_weight = params.get("blkio_weight_file")
             blkio.set_property(blkio_weight, weights[i], i)
 
+        collector = None
+        if params.get("cgroup_host_stats", "no") == "yes":
+            collector = CgroupCollector(float(params.get("cgroup_stats_interval", 1)))
+            warmup = float(params.get("cgroup_warmup", 5))
+            for vm in vms:
+                collector.add(vm.name, vm.get_pid())
+            collector.start()
+
         # Fails only when the session is occupied (Timeout)
         # ; true is necessarily when there is no dd present at the time
         kill_cmd = "rm -f /tmp/cgroup_lock; killall -9 dd; true"
@@ -385,6 +414,9 @@ def run(test, params, env):
 
         finally:
             test.log.info("Cleanup")
+            if collector:
+                collector.close()
+                collector.report(test)
             for i in range(no_vms):
                 # stop all workers
                 sessions[i * 2 + 1].sendline(kill_cmd)
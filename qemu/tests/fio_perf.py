@@ -1,10 +1,10 @@
+import collections
 import logging
 import os
 import re
 import threading
 import time
 
-import six
 from avocado.utils import process
 from virttest import (
     data_dir,
@@ -12,31 +12,19 @@ from virttest import (
     utils_disk,
     utils_misc,
     utils_numeric,
-    utils_test,
 )
 
+from provider import cpu_placement, result_store
 from provider.storage_benchmark import generate_instance
 
 LOG_JOB = logging.getLogger("avocado.test")
 
-
-def format_result(result, base="12", fbase="2"):
-    """
-    Format the result to a fixed length string.
-
-    :param result: result need to convert
-    :param base: the length of converted string
-    :param fbase: the decimal digit for float
-    """
-    if isinstance(result, six.string_types):
-        value = "%" + base + "s"
-    elif isinstance(result, int):
-        value = "%" + base + "d"
-    elif isinstance(result, float):
-        value = "%" + base + "." + fbase + "f"
-    else:
-        raise TypeError(f"unexpected result type: {type(result).__name__}")
-    return value % result
+# the version lines in the order of fio_result.RHS
+RHS_VERSION_LINES = (
+    ("qemu_version", "kvm-userspace-ver"),
+    ("host_version", "kvm_version"),
+    ("guest_version", "guest-kernel-ver"),
+)
 
 
 def check_disk_status(session, timeout, num):
@@ -63,7 +51,7 @@ def check_disk_status(session, timeout, num):
 
 def get_version(
     session,
-    result_file,
+    store,
     kvm_ver_chk_cmd,
     guest_ver_cmd,
     type,
@@ -73,10 +61,10 @@ def get_version(
 ):
     """
     collect qemu, kernel, virtiofsd version if needed and driver version info
-    and write them info results file
+    and record them in the result store
 
     :param session: VM session
-    :param results_file: save fio results, host info and other info
+    :param store: ResultStore object to record host info and other info
     :param guest_ver_cmd: command of getting guest kernel or virtio_win driver version
     :param type: guest type
     :param driver_format: driver format
@@ -86,27 +74,23 @@ def get_version(
     kvm_ver = process.system_output(kvm_ver_chk_cmd, shell=True).decode()
     host_ver = os.uname()[2]
 
-    result_file.write("### kvm-userspace-ver : %s\n" % kvm_ver)
-    result_file.write("### kvm_version : %s\n" % host_ver)
-
     if driver_format != "ide":
         result = session.cmd_output(guest_ver_cmd, timeout)
         if type == "windows":
             guest_ver = re.findall(r".*?(\d{2}\.\d{2}\.\d{3}\.\d{4}).*?", result)
-            result_file.write(
-                "### guest-kernel-ver :Microsoft Windows [Version %s]\n" % guest_ver[0]
-            )
+            guest_ver = "Microsoft Windows [Version %s]" % guest_ver[0]
         else:
-            result_file.write("### guest-kernel-ver :%s" % result)
+            guest_ver = result
     else:
-        result_file.write(
-            "### guest-kernel-ver : Microsoft Windows [Version ide driver format]\n"
-        )
+        guest_ver = "Microsoft Windows [Version ide driver format]"
+    store.update_run(
+        qemu_version=kvm_ver, host_version=host_ver, guest_version=guest_ver
+    )
 
     if vfsd_ver_chk_cmd:
         LOG_JOB.info("Check virtiofsd version on host.")
         virtiofsd_ver = process.system_output(vfsd_ver_chk_cmd, shell=True).decode()
-        result_file.write("### virtiofsd_version : %s\n" % virtiofsd_ver)
+        store.add_info("virtiofsd_version", virtiofsd_ver.strip())
 
 
 @error_context.context_aware
@@ -150,17 +134,6 @@ def run(test, params, env):
         elif os_type == "windows":
             session.cmd("del /f/s/q %s" % guest_result_file, timeout)
 
-    def _pin_vm_threads(node):
-        """
-        pin guest vcpu and vhost threads to cpus of a numa node repectively
-
-        :param node: which numa node to pin
-        """
-        if node:
-            if not isinstance(node, utils_misc.NumaNode):
-                node = utils_misc.NumaNode(int(node))
-            utils_test.qemu.pin_vm_threads(vm, node)
-
     # login virtual machine
     vm = env.get_vm(params["main_vm"])
     vm.verify_alive()
@@ -168,7 +141,7 @@ def run(test, params, env):
     session = vm.wait_for_login(timeout=login_timeout)
     process.system_output("numactl --hardware")
     process.system_output("numactl --show")
-    _pin_vm_threads(params.get("numa_node"))
+    cpu_placement.place_vm_threads(test, params, vm)
 
     # get parameter from dictionary
     fio_options = params["fio_options"]
@@ -194,12 +167,12 @@ def run(test, params, env):
     delete_test_file = params.get("delete_test_file", "no")
 
     result_path = utils_misc.get_path(test.resultsdir, "fio_result.RHS")
-    result_file = open(result_path, "w")
+    store = result_store.open_store(test, params, "fio_perf")
 
     # scratch host and windows guest version info
     get_version(
         session,
-        result_file,
+        store,
         kvm_ver_chk_cmd,
         guest_ver_cmd,
         os_type,
@@ -207,6 +180,7 @@ def run(test, params, env):
         vfsd_ver_chk_cmd,
         cmd_timeout,
     )
+    store.open_rhs(result_path, base="12", versions=RHS_VERSION_LINES)
 
     if os_type == "windows":
         # turn off driver verifier
@@ -248,22 +222,12 @@ def run(test, params, env):
     if format == "True":
         session.cmd(pre_cmd, cmd_timeout)
 
-    # get order_list
-    order_line = ""
-    for order in order_list.split():
-        order_line += "%s|" % format_result(order)
-
     # get result tested by each scenario
     for io_pattern in rw.split():
-        result_file.write("Category:%s\n" % io_pattern)
-        result_file.write("%s\n" % order_line.rstrip("|"))
         for bs in block_size.split():
             for io_depth in iodepth.split():
                 for numjobs in threads.split():
-                    line = ""
-                    line += "%s|" % format_result(bs[:-1])
-                    line += "%s|" % format_result(io_depth)
-                    line += "%s|" % format_result(numjobs)
+                    line = [bs[:-1], io_depth, numjobs]
                     file_name = None
                     if format == "True" or params.objects("filesystems"):
                         file_name = io_pattern + "_" + bs + "_" + io_depth
@@ -355,22 +319,18 @@ def run(test, params, env):
                     cpu = 100 - idle - iowait
                     normal = bw / cpu
                     io_exits = io_exits_a - io_exits_b
-                    for result in bw, iops, lat, cpu, normal:
-                        line += "%s|" % format_result(result)
-                    if os_type == "windows":
-                        line += "%s" % format_result(io_exits)
-                    if os_type == "linux":
-                        if not params.objects("filesystems"):
-                            line += "%s|" % format_result(io_exits)
-                            line += "%s" % format_result(util)  # pylint: disable=E0606
-                        else:
-                            line += "%s" % format_result(io_exits)
-                    result_file.write("%s\n" % line)
+                    line.extend([bw, iops, lat, cpu, normal, io_exits])
+                    if os_type == "linux" and not params.objects("filesystems"):
+                        line.append(util)  # pylint: disable=E0606
+                    store.add(
+                        io_pattern,
+                        collections.OrderedDict(zip(order_list.split(), line)),
+                        tags={"block_size": bs, "iodepth": io_depth},
+                    )
 
     # del temporary files in guest os
     clean_tmp_files(session, os_type, guest_result_file, cmd_timeout)
 
-    result_file.close()
     for fs in params.objects("filesystems"):
         fs_params = params.object_params(fs)
         fs_target = fs_params.get("fs_target")
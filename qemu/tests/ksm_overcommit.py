@@ -8,6 +8,8 @@ from avocado.utils import process
 from virttest import data_dir, env_process, utils_misc, utils_test
 from virttest.staging import utils_memory
 
+from provider import ksm_control
+
 
 def run(test, params, env):
     """
@@ -60,28 +62,6 @@ def run(test, params, env):
                                  machine is too slow
     """
 
-    def _start_allocator(vm, session, timeout):
-        """
-        Execute ksm_overcommit_guest.py on guest, wait until it's initialized.
-
-        :param vm: VM object.
-        :param session: Remote session to a VM object.
-        :param timeout: Timeout that will be used to verify if
-                ksm_overcommit_guest.py started properly.
-        """
-        test.log.debug("Starting ksm_overcommit_guest.py on guest %s", vm.name)
-        session.sendline(
-            "$(command -v python python3 | head -1) /tmp/ksm_overcommit_guest.py"
-        )
-        try:
-            session.read_until_last_line_matches(["PASS:", "FAIL:"], timeout)
-        except aexpect.ExpectProcessTerminatedError as details:
-            e_msg = "Command ksm_overcommit_guest.py on vm '%s' failed: %s" % (
-                vm.name,
-                str(details),
-            )
-            test.fail(e_msg)
-
     def _execute_allocator(command, vm, session, timeout):
         """
         Execute a given command on ksm_overcommit_guest.py main loop,
@@ -120,66 +100,97 @@ def run(test, params, env):
 
         :return: memory in MB
         """
-        fpages = open("/sys/kernel/mm/ksm/pages_sharing")
-        ksm_pages = int(fpages.read())
-        fpages.close()
+        ksm_pages = ksm_sampler.read("pages_sharing")
         sharing_mem = ksm_pages * pagesize
         return int(float(utils_misc.normalize_data_size("%sK" % sharing_mem)))
 
+    def wait_shared_mem(vm, target, max_attempts, phase):
+        """
+        Wait until the shared memory reaches the target
+
+        :param vm: VM object, whose shared meminfo is checked without KSM
+                   sysfs
+        :param target: target of shared memory in MB
+        :param max_attempts: max attempts to check
+        :param phase: phase name marked in KSM sampler
+        """
+        shm = 0
+        attempt = 0
+        test.log.debug("Target shared meminfo for guest %s: %s", vm.name, target)
+        while shm < target:
+            if attempt > max_attempts:
+                test.log.debug(utils_test.get_memory_info(lvms))
+                test.error(
+                    "SHM didn't merge the memory until the DL on guest: %s" % vm.name
+                )
+            pause = ksm_size / 200 * perf_ratio
+            test.log.debug("Waiting %ds before proceeding...", pause)
+            time.sleep(pause)
+            if new_ksm:
+                shm = get_ksmstat()
+            else:
+                shm = vm.get_shared_meminfo()
+            test.log.debug(
+                "Shared meminfo for guest %s after iteration %s: %s",
+                vm.name,
+                attempt,
+                shm,
+            )
+            attempt += 1
+        if ksm_sampler:
+            ksm_sampler.sample()
+            # pagesize is in KB
+            target_pages = target * 1024 // pagesize
+            converged = ksm_sampler.convergence_time(
+                phase, "pages_sharing", target_pages
+            )
+            if converged is not None:
+                test.log.info("KSM converged in %.2fs in %s", converged, phase)
+                test.write_test_keyval({"ksm--converge--%s" % phase: converged})
+
     def initialize_guests():
         """
         Initialize guests (fill their memories with specified patterns).
         """
         test.log.info("Phase 1: filling guest memory pages")
-        for session in lsessions:
-            vm = lvms[lsessions.index(session)]
-
-            test.log.debug("Turning off swap on vm %s", vm.name)
-            session.cmd("swapoff -a", timeout=300)
-
-            # Start the allocator
-            _start_allocator(vm, session, 60 * perf_ratio)
-
-        # Execute allocator on guests
-        for i in range(0, vmsc):
-            vm = lvms[i]
-
-            cmd = "mem = MemFill(%d, %s, %s)" % (ksm_size, skeys[i], dkeys[i])
-            _execute_allocator(cmd, vm, lsessions[i], 60 * perf_ratio)
+        group = ksm_control.AllocatorGroup(test, zip(lvms, lsessions))
+        test.log.debug("Turning off swap on all vms")
+        utils_misc.parallel(
+            [(session.cmd, ("swapoff -a",), {"timeout": 300}) for session in lsessions]
+        )
 
-            cmd = "mem.value_fill(%d)" % skeys[0]
-            _execute_allocator(
-                cmd, vm, lsessions[i], fill_base_timeout * 2 * perf_ratio
-            )
+        # Start the allocator
+        group.start(60 * perf_ratio)
+        group.execute(
+            [
+                "mem = MemFill(%d, %s, %s)" % (ksm_size, skeys[i], dkeys[i])
+                for i in range(vmsc)
+            ],
+            60 * perf_ratio,
+        )
 
-            # Let ksm_overcommit_guest.py do its job
-            # (until shared mem reaches expected value)
-            shm = 0
-            j = 0
-            test.log.debug("Target shared meminfo for guest %s: %s", vm.name, ksm_size)
-            while (new_ksm and (shm < (ksm_size * (i + 1)))) or (
-                not new_ksm and (shm < (ksm_size))
-            ):
-                if j > 256:
-                    test.log.debug(utils_test.get_memory_info(lvms))
-                    test.error(
-                        "SHM didn't merge the memory until "
-                        "the DL on guest: %s" % vm.name
-                    )
-                pause = ksm_size / 200 * perf_ratio
-                test.log.debug("Waiting %ds before proceeding...", pause)
-                time.sleep(pause)
-                if new_ksm:
-                    shm = get_ksmstat()
-                else:
-                    shm = vm.get_shared_meminfo()
-                test.log.debug(
-                    "Shared meminfo for guest %s after iteration %s: %s",
-                    vm.name,
-                    j,
-                    shm,
+        cmd = "mem.value_fill(%d)" % skeys[0]
+        if parallel_fill:
+            # Fill all the guests at once, then let KSM merge them
+            if ksm_sampler:
+                ksm_sampler.mark("phase1")
+            group.execute(cmd, fill_base_timeout * 2 * perf_ratio)
+            target = ksm_size * vmsc if new_ksm else ksm_size
+            wait_shared_mem(lvms[-1], target, 256 * vmsc, "phase1")
+        else:
+            # Execute allocator on guests
+            for i in range(0, vmsc):
+                vm = lvms[i]
+                if ksm_sampler:
+                    ksm_sampler.mark("phase1_%s" % vm.name)
+                _execute_allocator(
+                    cmd, vm, lsessions[i], fill_base_timeout * 2 * perf_ratio
                 )
-                j += 1
+
+                # Let ksm_overcommit_guest.py do its job
+                # (until shared mem reaches expected value)
+                target = ksm_size * (i + 1) if new_ksm else ksm_size
+                wait_shared_mem(vm, target, 256, "phase1_%s" % vm.name)
 
         # Keep some reserve
         pause = ksm_size / 200 * perf_ratio
@@ -324,120 +335,85 @@ def run(test, params, env):
 
         session.cmd("swapoff -a", timeout=300)
 
-        for i in range(0, max_alloc):
-            # Start the allocator
-            _start_allocator(vm, lsessions[i], 60 * perf_ratio)
+        # Start the allocators
+        group = ksm_control.AllocatorGroup(test, [(vm, s) for s in lsessions])
+        group.start(60 * perf_ratio)
 
         test.log.info("Phase 1: PASS")
 
+        def log_performance(results):
+            for _, data in results:
+                data = data.splitlines()[-1]
+                test.log.debug(data)
+                out = int(data.split()[4])
+                test.log.debug(
+                    "Performance: %dMB * 1000 / %dms = %dMB/s",
+                    (ksm_size / max_alloc),
+                    out,
+                    (ksm_size * 1000 / out / max_alloc),
+                )
+
         test.log.info("Phase 2a: Simultaneous merging")
         test.log.debug(
             "Memory used by allocator on guests = %dMB", (ksm_size / max_alloc)
         )
 
-        for i in range(0, max_alloc):
-            cmd = "mem = MemFill(%d, %s, %s)" % (
-                (ksm_size / max_alloc),
-                skeys[i],
-                dkeys[i],
-            )
-            _execute_allocator(cmd, vm, lsessions[i], 60 * perf_ratio)
-
-            cmd = "mem.value_fill(%d)" % (skeys[0])
-            _execute_allocator(cmd, vm, lsessions[i], fill_base_timeout * perf_ratio)
+        group.execute(
+            [
+                "mem = MemFill(%d, %s, %s)"
+                % ((ksm_size / max_alloc), skeys[i], dkeys[i])
+                for i in range(max_alloc)
+            ],
+            60 * perf_ratio,
+        )
+        if ksm_sampler:
+            ksm_sampler.mark("phase2a")
+        group.execute("mem.value_fill(%d)" % skeys[0], fill_base_timeout * perf_ratio)
 
         # Wait until ksm_overcommit_guest.py merges pages (3 * ksm_size / 3)
-        shm = 0
-        i = 0
-        test.log.debug("Target shared memory size: %s", ksm_size)
-        while shm < ksm_size:
-            if i > 64:
-                test.log.debug(utils_test.get_memory_info(lvms))
-                test.error("SHM didn't merge the memory until DL")
-            pause = ksm_size / 200 * perf_ratio
-            test.log.debug("Waiting %ds before proceed...", pause)
-            time.sleep(pause)
-            if new_ksm:
-                shm = get_ksmstat()
-            else:
-                shm = vm.get_shared_meminfo()
-            test.log.debug("Shared meminfo after attempt %s: %s", i, shm)
-            i += 1
+        wait_shared_mem(vm, ksm_size, 64, "phase2a")
 
         test.log.debug(utils_test.get_memory_info([vm]))
         test.log.info("Phase 2a: PASS")
 
         test.log.info("Phase 2b: Simultaneous spliting")
         # Actual splitting
-        for i in range(0, max_alloc):
-            cmd = "mem.static_random_fill()"
-            data = _execute_allocator(
-                cmd, vm, lsessions[i], fill_base_timeout * perf_ratio
-            )[1]
-
-            data = data.splitlines()[-1]
-            test.log.debug(data)
-            out = int(data.split()[4])
-            test.log.debug(
-                "Performance: %dMB * 1000 / %dms = %dMB/s",
-                (ksm_size / max_alloc),
-                out,
-                (ksm_size * 1000 / out / max_alloc),
-            )
+        results = group.execute(
+            "mem.static_random_fill()", fill_base_timeout * perf_ratio
+        )
+        log_performance(results)
         test.log.debug(utils_test.get_memory_info([vm]))
         test.log.info("Phase 2b: PASS")
 
         test.log.info("Phase 2c: Simultaneous verification")
-        for i in range(0, max_alloc):
-            cmd = "mem.static_random_verify()"
-            data = _execute_allocator(
-                cmd, vm, lsessions[i], (mem / 200 * 50 * perf_ratio)
-            )[1]
+        group.execute("mem.static_random_verify()", (mem / 200 * 50 * perf_ratio))
         test.log.info("Phase 2c: PASS")
 
         test.log.info("Phase 2d: Simultaneous merging")
         # Actual splitting
-        for i in range(0, max_alloc):
-            cmd = "mem.value_fill(%d)" % skeys[0]
-            data = _execute_allocator(
-                cmd, vm, lsessions[i], fill_base_timeout * 2 * perf_ratio
-            )[1]
+        if ksm_sampler:
+            ksm_sampler.mark("phase2d")
+        group.execute(
+            "mem.value_fill(%d)" % skeys[0], fill_base_timeout * 2 * perf_ratio
+        )
         test.log.debug(utils_test.get_memory_info([vm]))
         test.log.info("Phase 2d: PASS")
 
         test.log.info("Phase 2e: Simultaneous verification")
-        for i in range(0, max_alloc):
-            cmd = "mem.value_check(%d)" % skeys[0]
-            data = _execute_allocator(
-                cmd, vm, lsessions[i], (mem / 200 * 50 * perf_ratio)
-            )[1]
+        group.execute("mem.value_check(%d)" % skeys[0], (mem / 200 * 50 * perf_ratio))
         test.log.info("Phase 2e: PASS")
 
         test.log.info("Phase 2f: Simultaneous spliting last 96B")
-        for i in range(0, max_alloc):
-            cmd = "mem.static_random_fill(96)"
-            data = _execute_allocator(
-                cmd, vm, lsessions[i], fill_base_timeout * perf_ratio
-            )[1]
-
-            data = data.splitlines()[-1]
-            out = int(data.split()[4])
-            test.log.debug(
-                "Performance: %dMB * 1000 / %dms = %dMB/s",
-                ksm_size / max_alloc,
-                out,
-                (ksm_size * 1000 / out / max_alloc),
-            )
+        results = group.execute(
+            "mem.static_random_fill(96)", fill_base_timeout * perf_ratio
+        )
+        log_performance(results)
 
         test.log.debug(utils_test.get_memory_info([vm]))
         test.log.info("Phase 2f: PASS")
 
         test.log.info("Phase 2g: Simultaneous verification last 96B")
-        for i in range(0, max_alloc):
-            cmd = "mem.static_random_verify(96)"
-            _, data = _execute_allocator(
-                cmd, vm, lsessions[i], (mem / 200 * 50 * perf_ratio)
-            )
+        group.execute("mem.static_random_verify(96)", (mem / 200 * 50 * perf_ratio))
         test.log.debug(utils_test.get_memory_info([vm]))
         test.log.info("Phase 2g: PASS")
 
@@ -498,6 +474,14 @@ def run(test, params, env):
     else:
         _guest_reserve = False
 
+    # sample the KSM counters in background
+    ksm_sampler = None
+    if new_ksm:
+        ksm_sampler = ksm_control.KSMSampler(
+            params.get_numeric("ksm_sample_interval", 1.0, float)
+        )
+    parallel_fill = params.get("ksm_parallel_fill", "no") == "yes"
+
     max_vms = int(params.get("max_vms", 2))
     overcommit = float(params.get("ksm_overcommit_ratio", 2.0))
     max_alloc = int(params.get("ksm_parallel_ratio", 1))
@@ -674,13 +658,20 @@ def run(test, params, env):
         vm.copy_files_to(vksmd_src, dst_dir)
     test.log.info("Phase 0: PASS")
 
-    if params["ksm_mode"] == "parallel":
-        test.log.info("Starting KSM test parallel mode")
-        split_parallel()
-        test.log.info("KSM test parallel mode: PASS")
-    elif params["ksm_mode"] == "serial":
-        test.log.info("Starting KSM test serial mode")
-        initialize_guests()
-        separate_first_guest()
-        split_guest()
-        test.log.info("KSM test serial mode: PASS")
+    if ksm_sampler:
+        ksm_sampler.start()
+    try:
+        if params["ksm_mode"] == "parallel":
+            test.log.info("Starting KSM test parallel mode")
+            split_parallel()
+            test.log.info("KSM test parallel mode: PASS")
+        elif params["ksm_mode"] == "serial":
+            test.log.info("Starting KSM test serial mode")
+            initialize_guests()
+            separate_first_guest()
+            split_guest()
+            test.log.info("KSM test serial mode: PASS")
+    finally:
+        if ksm_sampler:
+            ksm_sampler.stop()
+            ksm_sampler.report(test)
@@ -1,47 +1,10 @@
 import os
-import re
 import time
 
-import six
 from virttest import qemu_migration, utils_misc
 
 from provider import cpuflags
-
-
-class Statistic(object):
-    """
-    Class to display and collect average,
-    max and min values of a given data set.
-    """
-
-    def __init__(self):
-        self._sum = 0
-        self._count = 0
-        self._max = None
-        self._min = None
-
-    def get_average(self):
-        if self._count != 0:
-            return self._sum / self._count
-        else:
-            return None
-
-    def get_min(self):
-        return self._min
-
-    def get_max(self):
-        return self._max
-
-    def record(self, value):
-        """
-        Record new value to statistic.
-        """
-        self._count += 1
-        self._sum += value
-        if not self._max or self._max < value:
-            self._max = value
-        if not self._min or self._min > value:
-            self._min = value
+from provider.migration_telemetry import MigrationSampler
 
 
 def run(test, params, env):
@@ -74,51 +37,39 @@ def run(test, params, env):
 
     vm_mem = int(params.get("mem", "512"))
 
-    get_mig_speed = re.compile(r"^transferred ram: (\d+) kbytes$", re.MULTILINE)
-
     mig_speed = params.get("mig_speed", "1G")
     mig_speed_accuracy = float(params.get("mig_speed_accuracy", "0.2"))
+
+    mig_sample_interval = float(params.get("mig_sample_interval", "1"))
+    mig_sample_duration = float(params.get("mig_sample_duration", "30"))
+    mig_sample_events = params.get("mig_sample_events", "no") == "yes"
     clonevm = None
 
     def get_migration_statistic(vm):
-        last_transfer_mem = 0
-        transfered_mem = 0
-        mig_stat = Statistic()
-        while vm.monitor.get_migrate_progress() == 0:
-            pass
-        for _ in range(30):
-            o = vm.monitor.info("migrate")
-            warning_msg = (
-                "Migration already ended. Migration speed is"
-                " probably too high and will block vm while"
-                " filling its memory."
-            )
-            fail_msg = (
-                "Could not determine the transferred memory from monitor data: %s" % o
-            )
-            if isinstance(o, six.string_types):
-                if "status: active" not in o:
-                    test.error(warning_msg)
-                try:
-                    transfered_mem = int(get_mig_speed.search(o).groups()[0])
-                except (IndexError, ValueError):
-                    test.fail(fail_msg)
-            else:
-                if o.get("status") != "active":
-                    test.error(warning_msg)
-                try:
-                    transfered_mem = o.get("ram").get("transferred") / (1024)
-                except (IndexError, ValueError):
-                    test.fail(fail_msg)
-
-            real_mig_speed = (transfered_mem - last_transfer_mem) / 1024
-
-            last_transfer_mem = transfered_mem
-
-            test.log.debug("Migration speed: %s MB/s", real_mig_speed)
-            mig_stat.record(real_mig_speed)
-            time.sleep(1)
-
+        sampler = MigrationSampler(vm, mig_sample_interval, mig_sample_events)
+        warning_msg = (
+            "Migration already ended. Migration speed is"
+            " probably too high and will block vm while"
+            " filling its memory."
+        )
+        if sampler.wait_active(mig_timeout) != "active":
+            test.error(warning_msg)
+        status = sampler.run(mig_sample_duration)
+        sampler.report(test)
+        if status != "active":
+            test.error(warning_msg)
+        speeds = sampler.speed()
+        for speed in speeds:
+            test.log.debug("Migration speed: %s MB/s", speed)
+        mig_stat = speeds.summary()
+        if not mig_stat["count"]:
+            test.fail("Could not determine the transferred memory from monitor data")
+        analysis = sampler.analyze()
+        test.log.info(
+            "Dirty page rate: %.2f MB/s, %.1f%% of migration speed",
+            analysis.get("dirty_bandwidth", 0.0) / 1048576,
+            analysis.get("dirty_ratio", 0.0) * 100,
+        )
         return mig_stat
 
     try:
@@ -147,13 +98,13 @@ def run(test, params, env):
 
         mig_stat = get_migration_statistic(vm)
 
-        real_speed = mig_stat.get_average()
+        real_speed = mig_stat["mean"]
         ack_speed = mig_speed * mig_speed_accuracy
 
         test.log.info("Target migration speed: %d MB/s.", mig_speed)
-        test.log.info("Average migration speed: %d MB/s", mig_stat.get_average())
-        test.log.info("Minimum migration speed: %d MB/s", mig_stat.get_min())
-        test.log.info("Maximum migration speed: %d MB/s", mig_stat.get_max())
+        test.log.info("Average migration speed: %d MB/s", mig_stat["mean"])
+        test.log.info("Minimum migration speed: %d MB/s", mig_stat["min"])
+        test.log.info("Maximum migration speed: %d MB/s", mig_stat["max"])
 
         test.log.info("Maximum tolerable divergence: %3.1f%%", mig_speed_accuracy * 100)
 
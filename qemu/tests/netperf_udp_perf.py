@@ -1,3 +1,4 @@
+import collections
 import logging
 import os
 import threading
@@ -6,7 +7,7 @@ import time
 from avocado.utils import process
 from virttest import error_context, remote, virt_vm
 
-from provider import netperf_base
+from provider import netperf_base, result_store
 
 LOG_JOB = logging.getLogger("avocado.test")
 
@@ -149,8 +150,11 @@ def start_test(
     if params is None:
         params = {}
 
-    fd = open("%s/netperf-udp-perf.result.%s.RHS" % (resultsdir, time.time()), "w")
-    netperf_base.record_env_version(test, params, host, server_ctl, fd, test_duration)
+    rhs_path = "%s/netperf-udp-perf.result.%s.RHS" % (resultsdir, time.time())
+    store = result_store.open_store(test, params, "netperf_udp_perf")
+    netperf_base.record_env_version(
+        test, params, host, server_ctl, store, test_duration
+    )
 
     error_context.context("Start Netserver on guest", LOG_JOB.info)
     netperf_version = params.get("netperf_version", "2.6.0")
@@ -161,6 +165,7 @@ def start_test(
 
     base = params.get("format_base", "18")
     fbase = params.get("format_fbase", "2")
+    store.open_rhs(rhs_path, base=base, fbase=fbase, category=False)
     pid = str(os.getpid())
     fname = "/tmp/netperf.%s.nf" % pid
     numa_enable = params.get("netperf_with_numa", "yes") == "yes"
@@ -238,12 +243,11 @@ def start_test(
                 test.write_test_keyval({"%s--%s" % (prefix, key): ret[key]})
 
             LOG_JOB.info(row)
-            fd.write(row + "\n")
-            fd.flush()
+            store.add(
+                "UDP_STREAM", collections.OrderedDict((k, ret[k]) for k in key_list)
+            )
             LOG_JOB.debug("Remove temporary files")
             process.system_output(
                 "rm -f %s" % fname, verbose=False, ignore_status=True, shell=True
             )
             netperf_base.ssh_cmd(client, "rm -f %s" % fname)
-
-    fd.close()
@@ -5,10 +5,11 @@ import shutil
 import threading
 from queue import Queue
 
-import six
 from avocado.utils import download, process
 from virttest import data_dir, utils_misc, utils_test
 
+from provider import result_store
+
 
 def cmd_runner_monitor(test, vm, monitor_cmd, test_cmd, guest_path, timeout=300):
     """
@@ -252,15 +253,7 @@ def format_result(result, base="20", fbase="2"):
     :param base: the length of converted string
     :param fbase: the decimal digit for float
     """
-    if isinstance(result, six.string_types):
-        value = "%" + base + "s"
-    elif isinstance(result, int):
-        value = "%" + base + "d"
-    elif isinstance(result, float):
-        value = "%" + base + "." + fbase + "f"
-    else:
-        raise TypeError(f"unexpected result type: {type(result).__name__}")
-    return value % result
+    return result_store.format_result(result, base, fbase)
 
 
 def get_sum_result(sum_matrix, value, tag):
@@ -9,7 +9,6 @@ import time
 
 import aexpect
 from aexpect.exceptions import ShellTimeoutError
-from avocado.core import exceptions
 from avocado.utils import genio, process
 from avocado.utils import path as avo_path
 from virttest import (
@@ -27,6 +26,8 @@ from virttest import (
 from virttest.utils_version import VersionInterval
 from virttest.utils_windows import virtio_win
 
+from provider.qga_bench import get_missing_internals, run_benchmark
+from provider.qga_profiler import CommandLoad, QGAProfiler, get_resource_cmd
 from provider.win_driver_installer_test import (
     run_installer_with_interaction,
     uninstall_gagent,
@@ -1143,70 +1144,127 @@ class QemuGuestAgentBasicCheck(QemuGuestAgentTest):
         else:
             test.fail("The guest time sync failed.")
 
-    @error_context.context_aware
-    def _get_mem_used(self, session, cmd):
+    def _profile_qga_resources(self, test, params, commands, count=None):
         """
-        get memory usage of the process
+        Sample the qemu-ga resources while sending guest agent commands,
+        and check the resources don't grow with the commands executed
 
-        :param session: use for sending cmd
-        :param cmd: get details of the process
-        """
+        Params used:
+        - qga_resource_cmd: command printing the handles, memory bytes and
+                            threads of qemu-ga
+        - qga_sample_interval: seconds between two samples
+        - qga_cmd_rate: rounds of commands per second, 0 for no limit
+        - qga_profile_duration: seconds to sample, until count is done if
+                                not set
+        - qga_profile_warmup: seconds of the samples to skip
+        - qga_leak_<resource>_slope: allowed growth of handles, memory
+                                     bytes, threads per command
 
-        output = session.cmd_output(cmd)
-        LOG_JOB.info("The process details: %s", output)
-        try:
-            memory_usage = int(output.split(" ")[-2].replace(",", ""))
-            return memory_usage
-        except Exception:
-            raise exceptions.TestError(
-                "Get invalid memory usage by cmd '%s' (%s)" % (cmd, output)
+        :param test: kvm test object
+        :param params: Dictionary with the test parameters
+        :param commands: functions sending a command each
+        :param count: rounds of commands, no limit if None
+        """
+        session = self._get_session(params, None)
+        self._open_session_list.append(session)
+        cmd = params.get("qga_resource_cmd") or get_resource_cmd(params["os_type"])
+        profiler = QGAProfiler(
+            session, cmd, float(params.get("qga_sample_interval", 5))
+        )
+        load = CommandLoad(commands, float(params.get("qga_cmd_rate", 0)), count)
+        duration = params.get("qga_profile_duration")
+        profiler.run(load, float(duration) if duration else None)
+        self.vm.verify_alive()
+        profiler.report(test)
+        if load.errors:
+            test.fail(
+                "%d of %d guest agent commands failed, last error: %s"
+                % (load.errors, load.executed, load.exception)
             )
+        warmup = float(params.get("qga_profile_warmup", 0))
+        leaks = []
+        for name, default in (("memory", "1"), ("handles", "0.001"), ("threads", "0")):
+            max_slope = float(params.get("qga_leak_%s_slope" % name, default))
+            verdict = profiler.verdict(name, max_slope, warmup)
+            if verdict["samples"] < 3:
+                test.fail(
+                    "Only %d valid samples of qemu-ga %s after the warmup, "
+                    "can't check the leak" % (verdict["samples"], name)
+                )
+            if verdict["leak"]:
+                leaks.append(
+                    "%s grows %.4f per command (lower bound %.4f > %s)"
+                    % (name, verdict["slope"], verdict["low"], max_slope)
+                )
+        if leaks:
+            test.fail("QGA commands caused resource leak: %s" % "; ".join(leaks))
 
     @error_context.context_aware
     def gagent_check_memory_leak(self, test, params, env):
         """
-        repeat execute "guest-info" command to guest agent, check memory
-        usage of the qemu-ga
+        repeat execute "guest-info" command to guest agent, check the
+        memory, handles and threads of the qemu-ga don't grow with the
+        commands executed
 
         :param test: kvm test object
         :param params: Dictionary with the test parameters
         :param env: Dictionary with the test environment
         """
 
-        timeout = float(params.get("login_timeout", 240))
         test_command = params.get("test_command", "guest-info")
-        memory_usage_cmd = params.get(
-            "memory_usage_cmd", "tasklist | findstr /I qemu-ga.exe"
-        )
-        session = self.vm.wait_for_login(timeout=timeout)
+        repeats = int(params.get("repeats", 1))
         error_context.context(
-            "get the memory usage of qemu-ga before run '%s'" % test_command,
+            "profile the resources of qemu-ga while executing '%s' %s times"
+            % (test_command, repeats),
             LOG_JOB.info,
         )
-        memory_usage_before = self._get_mem_used(session, memory_usage_cmd)
-        session.close()
-        repeats = int(params.get("repeats", 1))
-        for i in range(repeats):
-            error_context.context(
-                "execute '%s' %s times" % (test_command, i + 1), LOG_JOB.info
+        self._profile_qga_resources(test, params, [self.gagent.guest_info], repeats)
+
+    @error_context.context_aware
+    def gagent_check_pipeline_bench(self, test, params, env):
+        """
+        Benchmark the guest agent by pipelined commands, measure the
+        latencies and commands per second of each command with several
+        numbers of commands in flight
+
+        :param test: kvm test object
+        :param params: Dictionary with the test parameters
+        :param env: Dictionary with the test environment
+        """
+        commands = params.objects("qga_bench_cmds")
+        count = int(params.get("qga_bench_count", 1000))
+        windows = [int(w) for w in params.objects("qga_bench_windows")] or [1]
+        timeout = float(params.get("qga_bench_timeout", 30))
+        missing = get_missing_internals(self.gagent)
+        if missing:
+            test.cancel(
+                "The guest agent object has no %s, the pipelined commands "
+                "are not supported by this avocado-vt" % ", ".join(missing)
             )
-            return_msg = self.gagent.guest_info()
-            LOG_JOB.info(str(return_msg))
-        self.vm.verify_alive()
         error_context.context(
-            "get the memory usage of qemu-ga after run '%s'" % test_command,
+            "benchmark %s by %s commands in flight" % (commands, windows),
             LOG_JOB.info,
         )
-        session = self.vm.wait_for_login(timeout=timeout)
-        memory_usage_after = self._get_mem_used(session, memory_usage_cmd)
-        session.close()
-        # less than 500K is acceptable.
-        if memory_usage_after - memory_usage_before > 500:
-            test.fail(
-                "The memory usages are different, "
-                "before run command is %skb and "
-                "after run command is %skb" % (memory_usage_before, memory_usage_after)
-            )
+        results = run_benchmark(self.gagent, commands, count, windows, timeout)
+        self.vm.verify_alive()
+        keyvals = dict()
+        for result in results:
+            prefix = "qga_bench--%s--w%d--" % (result["cmd"], result["window"])
+            keyvals[prefix + "rate"] = "%.2f" % result["rate"]
+            keyvals[prefix + "errors"] = result["errors"]
+            for key in ("median", "p95", "p99", "max"):
+                if key in result:
+                    keyvals[prefix + key] = "%.3f" % result[key]
+        test.write_test_keyval(keyvals)
+        benched = set((result["cmd"], result["window"]) for result in results)
+        failed = [
+            "%s at window %d" % (cmd, window)
+            for cmd in commands
+            for window in windows
+            if (cmd, window) not in benched
+        ]
+        if failed:
+            test.fail("Failed to benchmark guest agent commands: %s" % failed)
 
     @error_context.context_aware
     def gagent_check_fstrim(self, test, params, env):
@@ -5030,107 +5088,17 @@ class QemuGuestAgentBasicCheckWin(QemuGuestAgentBasicCheck):
         :param env: Dictionary with the test environment.
         """
 
-        def execute_qga_cmds_loop():
-            for i in range(repeats):
-                if os.environ["AVCADO_TP_QEMU_GUEST_AGENT_SIGNAL"] == "True":
-                    LOG_JOB.info("execute 'get-osinfo/devices' %s times", (i + 1))
-                    self.gagent.get_osinfo()
-                    self.gagent.get_virtio_device()
-                else:
-                    return
-
-        def process_resource():
-            """
-            Check the handles&memory of process qemu-ga.
-
-            :return qga_handles: the handles of qga.service
-            :return qga_memory: the memory of qga.service
-            """
-
-            get_resour = self.params["cmd_get_qga_resource"]
-            qga_resources = session.cmd_output(get_resour).strip().split(" ")
-            qga_handles = qga_resources[0]
-            qga_memory = int(qga_resources[-2]) / 1024
-            return (int(qga_handles), int(qga_memory))
-
-        def _is_increase(_list, n, ignore_stable_end=True):
-            if n == 0:
-                return True
-            if ignore_stable_end and n != len(_list) - 1 and _list[n] == _list[n - 1]:
-                return _is_increase(_list, n - 1)
-            return _list[n] > _list[n - 1] and _is_increase(_list, n - 1)
-
-        def get_index(_list):
-            return (len(_list) - 1) if len(_list) >= 2 else 0
-
-        def seperate_list(sum_list):
-            new_l = []
-            peak_l = []
-            trough_l = []
-            for x in range(len(sum_list) - 1):
-                if sum_list[x] != sum_list[x + 1]:
-                    new_l.append(sum_list[x])
-            new_l.append(sum_list[-1])
-            for i in range(1, len(new_l) - 1):
-                if new_l[i] > new_l[i - 1] and new_l[i] >= new_l[i + 1]:
-                    peak_l.append(new_l[i])
-                if new_l[i] < new_l[i - 1] and new_l[i] <= new_l[i + 1]:
-                    trough_l.append(new_l[i])
-            return peak_l, trough_l
-
-        def check_leak(check_list, check_type="memory"):
-            peak_l, trough_l = seperate_list(check_list)
-            idx_p, idx_t = (get_index(peak_l), get_index(trough_l))
-            idx_cl = get_index(check_list)
-            if _is_increase(peak_l, idx_p) or _is_increase(trough_l, idx_t):
-                if _is_increase(check_list, idx_cl, ignore_stable_end=False):
-                    test.fail(
-                        "QGA commands caused resource leak "
-                        "anyway. %s is %s" % (check_type, check_list[-1])
-                    )
-
-        def _base_on_bg_check_resource_leak():
-            """
-            Check whether there is resource leak situation base on background
-            that some operations are running.
-            """
-
-            if bg.is_alive():
-                qga_handles, qga_memory = process_resource()
-                if qga_memory > qga_mem_threshold:
-                    memory_list = []
-                    handle_list = []
-                    start_t = time.time()
-                    while int(time.time() - start_t) < check_timeout:
-                        handle_latest, memory_latest = process_resource()
-                        memory_list.append(memory_latest)
-                        handle_list.append(handle_latest)
-                        time.sleep(5)
-                    check_leak(memory_list)
-                    if qga_handles > qga_handle_threshold:
-                        check_leak(handle_list, "handle")
-                return False
-            return True
-
-        session = self._get_session(params, None)
-        self._open_session_list.append(session)
-
         error_context.context(
             "Check whether resources leak during executing"
             " get-osinfo/devices in a loop.",
             LOG_JOB.info,
         )
-        repeats = int(params.get("repeat_times", 1))
-        qga_mem_threshold = int(params.get("qga_mem_threshold", 1))
-        qga_handle_threshold = int(params.get("qga_handle_threshold", 1))
-        check_timeout = int(params.get("check_timeout", 1))
-
-        os.environ["AVCADO_TP_QEMU_GUEST_AGENT_SIGNAL"] = "True"
-        bg = utils_misc.InterruptedThread(execute_qga_cmds_loop)
-        bg.start()
-        utils_misc.wait_for(lambda: _base_on_bg_check_resource_leak(), 600)
-        os.environ["AVCADO_TP_QEMU_GUEST_AGENT_SIGNAL"] = "False"
-        bg.join()
+        self._profile_qga_resources(
+            test,
+            params,
+            [self.gagent.get_osinfo, self.gagent.get_virtio_device],
+            int(params.get("repeat_times", 1)),
+        )
 
     @error_context.context_aware
     def gagent_check_run_qga_as_program(self, test, params, env):
@@ -1,6 +1,8 @@
 from virttest import env_process, error_context, utils_misc
 from virttest.staging import utils_memory
 
+from provider.boot_profiler import BootProfiler, parse_markers
+
 
 @error_context.context_aware
 def run(test, params, env):
@@ -10,7 +12,9 @@ def run(test, params, env):
     2) Restart guest
     3) Wait for the console
     4) Send a 'reboot' command to the guest
-    5) Boot up the guest and measure the boot time
+    5) Boot up the guest and measure the boot time, profile the boot
+       phases by the serial console and QMP events, repeat 4) and 5)
+       boot_iterations times
     6) Restore guest run level
 
     :param test: QEMU test object
@@ -37,16 +41,31 @@ def run(test, params, env):
         vm.verify_alive()
         session = vm.wait_for_serial_login(timeout=timeout)
 
-        error_context.context("Send a 'reboot' command to the guest", test.log.info)
-        utils_memory.drop_caches()
-        session.cmd("reboot & exit", timeout=1, ignore_all_errors=True)
-        before_reboot_stamp = utils_misc.monotonic_time()
-
-        error_context.context(
-            "Boot up the guest and measure the boot time", test.log.info
+        profiler = BootProfiler(
+            vm,
+            parse_markers(params.get("boot_phase_markers")),
+            params.objects("boot_phase_events") or ("RESET",),
         )
-        session = vm.wait_for_serial_login(timeout=timeout)
-        reboot_time = utils_misc.monotonic_time() - before_reboot_stamp
+        reboot_times = []
+        for i in range(int(params.get("boot_iterations", 1))):
+            error_context.context("Send a 'reboot' command to the guest", test.log.info)
+            utils_memory.drop_caches()
+            profiler.begin("reboot")
+            session.cmd("reboot & exit", timeout=1, ignore_all_errors=True)
+            before_reboot_stamp = utils_misc.monotonic_time()
+            profiler.mark("reboot", before_reboot_stamp)
+
+            error_context.context(
+                "Boot up the guest and measure the boot time", test.log.info
+            )
+            session = vm.wait_for_serial_login(timeout=timeout)
+            reboot_time = utils_misc.monotonic_time() - before_reboot_stamp
+            profiler.mark("login", before_reboot_stamp + reboot_time)
+            profiler.end()
+            reboot_times.append(reboot_time)
+            test.log.info("Reboot time #%d: %ss", i, reboot_time)
+        profiler.report(test, "reboot")
+        reboot_time = sum(reboot_times) / len(reboot_times)
         test.write_test_keyval({"result": "%ss" % reboot_time})
         expect_time = int(params.get("expect_reboot_time", "30"))
         test.log.info("Reboot time: %ss", reboot_time)
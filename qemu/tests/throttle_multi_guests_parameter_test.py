@@ -63,7 +63,11 @@ def run(test, params, env):
             tester.set_fio(fio)
             testers.append(tester)
         error_context.context("Start groups testing:%s" % groups, test.log.info)
-        groups_tester = ThrottleGroupsTester(testers)
+        groups_tester = ThrottleGroupsTester(
+            testers,
+            synchronized=params.get("throttle_sync_start") == "yes",
+            status_interval=params.get_numeric("throttle_status_interval", 0),
+        )
         groups_tester.start()
 
     def fio_on_vms():
@@ -147,7 +147,11 @@ def run(test, params, env):
         testers.append(tester)
 
     error_context.context("Start groups testing:%s" % groups, test.log.info)
-    groups_tester = ThrottleGroupsTester(testers)
+    groups_tester = ThrottleGroupsTester(
+        testers,
+        synchronized=params.get("throttle_sync_start") == "yes",
+        status_interval=params.get_numeric("throttle_status_interval", 0),
+    )
 
     repeat_test = params.get_numeric("repeat_test", 1)
     for repeat in range(repeat_test):
@@ -49,6 +49,10 @@ def run(test, params, env):
         testers.append(tester)
 
     error_context.context("Start groups testing:%s" % groups, test.log.info)
-    groups_tester = ThrottleGroupsTester(testers)
+    groups_tester = ThrottleGroupsTester(
+        testers,
+        synchronized=params.get("throttle_sync_start") == "yes",
+        status_interval=params.get_numeric("throttle_status_interval", 0),
+    )
 
     groups_tester.start()
@@ -4,7 +4,6 @@ Collection of virtio_console and virtio_serialport tests.
 :copyright: 2010-2012 Red Hat Inc.
 """
 
-import array
 import logging
 import os
 import random
@@ -28,6 +27,8 @@ from virttest.qemu_devices import qcontainer, qdevices
 from virttest.utils_test.qemu import migration
 from virttest.utils_virtio_port import VirtioPortTest
 
+from provider import virtio_port_perf
+
 LOG_JOB = logging.getLogger("avocado.test")
 
 
@@ -1156,19 +1157,16 @@ def run(test, params, env):
         if err:
             test.fail("%s failed" % err[:-2])
 
-    def _process_stats(stats, scale=1.0):
+    def _process_stats(sampler, scale=1.0):
         """
         Process the stats to human readable form.
-        :param stats: List of measured data.
+        :param sampler: RateSampler of the transfer.
+        :param scale: Unit of the rates in bytes.
         """
-        if not stats:
+        rates = sampler.rates(scale)
+        if not len(rates):
             return None
-        for i in range((len(stats) - 1), 0, -1):
-            stats[i] = stats[i] - stats[i - 1]
-            stats[i] /= scale
-        stats[0] /= scale
-        stats = sorted(stats)
-        return stats
+        return rates.summary()
 
     @error_context.context_aware
     def test_perf():
@@ -1220,32 +1218,27 @@ def run(test, params, env):
 
             port.open()
 
-            data = b""
-            for _ in range(buf_len):
-                data += b"%c" % random.randrange(255)
+            data = virtio_port_perf.make_payload(buf_len)
 
             funcatexit.register(env, params.get("type"), __set_exit_event)
 
             time_slice = float(duration) / 100
+            scale = 1048576
 
             # HOST -> GUEST
             guest_worker.cmd(
                 'virt.loopback(["%s"], [], %d, virt.LOOP_NONE)' % (port.name, buf_len),
                 10,
             )
-            thread = qemu_virtio_port.ThSend(port.sock, data, EXIT_EVENT)
-            stats = array.array("f", [])
+            thread = virtio_port_perf.ThBulkSend(port.sock, data, EXIT_EVENT)
+            sampler = virtio_port_perf.RateSampler(thread)
             loads = utils.SystemLoad(
                 [(os.getpid(), "autotest"), (vm.get_pid(), "VM"), 0]
             )
             try:
                 loads.start()
-                _time = time.time()
                 thread.start()
-                for _ in range(100):
-                    stats.append(thread.idx)
-                    time.sleep(time_slice)
-                _time = time.time() - _time - duration
+                _time = sampler.run(duration)
                 test.log.info(loads.get_cpu_status_string()[:-1])
                 test.log.info(loads.get_mem_status_string()[:-1])
                 EXIT_EVENT.set()
@@ -1278,32 +1271,29 @@ def run(test, params, env):
                     )
                 else:
                     test.log.debug("Test ran %fs longer", _time)
-                stats = _process_stats(stats[1:], time_slice * 1048576)
+                stats = _process_stats(sampler, scale)
                 test.log.debug("Stats = %s", stats)
                 test.log.info(
-                    "Host -> Guest [MB/s] (min/med/max) = %.3f/%.3f/%.3f",
-                    stats[0],
-                    stats[len(stats) / 2],
-                    stats[-1],
+                    "Host -> Guest [MB/s] (min/med/max/mean) = %.3f/%.3f/%.3f/%.3f",
+                    stats["min"],
+                    stats["median"],
+                    stats["max"],
+                    sampler.throughput / scale,
                 )
 
                 del thread
 
                 # GUEST -> HOST
                 EXIT_EVENT.clear()
-                stats = array.array("f", [])
                 guest_worker.cmd(
                     "virt.send_loop_init('%s', %d)" % (port.name, buf_len), 30
                 )
-                thread = qemu_virtio_port.ThRecv(port.sock, EXIT_EVENT, buf_len)
+                thread = virtio_port_perf.ThBulkRecv(port.sock, EXIT_EVENT, buf_len)
+                sampler = virtio_port_perf.RateSampler(thread)
                 thread.start()
                 loads.start()
                 guest_worker.cmd("virt.send_loop()", 10)
-                _time = time.time()
-                for _ in range(100):
-                    stats.append(thread.idx)
-                    time.sleep(time_slice)
-                _time = time.time() - _time - duration
+                _time = sampler.run(duration)
                 test.log.info(loads.get_cpu_status_string()[:-1])
                 test.log.info(loads.get_mem_status_string()[:-1])
                 guest_worker.cmd("virt.exit_threads()", 10)
@@ -1325,13 +1315,14 @@ def run(test, params, env):
                     )
                 else:
                     test.log.debug("Test ran %fs longer", _time)
-                stats = _process_stats(stats[1:], time_slice * 1048576)
+                stats = _process_stats(sampler, scale)
                 test.log.debug("Stats = %s", stats)
                 test.log.info(
-                    "Guest -> Host [MB/s] (min/med/max) = %.3f/%.3f/%.3f",
-                    stats[0],
-                    stats[len(stats) / 2],
-                    stats[-1],
+                    "Guest -> Host [MB/s] (min/med/max/mean) = %.3f/%.3f/%.3f/%.3f",
+                    stats["min"],
+                    stats["median"],
+                    stats["max"],
+                    sampler.throughput / scale,
                 )
             except Exception as inst:
                 test.log.error(
@@ -496,6 +496,11 @@ def run(test, params, env):
                         if log_dir_s != 0:
                             test.fail("Virtiofs log is not created.")
 
+                if fs_params.get("fs_workload", "no") == "yes":
+                    virtio_fs_utils.workload_test(
+                        test, fs_params, session, fs_source, fs_dest
+                    )
+
                 if folder_test == "yes":
                     error_context.context(
                         "Folder test under %s inside guest." % fs_dest, test.log.info